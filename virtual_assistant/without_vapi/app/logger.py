@@ -1,12 +1,137 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Dict, Optional
 
 from app.settings import settings
 
+# Call identifiers attached to every record logged while handling that call
+log_context: ContextVar[Dict[str, str]] = ContextVar("log_context", default={})
+
+
+def bind_log_context(**fields: str) -> None:
+    """Attach `fields` (e.g. call_sid, stream_sid) to records logged by this task and its children"""
+    log_context.set({**log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Copies the call context onto the record while still on the logging thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = log_context.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Thins out high-frequency DEBUG and INFO records per module.
+
+    `sample_rates` keeps that fraction of a module's records; `rate_limits` caps a
+    module at that many records per second. Warnings and errors always pass.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, int]) -> None:
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.rate_limits = rate_limits
+        self._counters: Dict[str, float] = {}
+        self._windows: Dict[str, list] = {}
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        module = record.module
+
+        rate = self.sample_rates.get(module)
+        if rate is not None:
+            # Deterministic sampling: keep every 1/rate-th record
+            self._counters[module] = self._counters.get(module, 0.0) + rate
+            if self._counters[module] < 1:
+                self.sampled_out += 1
+                return False
+            self._counters[module] -= 1
+
+        limit = self.rate_limits.get(module)
+        if limit is not None:
+            second = int(time.monotonic())
+            window = self._windows.setdefault(module, [second, 0])
+            if window[0] != second:
+                window[0], window[1] = second, 0
+            window[1] += 1
+            if window[1] > limit:
+                self.sampled_out += 1
+                return False
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without ever blocking the caller.
+
+    Formatting happens on the listener thread. When the bounded queue is full the
+    record is dropped and counted instead of waiting for the writer to catch up.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks must be rendered before the frames they reference move on
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the call context as top-level fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            message += " [" + " ".join(f"{key}={value}" for key, value in context.items()) + "]"
+        return message
+
+
+_queue_handler: Optional[DroppingQueueHandler] = None
+_sampling_filter: Optional[SamplingFilter] = None
+_listener: Optional[QueueListener] = None
+
 
 # Function to set up the logger
 def setup_logger(log_dir: str, log_level: str, retention_days: int):
+    global _queue_handler, _sampling_filter, _listener
+
     # Create log directory if it does not exist
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
@@ -16,12 +141,14 @@ def setup_logger(log_dir: str, log_level: str, retention_days: int):
     logger.setLevel(logging._nameToLevel[log_level])
 
     # Formatter for the logs
-    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = TextFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
     # Console handler for streaming logs to the console
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
     # File handler with log rotation based on time (days)
     log_file = os.path.join(log_dir, "app.log")
@@ -29,11 +156,29 @@ def setup_logger(log_dir: str, log_level: str, retention_days: int):
         log_file, when="D", interval=1, backupCount=retention_days
     )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
+    # Both handlers write from a background thread fed by a bounded queue
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    _sampling_filter = SamplingFilter(settings.LOG_SAMPLE_RATES, settings.LOG_RATE_LIMITS)
+    _queue_handler.addFilter(_sampling_filter)
+    _queue_handler.addFilter(ContextFilter())
+    logger.addHandler(_queue_handler)
+
+    _listener = QueueListener(_queue_handler.queue, console_handler, file_handler)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_listener.stop)
     return logger
 
 
+def logging_stats() -> Dict[str, int]:
+    return {
+        "queued": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "sampled_out": _sampling_filter.sampled_out if _sampling_filter else 0,
+    }
+
+
 # Setup logger with log directory and retention days
 logger = setup_logger(
     log_dir="./logs",
@@ -1,27 +1,117 @@
+import asyncio
 import base64
+import gc
+import secrets
+from contextlib import asynccontextmanager
 from typing import Annotated, Optional
 
-from app.logger import logger
-from app.schema.twilio import MediaFormatSchema, StartEventSchema, TwilioEventSchema
-from app.services.conversation import ConversationManager
-from app.services.supabase import fetch_bot_details
-from app.services.twilio import TwilioCallManager
-from fastapi import Depends, FastAPI, Response
+from app.logger import bind_log_context, logger, logging_stats
+from app.schema.twilio import TwilioEventSchema, parse_media_payload
+from app.services.answer_cache import answer_cache
+from app.services.audio import inbound_audio_totals
+from app.services.audio_cache import audio_cache
+from app.services.call_registry import CallState, call_registry
+from app.services.conversation import (
+    DEFAULT_END_CALL_MESSAGE,
+    DEFAULT_GREETING,
+    OUT_OF_SERVICE_MESSAGE,
+    ConversationManager,
+    conversation_stats,
+    live_conversations,
+)
+from app.services.deepgram import TextToSpeech
+from app.services.llm import llm_turn_totals
+from app.services.memory import shared_ids
+from app.services.openai import RUN_ERROR_MESSAGE, TOOL_CALL_FILLER_MESSAGE
+from app.services.pool import provider_pool
+from app.services.retrieval import knowledge_base
+from app.services.speculation import speculation_totals
+from app.services.supabase import (
+    bot_details_cache,
+    fetch_active_bots_async,
+    get_bot_details,
+    invalidate_bot_details,
+)
+from app.services.tasks import call_task_totals
+from app.services.tokens import load_tokenizer
+from app.services.tracing import gauge_lines, tracer
+from app.services.twilio import TwilioCallManager, twilio_control
+from app.services.watchdog import watchdog
+from app.settings import settings
+from fastapi import Depends, FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.websockets import WebSocket, WebSocketDisconnect, WebSocketState
 
-app = FastAPI()
 
-connections: dict[str, StartEventSchema] = {}
+async def warm_caches() -> None:
+    """Load the tokenizer and pre-render canned phrases and bots' greetings into the audio cache"""
+    await asyncio.to_thread(load_tokenizer)
+    phrases = {
+        DEFAULT_GREETING,
+        DEFAULT_END_CALL_MESSAGE,
+        OUT_OF_SERVICE_MESSAGE,
+        TOOL_CALL_FILLER_MESSAGE,
+        RUN_ERROR_MESSAGE,
+    }
+    try:
+        for bot in await fetch_active_bots_async():
+            bot_id = str(bot.pop("bot_id"))
+            bot_details_cache.set(bot_id, bot)
+            if settings.RETRIEVAL_ENABLED:
+                knowledge_base.sync(bot_id)
+            if bot.get("greeting"):
+                phrases.add(bot["greeting"])
+    except Exception as e:
+        logger.error(f"Failed to fetch active bots for cache warm-up: {e}")
+
+    tts = TextToSpeech(http_client=provider_pool.tts_http_client)
+    for phrase in phrases:
+        await tts.prerender(phrase)
+    logger.info(f"Warmed audio cache with {len(phrases)} phrases")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watchdog.start()
+    await provider_pool.start()
+    await call_registry.start()
+    warm_up_task = asyncio.create_task(warm_caches())
+    yield
+    warm_up_task.cancel()
+    await call_registry.close()
+    await watchdog.close()
+    twilio_control.close()
+    await provider_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+admin_bearer = HTTPBearer(auto_error=False)
+
+
+def require_admin(
+    credentials: Annotated[Optional[HTTPAuthorizationCredentials], Depends(admin_bearer)],
+) -> None:
+    """Admin endpoints take ADMIN_TOKEN as a bearer token, and are disabled while it is unset"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if credentials is None or not secrets.compare_digest(
+        credentials.credentials.encode(), settings.ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"}
+        )
 
 
 @app.websocket("/ws/{bot_id}/audio/stream")
 async def websocket_endpoint(websocket: WebSocket, bot_id: str):
-    # Fetch bot details from Supabase on connection initialization
-    bot_data = fetch_bot_details(bot_id)
+    # Fetch bot details from the cache (or Supabase on a miss) on connection initialization
+    bot_data = await get_bot_details(bot_id)
     if not bot_data:
         return None
     await websocket.accept()
     conversation_manager: Optional[ConversationManager] = None
+    call_sid: Optional[str] = None
     try:
         while True:
             # Receive data from WebSocket (user's words from Twilio)
@@ -30,6 +120,11 @@ async def websocket_endpoint(websocket: WebSocket, bot_id: str):
             if packet is None:
                 continue
 
+            # Fast path for media frames; every other event is fully validated
+            if conversation_manager and (chunk := parse_media_payload(packet)) is not None:
+                await conversation_manager.receive_audio(chunk)
+                continue
+
             validated_packet = TwilioEventSchema.model_validate_json(packet)
 
             match validated_packet.event:
@@ -45,34 +140,33 @@ async def websocket_endpoint(websocket: WebSocket, bot_id: str):
                     )
                     if validated_packet.start:
                         call_sid = validated_packet.start.call_sid
-                        connections[call_sid] = StartEventSchema(
-                            streamSid=validated_packet.start.stream_sid,
-                            accountSid=validated_packet.start.account_sid,
-                            callSid=validated_packet.start.call_sid,
-                            tracks=validated_packet.start.tracks,
-                            mediaFormat=MediaFormatSchema(
-                                encoding=validated_packet.start.media_format.encoding,
-                                channels=validated_packet.start.media_format.channels,
-                                sampleRate=validated_packet.start.media_format.sample_rate,
-                            ),
+                        bind_log_context(
+                            call_sid=call_sid,
+                            stream_sid=validated_packet.start.stream_sid,
+                            bot_id=bot_id,
+                        )
+                        await call_registry.register(
+                            call_sid, validated_packet.start.stream_sid, bot_id
                         )
                         logger.info(
                             "STARTED MEDIA STREAM - " f"STREAM ID: {validated_packet.stream_sid}"
                         )
                         if not await conversation_manager._is_bot_available():
-                            await conversation_manager._end_call(
-                                "This bot is out of service for now."
-                            )
-                        await conversation_manager.start()
+                            conversation_manager.hang_up(OUT_OF_SERVICE_MESSAGE)
+                        else:
+                            await conversation_manager.start()
+                            await call_registry.set_state(call_sid, CallState.ACTIVE)
                 case "media":
                     if validated_packet.media and conversation_manager:
                         chunk = base64.b64decode(validated_packet.media.payload)
                         await conversation_manager.receive_audio(chunk)
+                case "mark":
+                    if validated_packet.mark and conversation_manager:
+                        conversation_manager.receive_mark(validated_packet.mark.name)
                 case "stop":
                     if call_sid:
-                        logger.info(
-                            "CALL HAS ENDED - STREAM ID: " f"{connections[call_sid].stream_sid}"
-                        )
+                        await call_registry.set_state(call_sid, CallState.ENDING)
+                        logger.info("CALL HAS ENDED - STREAM ID: " f"{validated_packet.stream_sid}")
                     break
 
     except WebSocketDisconnect as e:
@@ -84,12 +178,17 @@ async def websocket_endpoint(websocket: WebSocket, bot_id: str):
     except Exception as e:
         logger.error("Error Occurred: %s; at line no: %s", str(e), str(e.__traceback__.tb_lineno))
     finally:
-        if call_sid and call_sid in connections:
-            connections.pop(call_sid)
-        if conversation_manager and conversation_manager.is_active.is_set():
+        if call_sid:
+            await call_registry.unregister(call_sid)
+        if conversation_manager:
+            # Also ends calls that were never started, e.g. hung up on as out of service
             await conversation_manager.stop()
-        if not WebSocketState.DISCONNECTED:
-            await websocket.close()
+        if WebSocketState.DISCONNECTED not in (websocket.client_state, websocket.application_state):
+            try:
+                await websocket.close()
+            except Exception as e:
+                # The caller's side went away in the meantime
+                logger.info(f"Could not close the media stream: {e}")
 
 
 @app.post("/call/inbound/receive/{bot_id}")
@@ -97,6 +196,102 @@ async def inbound_call_receiver(
     bot_id: str,
     twilio_call_manager=Annotated[TwilioCallManager, Depends(TwilioCallManager)],
 ):
+    # A draining worker takes no new calls; Twilio retries the fallback URL on 5xx
+    if call_registry.draining:
+        return Response(status_code=503)
+    # An overloaded worker sheds new calls the same way, so they land on another worker
+    active_calls = len(await call_registry.calls(call_registry.worker_id))
+    if reason := watchdog.shed_reason(active_calls):
+        watchdog.shed_calls += 1
+        logger.warning(f"Refusing inbound call for bot {bot_id}: {reason}")
+        return Response(status_code=503)
     twilio_call_manager: TwilioCallManager = twilio_call_manager()
     response = twilio_call_manager.handle_incoming_call(bot_id)
     return Response(content=str(response), media_type="application/xml")
+
+
+@app.post("/bots/{bot_id}/cache/invalidate", status_code=204, dependencies=[Depends(require_admin)])
+async def invalidate_bot_cache(bot_id: str):
+    invalidate_bot_details(bot_id)
+    answer_cache.invalidate(bot_id)
+    if settings.RETRIEVAL_ENABLED:
+        # Bot documents may have changed too; only changed documents are re-indexed
+        knowledge_base.sync(bot_id)
+
+
+@app.get("/worker/status")
+async def worker_status():
+    """Live call counts for least-connections routing; 503 once the worker is draining"""
+    local_calls = await call_registry.calls(call_registry.worker_id)
+    status = {
+        "worker_id": call_registry.worker_id,
+        "draining": call_registry.draining,
+        "active_calls": len(local_calls),
+        "worker_calls": await call_registry.worker_counts(),
+        "loop_lag_ms": watchdog.recent_lag_ms,
+    }
+    return JSONResponse(status, status_code=503 if call_registry.draining else 200)
+
+
+@app.post("/worker/drain", dependencies=[Depends(require_admin)])
+async def drain_worker():
+    await call_registry.drain()
+    return {
+        "worker_id": call_registry.worker_id,
+        "active_calls": len(await call_registry.calls(call_registry.worker_id)),
+    }
+
+
+@app.post("/worker/undrain", dependencies=[Depends(require_admin)])
+async def undrain_worker():
+    """Take new calls again, e.g. once a deploy that drained the worker was rolled back"""
+    await call_registry.undrain()
+    return {"worker_id": call_registry.worker_id, "draining": call_registry.draining}
+
+
+@app.get("/worker/memory", dependencies=[Depends(require_admin)])
+async def worker_memory(collect: bool = False):
+    """
+    Approximate memory held by each call in this worker, including ended calls
+    that have not been freed (a leak). `collect=true` runs the garbage collector
+    first, so only calls that something still references remain.
+    """
+    if collect:
+        gc.collect()
+    shared = shared_ids()
+    calls = [manager.memory_stats(shared) for manager in list(live_conversations)]
+    live = [call["owned_bytes"] for call in calls if call["stopped_seconds_ago"] is None]
+    return {
+        "worker_id": call_registry.worker_id,
+        **conversation_stats(),
+        "bytes_per_live_call": sum(live) / len(live) if live else 0,
+        "calls": calls,
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Turn latency histograms and component counters in Prometheus text format"""
+    lines = tracer.prometheus_lines()
+    lines += watchdog.prometheus_lines()
+    lines += llm_turn_totals.prometheus_lines()
+    lines += gauge_lines("voice_event_loop", watchdog.stats())
+    lines += gauge_lines("voice_provider_pool", provider_pool.stats())
+    lines += gauge_lines("voice_bot_details_cache", bot_details_cache.stats())
+    lines += gauge_lines("voice_audio_cache", audio_cache.stats())
+    lines += gauge_lines("voice_answer_cache", answer_cache.stats())
+    lines += gauge_lines("voice_knowledge_base", knowledge_base.stats())
+    lines += gauge_lines("voice_logging", logging_stats())
+    lines += gauge_lines("voice_twilio_rest", twilio_control.stats())
+    lines += gauge_lines("voice_inbound_audio", inbound_audio_totals.stats())
+    lines += gauge_lines("voice_speculation", speculation_totals.stats())
+    lines += gauge_lines("voice_conversations", conversation_stats())
+    lines += gauge_lines("voice_call_tasks", call_task_totals.stats())
+    lines += gauge_lines(
+        "voice_worker",
+        {
+            "active_calls": len(await call_registry.calls(call_registry.worker_id)),
+            "draining": call_registry.draining,
+        },
+    )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
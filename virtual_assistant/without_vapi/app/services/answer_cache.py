@@ -0,0 +1,162 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.logger import logger
+from app.services.cache import TTLCache
+from app.services.pool import provider_pool
+from app.services.speculation import (
+    content_words,
+    detail_words,
+    normalize_transcript,
+    transcript_similarity,
+)
+from app.settings import settings
+
+# Returns a unit-length embedding of a question
+Embedder = Callable[[str], Awaitable[np.ndarray]]
+# Questions about the caller themselves, whose answers are theirs only
+_PERSONAL_WORDS = frozenset({"i", "me", "my", "mine", "myself", "we", "us", "our", "ours"})
+
+
+@dataclass(slots=True)
+class CachedAnswer:
+    question: str
+    sentences: List[str]
+    embedding: Optional[np.ndarray] = None
+
+
+class AnswerCache:
+    """
+    Per-bot cache of answers to questions callers ask over and over.
+
+    A question matches a cached one when the normalized transcripts are equal. A
+    near match has to ask for the same thing, not just read alike ("... on
+    saturday" and "... on sunday" are 0.95 similar): the transcripts must have the
+    same content words and be at least ANSWER_CACHE_LEXICAL_THRESHOLD similar or,
+    if an embedder is configured, have the same days, dates and numbers and
+    embeddings at least ANSWER_CACHE_VECTOR_THRESHOLD cosine-similar. Questions
+    about the caller (with "I", "my", ...) are never cached. Each bot has its own
+    LRU of at most `capacity` answers that expire after `ttl_seconds`.
+
+    Args:
+        capacity: Maximum number of cached answers per bot.
+        ttl_seconds: How long an answer is served before it must be regenerated.
+        embed: Optional embedding function for vector similarity.
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float, embed: Optional[Embedder] = None) -> None:
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._embed = embed
+        self._bots: Dict[str, TTLCache[str, CachedAnswer]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _answers(self, bot_id: str) -> TTLCache[str, CachedAnswer]:
+        if bot_id not in self._bots:
+            self._bots[bot_id] = TTLCache(max_size=self.capacity, ttl_seconds=self.ttl_seconds)
+        return self._bots[bot_id]
+
+    async def _embedding(self, question: str) -> Optional[np.ndarray]:
+        if self._embed is None:
+            return None
+        try:
+            return await self._embed(question)
+        except Exception as e:
+            logger.error(f"Failed to embed question for the answer cache: {e}")
+            return None
+
+    async def lookup(self, bot_id: str, question: str) -> Optional[List[str]]:
+        """Return the sentences of a cached answer to a near-duplicate question, if any"""
+        key = normalize_transcript(question)
+        if len(key.split()) < settings.ANSWER_CACHE_MIN_WORDS:
+            return None
+        answers = self._answers(bot_id)
+
+        entry = answers.get(key)
+        if entry is None:
+            best: Optional[Tuple[float, str]] = None
+            words = content_words(key)
+            for cached_key in answers:
+                if content_words(cached_key) != words:
+                    continue
+                similarity = transcript_similarity(key, cached_key)
+                if similarity >= settings.ANSWER_CACHE_LEXICAL_THRESHOLD and (
+                    best is None or similarity > best[0]
+                ):
+                    best = (similarity, cached_key)
+
+            embedding = None
+            if best is None and len(answers):
+                embedding = await self._embedding(key)
+            if embedding is not None:
+                details = detail_words(key)
+                for cached_key, cached in answers.items():
+                    if cached.value.embedding is None or detail_words(cached_key) != details:
+                        continue
+                    similarity = float(np.dot(embedding, cached.value.embedding))
+                    if similarity >= settings.ANSWER_CACHE_VECTOR_THRESHOLD and (
+                        best is None or similarity > best[0]
+                    ):
+                        best = (similarity, cached_key)
+
+            if best is not None:
+                # Refresh the matched answer's recency
+                entry = answers.get(best[1])
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f"Answer cache hit for '{question}' (cached '{entry.value.question}')")
+        return entry.value.sentences
+
+    async def store(self, bot_id: str, question: str, sentences: List[str]) -> None:
+        key = normalize_transcript(question)
+        words = key.split()
+        if len(words) < settings.ANSWER_CACHE_MIN_WORDS or not sentences:
+            return
+        if _PERSONAL_WORDS.intersection(words):
+            return
+        embedding = await self._embedding(key)
+        self._answers(bot_id).set(
+            key, CachedAnswer(question=question, sentences=sentences, embedding=embedding)
+        )
+        self.stores += 1
+
+    def invalidate(self, bot_id: Optional[str] = None) -> None:
+        """Drop the cached answers of `bot_id`, or of every bot when no ID is given"""
+        if bot_id is None:
+            self._bots.clear()
+        else:
+            self._bots.pop(bot_id, None)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "bots": len(self._bots),
+            "answers": sum(len(answers) for answers in self._bots.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+            "stores": self.stores,
+            "evictions": sum(answers.evictions for answers in self._bots.values()),
+        }
+
+
+async def _openai_embedding(text: str) -> np.ndarray:
+    response = await provider_pool.openai_client.embeddings.create(
+        model=settings.ANSWER_CACHE_EMBEDDING_MODEL, input=text
+    )
+    embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+answer_cache = AnswerCache(
+    capacity=settings.ANSWER_CACHE_MAX_SIZE_PER_BOT,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    embed=_openai_embedding if settings.ANSWER_CACHE_EMBEDDING_MODEL else None,
+)
@@ -0,0 +1,258 @@
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.settings import settings
+
+# 16-bit PCM full scale, the reference level for dBFS
+FULL_SCALE = 32768.0
+# Floor of the energy of a digitally silent frame, in place of -inf
+SILENCE_DBFS = -100.0
+
+
+def _mulaw_decode_table() -> np.ndarray:
+    """Linear PCM value of each of the 256 G.711 mu-law bytes"""
+    codes = ~np.arange(256) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.float32)
+
+
+MULAW_TO_PCM = _mulaw_decode_table()
+
+
+def decode_mulaw(audio: bytes) -> np.ndarray:
+    return MULAW_TO_PCM[np.frombuffer(audio, dtype=np.uint8)]
+
+
+def frame_features(pcm: np.ndarray) -> Tuple[float, float]:
+    """Energy (dBFS) and zero-crossing rate (crossings per sample) of one frame"""
+    power = float(np.dot(pcm, pcm)) / (len(pcm) * FULL_SCALE**2)
+    energy_db = 10 * math.log10(power) if power > 0 else SILENCE_DBFS
+    # A product below zero is a sign change; zero samples never count as a crossing
+    crossings = np.count_nonzero(pcm[1:] * pcm[:-1] < 0)
+    return max(energy_db, SILENCE_DBFS), crossings / max(len(pcm) - 1, 1)
+
+
+class VoiceActivityDetector:
+    """
+    Tells when the caller starts speaking from the raw mu-law frames, without
+    waiting for a transcript.
+
+    A frame is voiced when its energy clears both VAD_MIN_ENERGY_DBFS and the
+    line's background noise by VAD_NOISE_MARGIN_DB, and its zero-crossing rate
+    stays under VAD_MAX_ZERO_CROSSING_RATE (hiss crosses zero far more often than
+    a voice). Speech starts after VAD_TRIGGER_FRAMES voiced frames in a row and
+    ends after VAD_HANGOVER_FRAMES unvoiced ones. The noise level follows the
+    unvoiced frames between utterances, so a noisy line raises the bar instead of
+    triggering all the time.
+    """
+
+    # Noise tracking: drop to a quieter line at once, rise slowly with a louder one
+    NOISE_FALL_RATE = 0.5
+    NOISE_RISE_RATE = 0.02
+
+    __slots__ = (
+        "min_energy_db",
+        "noise_margin_db",
+        "max_zero_crossing_rate",
+        "trigger_frames",
+        "hangover_frames",
+        "noise_db",
+        "voiced",
+        "speaking",
+        "_voiced_run",
+        "_unvoiced_run",
+    )
+
+    def __init__(self) -> None:
+        self.min_energy_db = settings.VAD_MIN_ENERGY_DBFS
+        self.noise_margin_db = settings.VAD_NOISE_MARGIN_DB
+        self.max_zero_crossing_rate = settings.VAD_MAX_ZERO_CROSSING_RATE
+        self.trigger_frames = settings.VAD_TRIGGER_FRAMES
+        self.hangover_frames = settings.VAD_HANGOVER_FRAMES
+
+        self.noise_db = self.min_energy_db - self.noise_margin_db
+        self.voiced = False
+        self.speaking = False
+        self._voiced_run = 0
+        self._unvoiced_run = 0
+
+    def process(self, frame: bytes) -> bool:
+        """Feed one frame; returns True for the frame that completes a speech onset"""
+        if not frame:
+            return False
+        energy_db, zero_crossing_rate = frame_features(decode_mulaw(frame))
+        voiced = (
+            energy_db >= max(self.min_energy_db, self.noise_db + self.noise_margin_db)
+            and zero_crossing_rate <= self.max_zero_crossing_rate
+        )
+        self.voiced = voiced
+        if voiced:
+            self._voiced_run += 1
+            self._unvoiced_run = 0
+        else:
+            self._voiced_run = 0
+            self._unvoiced_run += 1
+            if not self.speaking:
+                rate = self.NOISE_FALL_RATE if energy_db < self.noise_db else self.NOISE_RISE_RATE
+                self.noise_db += rate * (energy_db - self.noise_db)
+
+        if not self.speaking:
+            if self._voiced_run >= self.trigger_frames:
+                self.speaking = True
+                return True
+        elif self._unvoiced_run >= self.hangover_frames:
+            self.speaking = False
+        return False
+
+
+@dataclass(slots=True)
+class InboundAudioStats:
+    """Inbound audio of one call, or of every finished call for `inbound_audio_totals`"""
+
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    frames_suppressed: int = 0
+    keepalives: int = 0
+
+    def add(self, other: "InboundAudioStats") -> None:
+        self.bytes_received += other.bytes_received
+        self.bytes_sent += other.bytes_sent
+        self.frames_suppressed += other.frames_suppressed
+        self.keepalives += other.keepalives
+
+    @property
+    def sent_ratio(self) -> float:
+        return self.bytes_sent / self.bytes_received if self.bytes_received else 1.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "frames_suppressed": self.frames_suppressed,
+            "keepalives": self.keepalives,
+            "sent_ratio": self.sent_ratio,
+        }
+
+
+inbound_audio_totals = InboundAudioStats()
+
+
+class InboundAudioStage:
+    """
+    Inbound audio path between the Twilio media stream and speech-to-text.
+
+    Decoded 20 ms frames are appended to a reused buffer and forwarded to `send`
+    once STT_BATCH_FRAMES frames have accumulated, so STT sees fewer, larger
+    writes. For the following, every frame also goes through a VoiceActivityDetector:
+
+    - With VAD_ENABLED, `on_speech_started` runs on the frame that completes an
+      onset of the caller's speech.
+    - With STT_SILENCE_SUPPRESSION, once the caller has been quiet for
+      STT_SILENCE_TAIL_MS (enough for Deepgram to endpoint the last utterance),
+      frames stop being sent and `keepalive` is called every STT_KEEPALIVE_SECONDS
+      instead. The first voiced frame resumes streaming, preceded by the last
+      STT_PREROLL_MS of suppressed audio so the start of speech is not clipped.
+
+    Args:
+        send: Coroutine function forwarding a batch of audio to STT.
+        on_speech_started: Called, on the receive loop, when the caller starts speaking.
+        keepalive: Coroutine function keeping STT connected while audio is suppressed.
+    """
+
+    __slots__ = (
+        "_send",
+        "_on_speech_started",
+        "_keepalive",
+        "_suppression",
+        "vad",
+        "_batch_bytes",
+        "_buffer",
+        "_tail_frames",
+        "_keepalive_frames",
+        "_preroll",
+        "_quiet_frames",
+        "suppressing",
+        "stats",
+    )
+
+    def __init__(
+        self,
+        send: Callable[[bytes], Awaitable[None]],
+        on_speech_started: Optional[Callable[[], None]] = None,
+        keepalive: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        self._send = send
+        self._on_speech_started = on_speech_started if settings.VAD_ENABLED else None
+        self._keepalive = keepalive
+        self._suppression = keepalive is not None and settings.STT_SILENCE_SUPPRESSION
+        self.vad = VoiceActivityDetector() if self._on_speech_started or self._suppression else None
+        frame_bytes = settings.SAMPLE_RATE * settings.TWILIO_FRAME_MS // 1000
+        self._batch_bytes = frame_bytes * settings.STT_BATCH_FRAMES
+        self._buffer = bytearray()
+
+        self._tail_frames = settings.STT_SILENCE_TAIL_MS // settings.TWILIO_FRAME_MS
+        self._keepalive_frames = max(
+            int(settings.STT_KEEPALIVE_SECONDS * 1000 // settings.TWILIO_FRAME_MS), 1
+        )
+        self._preroll: Deque[bytes] = deque(
+            maxlen=max(settings.STT_PREROLL_MS // settings.TWILIO_FRAME_MS, 1)
+        )
+        self._quiet_frames = 0
+        self.suppressing = False
+        self.stats = InboundAudioStats()
+
+    async def push(self, frame: bytes) -> None:
+        self.stats.bytes_received += len(frame)
+        if self.vad:
+            if self.vad.process(frame) and self._on_speech_started:
+                self._on_speech_started()
+            if self._suppression and await self._suppressed(frame):
+                return
+        self._buffer += frame
+        self.stats.bytes_sent += len(frame)
+        if len(self._buffer) >= self._batch_bytes:
+            await self.flush()
+
+    async def _suppressed(self, frame: bytes) -> bool:
+        """Whether to hold `frame` back from STT, as part of a silence past the tail"""
+        if self.vad.voiced or self.vad.speaking:
+            self._quiet_frames = 0
+        else:
+            self._quiet_frames += 1
+
+        if self._quiet_frames <= self._tail_frames:
+            if self.suppressing:
+                self.suppressing = False
+                for held in self._preroll:
+                    self._buffer += held
+                    self.stats.bytes_sent += len(held)
+                self._preroll.clear()
+            return False
+
+        if not self.suppressing:
+            self.suppressing = True
+            # The tail of silence still waiting in the batch goes out for endpointing
+            await self.flush()
+        self._preroll.append(frame)
+        self.stats.frames_suppressed += 1
+        if self.stats.frames_suppressed % self._keepalive_frames == 0:
+            self.stats.keepalives += 1
+            await self._keepalive()
+        return True
+
+    async def flush(self) -> None:
+        if self._buffer:
+            batch = bytes(self._buffer)
+            self._buffer.clear()
+            await self._send(batch)
+
+    def close(self) -> InboundAudioStats:
+        """Add this call's audio to `inbound_audio_totals` and return it"""
+        inbound_audio_totals.add(self.stats)
+        return self.stats
@@ -0,0 +1,109 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import aiofiles
+import aiofiles.os
+
+from app.logger import logger
+from app.settings import settings
+
+
+class AudioCache:
+    """
+    Content-addressed cache of synthesized audio.
+
+    Entries are raw audio bytes (mulaw frames with the default settings) keyed by
+    a hash of the text and the TTS parameters that shape the audio. The memory
+    tier is an LRU bounded by total bytes; the optional disk tier keeps rendered
+    phrases across restarts.
+
+    Args:
+        max_bytes: Upper bound on the bytes held in memory.
+        disk_dir: Directory for the on-disk tier, or None to keep audio in memory only.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None) -> None:
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, model: str, encoding: str, sample_rate: int) -> str:
+        return hashlib.sha256(f"{model}|{encoding}|{sample_rate}|{text}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.raw")
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = audio
+        self._size += len(audio)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def get_memory(self, key: str) -> Optional[bytes]:
+        """Memory-only lookup, safe to call on the hot path"""
+        audio = self._entries.get(key)
+        if audio is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return audio
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self.get_memory(key)
+        if audio is not None:
+            return audio
+
+        if self.disk_dir:
+            try:
+                async with aiofiles.open(self._path(key), "rb") as file:
+                    audio = await file.read()
+            except FileNotFoundError:
+                pass
+            else:
+                self.disk_hits += 1
+                self._remember(key, audio)
+                return audio
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes) -> None:
+        self._remember(key, audio)
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        try:
+            await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+            async with aiofiles.open(f"{path}.tmp", "wb") as file:
+                await file.write(audio)
+            await aiofiles.os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.error(f"Failed to write audio cache entry {key}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+audio_cache = AudioCache(
+    max_bytes=settings.AUDIO_CACHE_MAX_BYTES,
+    disk_dir=settings.AUDIO_CACHE_DIR,
+)
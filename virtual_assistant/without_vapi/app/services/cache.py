@@ -0,0 +1,98 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Generic, Hashable, Iterator, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass(slots=True)
+class CacheEntry(Generic[V]):
+    value: V
+    stored_at: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Size-bounded LRU cache whose entries expire after a time-to-live.
+
+    Entries older than `ttl_seconds` are still returned by `get` until they are
+    `ttl_seconds + stale_seconds` old, so callers can serve a stale value while
+    refreshing it in the background. Callers decide freshness with `is_fresh`.
+
+    Args:
+        max_size: Maximum number of entries; the least recently used entry is evicted.
+        ttl_seconds: Age after which an entry is considered stale.
+        stale_seconds: How long a stale entry is kept around after it expires.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, stale_seconds: float = 0) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._entries: OrderedDict[K, CacheEntry[V]] = OrderedDict()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_fresh(self, entry: CacheEntry[V]) -> bool:
+        return entry.age < self.ttl_seconds
+
+    def get(self, key: K) -> Optional[CacheEntry[V]]:
+        entry = self._entries.get(key)
+        if entry is None or entry.age >= self.ttl_seconds + self.stale_seconds:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if self.is_fresh(entry):
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return entry
+
+    def __iter__(self) -> Iterator[K]:
+        """Iterate over the keys of fresh entries without touching their recency or the counters"""
+        for key, _ in self.items():
+            yield key
+
+    def items(self) -> Iterator[Tuple[K, CacheEntry[V]]]:
+        """Iterate over fresh entries without touching their recency or the counters"""
+        for key, entry in list(self._entries.items()):
+            if self.is_fresh(entry):
+                yield key, entry
+
+    def set(self, key: K, value: V) -> None:
+        self._entries[key] = CacheEntry(value=value, stored_at=time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Optional[K] = None) -> None:
+        """Drop `key`, or every entry when no key is given"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
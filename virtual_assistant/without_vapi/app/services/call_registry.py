@@ -0,0 +1,285 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Optional
+
+from app.logger import logger
+from app.settings import settings
+
+WORKER_ID = settings.WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class CallState(str, Enum):
+    STARTING = "starting"
+    ACTIVE = "active"
+    ENDING = "ending"
+
+
+@dataclass(slots=True)
+class CallRecord:
+    call_sid: str
+    stream_sid: str
+    bot_id: str
+    worker_id: str
+    state: CallState
+    started_at: float
+    updated_at: float
+
+
+class CallRegistry(ABC):
+    """
+    Live calls across every worker serving the app.
+
+    Each worker registers the calls it owns and heartbeats while it runs; calls of
+    workers whose heartbeat is older than CALL_REGISTRY_WORKER_TTL_SECONDS are no
+    longer counted. A draining worker keeps its calls but accepts no new ones.
+    """
+
+    def __init__(self, worker_id: str = WORKER_ID) -> None:
+        self.worker_id = worker_id
+        self.draining = False
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def register(self, call_sid: str, stream_sid: str, bot_id: str) -> None:
+        """Record a new call owned by this worker."""
+
+    @abstractmethod
+    async def set_state(self, call_sid: str, state: CallState) -> None:
+        """Update the state of a call."""
+
+    @abstractmethod
+    async def unregister(self, call_sid: str) -> None:
+        """Forget a call once it has ended."""
+
+    @abstractmethod
+    async def get(self, call_sid: str) -> Optional[CallRecord]:
+        """Look up a live call."""
+
+    @abstractmethod
+    async def calls(self, worker_id: Optional[str] = None) -> List[CallRecord]:
+        """Live calls of every worker, or of `worker_id` only."""
+
+    @abstractmethod
+    async def worker_counts(self) -> Dict[str, int]:
+        """Number of live calls per live worker, including idle workers."""
+
+    @abstractmethod
+    async def heartbeat(self) -> None:
+        """Mark this worker as alive."""
+
+    async def start(self) -> None:
+        await self.heartbeat()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def close(self) -> None:
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.CALL_REGISTRY_HEARTBEAT_SECONDS)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"Call registry heartbeat failed: {e}")
+
+    async def drain(self) -> None:
+        """Stop accepting new calls on this worker; live calls run to completion"""
+        self.draining = True
+        await self.heartbeat()
+        logger.info(f"Worker {self.worker_id} is draining")
+
+    async def undrain(self) -> None:
+        """Accept new calls on this worker again, after `drain`"""
+        self.draining = False
+        await self.heartbeat()
+        logger.info(f"Worker {self.worker_id} accepts new calls again")
+
+
+class InMemoryCallRegistry(CallRegistry):
+    """Registry local to one worker process; the default for single-worker deployments"""
+
+    def __init__(self, worker_id: str = WORKER_ID) -> None:
+        super().__init__(worker_id)
+        self._calls: Dict[str, CallRecord] = {}
+
+    async def register(self, call_sid: str, stream_sid: str, bot_id: str) -> None:
+        now = time.time()
+        self._calls[call_sid] = CallRecord(
+            call_sid, stream_sid, bot_id, self.worker_id, CallState.STARTING, now, now
+        )
+
+    async def set_state(self, call_sid: str, state: CallState) -> None:
+        if call_sid in self._calls:
+            self._calls[call_sid].state = state
+            self._calls[call_sid].updated_at = time.time()
+
+    async def unregister(self, call_sid: str) -> None:
+        self._calls.pop(call_sid, None)
+
+    async def get(self, call_sid: str) -> Optional[CallRecord]:
+        return self._calls.get(call_sid)
+
+    async def calls(self, worker_id: Optional[str] = None) -> List[CallRecord]:
+        return [
+            call
+            for call in self._calls.values()
+            if worker_id is None or call.worker_id == worker_id
+        ]
+
+    async def worker_counts(self) -> Dict[str, int]:
+        return {self.worker_id: len(self._calls)}
+
+    async def heartbeat(self) -> None:
+        pass
+
+
+class SQLiteCallRegistry(CallRegistry):
+    """
+    Registry shared by the workers of one host through a SQLite database in WAL mode.
+
+    Queries run in a thread so the event loop never waits on the database lock.
+
+    Args:
+        path: Path of the database file, shared by every worker.
+    """
+
+    def __init__(self, path: str, worker_id: str = WORKER_ID) -> None:
+        super().__init__(worker_id)
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS calls (
+                    call_sid TEXT PRIMARY KEY,
+                    stream_sid TEXT NOT NULL,
+                    bot_id TEXT NOT NULL,
+                    worker_id TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS calls_worker_id ON calls (worker_id);
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    last_seen REAL NOT NULL,
+                    draining INTEGER NOT NULL DEFAULT 0
+                );
+                """
+            )
+            self._connection = connection
+        return self._connection
+
+    async def _execute(self, query: str, *parameters: object) -> List[tuple]:
+        def execute() -> List[tuple]:
+            connection = self._connect()
+            with connection:
+                return connection.execute(query, parameters).fetchall()
+
+        # One statement at a time: the connection is shared by the worker's threads
+        async with self._lock:
+            return await asyncio.to_thread(execute)
+
+    async def start(self) -> None:
+        # Calls left behind by a previous process with the same worker ID
+        await self._execute("DELETE FROM calls WHERE worker_id = ?", self.worker_id)
+        await super().start()
+
+    async def close(self) -> None:
+        await super().close()
+        await self._execute("DELETE FROM workers WHERE worker_id = ?", self.worker_id)
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    async def register(self, call_sid: str, stream_sid: str, bot_id: str) -> None:
+        now = time.time()
+        await self._execute(
+            "INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?, ?, ?)",
+            call_sid,
+            stream_sid,
+            bot_id,
+            self.worker_id,
+            CallState.STARTING.value,
+            now,
+            now,
+        )
+
+    async def set_state(self, call_sid: str, state: CallState) -> None:
+        await self._execute(
+            "UPDATE calls SET state = ?, updated_at = ? WHERE call_sid = ?",
+            state.value,
+            time.time(),
+            call_sid,
+        )
+
+    async def unregister(self, call_sid: str) -> None:
+        await self._execute("DELETE FROM calls WHERE call_sid = ?", call_sid)
+
+    def _live_since(self) -> float:
+        return time.time() - settings.CALL_REGISTRY_WORKER_TTL_SECONDS
+
+    async def get(self, call_sid: str) -> Optional[CallRecord]:
+        rows = await self._execute("SELECT * FROM calls WHERE call_sid = ?", call_sid)
+        return self._record(rows[0]) if rows else None
+
+    async def calls(self, worker_id: Optional[str] = None) -> List[CallRecord]:
+        rows = await self._execute(
+            "SELECT calls.* FROM calls JOIN workers USING (worker_id) "
+            "WHERE workers.last_seen >= ? AND (? IS NULL OR calls.worker_id = ?)",
+            self._live_since(),
+            worker_id,
+            worker_id,
+        )
+        return [self._record(row) for row in rows]
+
+    async def worker_counts(self) -> Dict[str, int]:
+        rows = await self._execute(
+            "SELECT workers.worker_id, COUNT(calls.call_sid) FROM workers "
+            "LEFT JOIN calls USING (worker_id) WHERE workers.last_seen >= ? "
+            "GROUP BY workers.worker_id",
+            self._live_since(),
+        )
+        return dict(rows)
+
+    async def heartbeat(self) -> None:
+        await self._execute(
+            "INSERT INTO workers (worker_id, last_seen, draining) VALUES (?, ?, ?) "
+            "ON CONFLICT (worker_id) DO UPDATE SET last_seen = excluded.last_seen, "
+            "draining = excluded.draining",
+            self.worker_id,
+            time.time(),
+            int(self.draining),
+        )
+
+    @staticmethod
+    def _record(row: tuple) -> CallRecord:
+        call_sid, stream_sid, bot_id, worker_id, state, started_at, updated_at = row
+        return CallRecord(
+            call_sid, stream_sid, bot_id, worker_id, CallState(state), started_at, updated_at
+        )
+
+
+def create_call_registry() -> CallRegistry:
+    match settings.CALL_REGISTRY_BACKEND:
+        case "memory":
+            return InMemoryCallRegistry()
+        case "sqlite":
+            return SQLiteCallRegistry(settings.CALL_REGISTRY_SQLITE_PATH)
+        case backend:
+            raise ValueError(f"Unknown call registry backend: {backend}")
+
+
+call_registry = create_call_registry()
@@ -1,158 +1,414 @@
 import asyncio
-from threading import Event
-from typing import AsyncIterator, Dict, List, Optional
+import time
+import weakref
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Set
 
 from fastapi.websockets import WebSocket
 
 from app.logger import logger
-from app.services.deepgram import SpeechToText, TextToSpeech
-from app.services.openai import OpenAIAssistant
+from app.services.answer_cache import answer_cache
+from app.services.audio import InboundAudioStage
+from app.services.deepgram import SpeechToText, TextToSpeech, TurnEvent, TurnEventType
+from app.services.llm import LLMBackend
+from app.services.memory import owned_bytes
+from app.services.openai import LLM_BACKENDS, RUN_ERROR_MESSAGE, TOOL_CALL_FILLER_MESSAGE
+from app.services.pool import provider_pool
+from app.services.speculation import SpeculativeResponder
+from app.services.tasks import CallTaskGroup
+from app.services.tracing import DISABLED_TRACE, Stage, current_trace, tracer
 from app.services.twilio import TwilioCallManager
 from app.settings import settings
 
+DEFAULT_GREETING = "Hello, how can I help you?"
+DEFAULT_END_CALL_MESSAGE = "Bye, Bye!"
+OUT_OF_SERVICE_MESSAGE = "This bot is out of service for now."
+# Responses containing these are never stored in the answer cache
+UNCACHEABLE_SENTENCES = frozenset({TOOL_CALL_FILLER_MESSAGE, RUN_ERROR_MESSAGE})
+
+# Every ConversationManager that has not been garbage collected yet
+live_conversations: "weakref.WeakSet[ConversationManager]" = weakref.WeakSet()
+
+
+def conversation_stats() -> Dict[str, float]:
+    """Calls in memory; ended calls that linger there are leaking"""
+    managers = list(live_conversations)
+    ended = sum(manager._stopped_at is not None for manager in managers)
+    return {"in_memory": len(managers), "active": len(managers) - ended, "ended": ended}
+
 
 class ConversationManager:
+    __slots__ = (
+        "_websocket",
+        "twilio_call_manager",
+        "_stt_service",
+        "_inbound_audio",
+        "_tts_service",
+        "_bot_id",
+        "_stream_sid",
+        "_call_sid",
+        "_tasks",
+        "_transcription_and_interruption_worker_task",
+        "_conversation_worker_task",
+        "_turn_task",
+        "_barge_in_task",
+        "bot_data",
+        "llm_backend",
+        "_speculation",
+        "_transcriptions",
+        "_turn_index",
+        "_trace",
+        "_sent_initial_message",
+        "_end_call_task",
+        "_interrupt_event",
+        "_processing_event",
+        "is_active",
+        "_started_at",
+        "_stopped_at",
+        "__weakref__",
+    )
 
     def __init__(
         self, websocket: WebSocket, bot_id: str, bot_details: Dict, call_sid: str, stream_sid: str
     ) -> None:
         self._websocket = websocket
-        self.active_connections: List[WebSocket] = []
         self.twilio_call_manager = TwilioCallManager(self._websocket)
+        # Every task working for this call, cancelled and awaited when it stops
+        self._tasks = CallTaskGroup()
 
-        self._stop_events: Dict[str, Event] = {}
-        self._stt_service = SpeechToText()
-        self._tts_service = TextToSpeech()
+        # The STT connection is leased from the provider pool in start()
+        self._stt_service: Optional[SpeechToText] = None
+        self._inbound_audio = InboundAudioStage(
+            self._send_to_stt, self._on_caller_speech, self._keep_stt_alive
+        )
+        self._tts_service = TextToSpeech(
+            http_client=provider_pool.tts_http_client, tasks=self._tasks
+        )
+        self._bot_id = bot_id
         self._stream_sid = stream_sid
         self._call_sid = call_sid
 
         self._transcription_and_interruption_worker_task: Optional[asyncio.Task] = None
         self._conversation_worker_task: Optional[asyncio.Task] = None
+        # The response to the current turn, cancelled on barge-in without the worker
+        self._turn_task: Optional[asyncio.Task] = None
+        # A barge-in heard by the VAD, which the next turn waits for
+        self._barge_in_task: Optional[asyncio.Task] = None
 
         # Fetch bot details from Supabase on connection initialization
         self.bot_data = bot_details
-        self.open_ai_assistant_obj = OpenAIAssistant(
+        backend = settings.LLM_BACKEND_OVERRIDES.get(bot_id, settings.LLM_BACKEND)
+        self.llm_backend: LLMBackend = LLM_BACKENDS[backend](
             bot_id,
             self.bot_data["gpt_assistant_id"],
             self.bot_data["gpt_vector_store_id"],
+            client=provider_pool.openai_client,
+            tasks=self._tasks,
         )
 
-        self._transcriptions: asyncio.Queue[str] = asyncio.Queue()
+        self._speculation: Optional[SpeculativeResponder] = None
+        if settings.SPECULATIVE_RESPONSES_ENABLED:
+            self._speculation = SpeculativeResponder(
+                self._speculative_response, self.llm_backend, self._tasks.spawn
+            )
+
+        # Final turn events handed from the transcription worker to the conversation worker
+        self._transcriptions: asyncio.Queue[TurnEvent] = asyncio.Queue()
+        self._turn_index = 0
+        self._trace = DISABLED_TRACE
         self._sent_initial_message = asyncio.Event()
+        self._end_call_task: Optional[asyncio.Task] = None
         self._interrupt_event = asyncio.Event()
         self._processing_event = asyncio.Event()
         self.is_active = asyncio.Event()
+        self._started_at = time.monotonic()
+        self._stopped_at: Optional[float] = None
+        live_conversations.add(self)
 
     async def start(self) -> None:
         self._processing_event.clear()
         self._sent_initial_message.clear()
 
-        asyncio.create_task(self._send_initial_message())  # Keep as a task
-        await asyncio.gather(self._stt_service.start(), self.open_ai_assistant_obj.create_thread())
+        self._tasks.spawn(self._send_initial_message(), "greeting")
+        self._stt_service, _ = await asyncio.gather(
+            provider_pool.acquire_stt(), self.llm_backend.create_thread()
+        )
 
-        self._transcription_and_interruption_worker_task = asyncio.create_task(
-            self._transcription_and_interruption_worker()
+        self._transcription_and_interruption_worker_task = self._tasks.spawn(
+            self._transcription_and_interruption_worker(), "transcription worker"
+        )
+        self._conversation_worker_task = self._tasks.spawn(
+            self._conversation_worker(), "conversation worker"
         )
-        self._conversation_worker_task = asyncio.create_task(self._conversation_worker())
         self.is_active.set()
 
         logger.info("Started conversation manager")
 
     async def stop(self) -> None:
-        await self._stt_service.stop()
-        if self._transcription_and_interruption_worker_task:
-            self._transcription_and_interruption_worker_task.cancel()
-        if self._conversation_worker_task:
-            self._conversation_worker_task.cancel()
+        """
+        End the call: cancel its tasks, then release its connections.
+
+        Safe to call more than once, and whether or not the call was started. Tasks
+        that do not stop within CALL_SHUTDOWN_TIMEOUT_SECONDS are left behind (and
+        counted in `call_task_totals.leaked`) rather than holding up the shutdown.
+        """
+        if self._stopped_at is not None:
+            return
+        self._stopped_at = time.monotonic()
         self.is_active.clear()
+        await self._tasks.aclose(settings.CALL_SHUTDOWN_TIMEOUT_SECONDS)
+
+        audio = self._inbound_audio.close()
+        logger.info(
+            f"Inbound audio: received {audio.bytes_received} bytes, sent {audio.bytes_sent} "
+            f"to STT ({audio.sent_ratio:.0%}), {audio.keepalives} keepalives"
+        )
+        if self._speculation:
+            speculation = await self._speculation.close()
+            logger.info(
+                f"Speculation: {speculation.hits} of {speculation.speculations} runs kept "
+                f"({speculation.misses} discarded at the final transcript), "
+                f"saved {speculation.saved_ms_total:.0f} ms"
+            )
+        if self._stt_service:
+            await provider_pool.release_stt(self._stt_service)
+            self._stt_service = None
+        await self._tts_service.close()
+        self.llm_backend.close()
         logger.info("Stopped conversation manager")
 
+    def memory_stats(self, shared: Optional[Set[int]] = None) -> Dict:
+        """Approximate memory this call holds, see `owned_bytes`"""
+        transcript = self.llm_backend.call_conversation
+        now = time.monotonic()
+        return {
+            "call_sid": self._call_sid,
+            "bot_id": self._bot_id,
+            "active": self.is_active.is_set(),
+            "age_seconds": now - self._started_at,
+            "stopped_seconds_ago": None if self._stopped_at is None else now - self._stopped_at,
+            "owned_bytes": owned_bytes(self, shared),
+            "tasks": len(self._tasks),
+            "transcript_messages": len(transcript),
+            "transcript_spilled": transcript.spilled,
+            "history": self.llm_backend.history.stats(),
+        }
+
     async def receive_audio(self, chunk: bytes) -> None:
-        await self._stt_service.send_chunk(chunk)
+        await self._inbound_audio.push(chunk)
+
+    def receive_mark(self, mark_name: str) -> None:
+        self.twilio_call_manager.mark_played(mark_name)
+
+    def _on_caller_speech(self) -> None:
+        """Barge in as soon as the local VAD hears the caller over the bot"""
+        if self._processing_event.is_set() and not self._interrupt_event.is_set():
+            logger.info("User started speaking (voice activity)")
+            self._interrupt_event.set()
+            self._processing_event.clear()
+            # Off the receive loop, which has to keep forwarding audio to STT meanwhile
+            self._barge_in_task = self._tasks.spawn(self._cancel_current_task(), "barge-in")
+
+    def _barge_in_pending(self) -> bool:
+        return self._barge_in_task is not None and not self._barge_in_task.done()
+
+    async def _barge_in_settled(self) -> None:
+        """Wait for a barge-in to truncate the interrupted turn, before the next one starts"""
+        if self._barge_in_pending():
+            await asyncio.wait([self._barge_in_task])
+
+    async def _send_to_stt(self, chunk: bytes) -> None:
+        if self._stt_service:
+            await self._stt_service.send_chunk(chunk)
+
+    async def _keep_stt_alive(self) -> None:
+        if self._stt_service:
+            await self._stt_service.keep_alive()
 
     async def get_chatgpt_response(self, content: str) -> AsyncIterator[str]:
+        await self._barge_in_settled()
+        # A discarded speculative turn has to be out of the conversation first
+        if self._speculation:
+            await self._speculation.settled()
         # Start creating the thread message with the content
-        await self.open_ai_assistant_obj.create_thread_message(content=content)
+        await self.llm_backend.create_thread_message(content=content)
 
         # Stream the response asynchronously
-        async for content_chunk in self.open_ai_assistant_obj.run(self._interrupt_event):
+        async for content_chunk in self.llm_backend.run(self._interrupt_event):
             yield content_chunk
 
+    async def _speculative_response(
+        self, content: str, interrupt_event: asyncio.Event, tools_gate: asyncio.Event
+    ) -> AsyncIterator[str]:
+        await self.llm_backend.create_thread_message(content=content)
+        async for content_chunk in self.llm_backend.run(interrupt_event, tools_gate):
+            yield content_chunk
+
+    async def _cached_response(self, content: str, sentences: List[str]) -> AsyncIterator[str]:
+        await self._barge_in_settled()
+        if self._speculation:
+            await self._speculation.settled()
+        # The question opens the turn up front, as for the model, so a barge-in truncates this turn
+        await self.llm_backend.create_thread_message(content=content)
+        for sentence in sentences:
+            yield sentence
+        await self.llm_backend.record_turn(" ".join(sentences))
+
+    async def _record_answer(
+        self, content: str, response: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        """Pass the response through and cache it if it completes as a plain answer"""
+        sentences: List[str] = []
+        async for sentence in response:
+            sentences.append(sentence)
+            yield sentence
+        # Interrupted, failed and tool-backed answers are specific to this call, and so are
+        # answers given after the first turn, which may build on what the caller said before
+        if (
+            self._interrupt_event.is_set()
+            or self._turn_index > 1
+            or self.llm_backend.turn_used_tools
+            or UNCACHEABLE_SENTENCES.intersection(sentences)
+        ):
+            return
+        # Off the response path: storing may embed the question
+        self._tasks.spawn(answer_cache.store(self._bot_id, content, sentences), "answer cache")
+
     async def _conversation_worker(self) -> None:
         while self.is_active.is_set():
-            await asyncio.sleep(0)
-            if not self._transcriptions.empty():
-                self._processing_event.set()
+            # Sleeps until the transcription worker hands over a final turn
+            event = await self._transcriptions.get()
+            self._processing_event.set()
+            self._turn_index += 1
+            # A task of its own, so that a barge-in cancels the turn and not this worker
+            self._turn_task = self._tasks.spawn(self._respond(event), f"turn {self._turn_index}")
+            await asyncio.wait([self._turn_task])
+            # Off the response path, between turns; later turns use the summary once it is ready
+            if self.llm_backend.history.needs_compaction():
+                self._tasks.spawn(self.llm_backend.compact_history(), "history compaction")
 
-                transcription = await self._transcriptions.get()
+    async def _respond(self, event: TurnEvent) -> None:
+        transcription = event.transcript
+        self._trace = tracer.start_turn(
+            self._call_sid, self._bot_id, self._turn_index, event.created_at
+        )
+        # Tasks started for this turn (LLM, TTS pipeline) inherit the trace
+        current_trace.set(self._trace)
+        self._trace.mark(Stage.TRANSCRIPT_FINAL)
+        try:
+            response = None
+            from_cache = False
+            if self._speculation:
+                response = self._speculation.resolve(transcription)
+            if response is None and settings.ANSWER_CACHE_ENABLED:
+                if cached := await answer_cache.lookup(self._bot_id, transcription):
+                    response = self._cached_response(transcription, cached)
+                    from_cache = True
+                else:
+                    response = self._record_answer(
+                        transcription, self.get_chatgpt_response(transcription)
+                    )
+            if response is None:
                 response = self.get_chatgpt_response(transcription)
-                audio_stream = self._tts_service.generate_audio(content=response)
-
-                speech_length_seconds = 0.0
-
+            self.twilio_call_manager.playback.start_turn()
+            # Closed when the turn ends, is interrupted or is cancelled, which stops any
+            # sentences still being synthesized ahead of playback
+            # A cached answer's audio is rendered on its first hit, and served from memory after
+            async with aclosing(
+                self._tts_service.generate_audio(
+                    content=response, on_sentence=self._mark_sentence, cache_audio=from_cache
+                )
+            ) as audio_stream:
                 async for chunk in audio_stream:
+                    # On a quick first question the greeting is still being paced out: the
+                    # answer's frames follow it instead of interleaving with it
+                    if not self._sent_initial_message.is_set():
+                        await self._sent_initial_message.wait()
                     if not self._interrupt_event.is_set():
-                        speech_length_seconds += len(chunk) / settings.SAMPLE_RATE
                         await self.twilio_call_manager.send_chunk(
                             stream_sid=self._stream_sid, chunk=chunk
                         )
-                        await self.twilio_call_manager.send_mark(
-                            stream_sid=self._stream_sid, mark_name=self._stream_sid
-                        )
+                        self._trace.mark(Stage.TWILIO_FIRST_FRAME)
                     else:
                         logger.info("I'm interrupting from here 4")
+                        self._trace.mark(Stage.INTERRUPTED)
                         await self.twilio_call_manager.clear_buffer(stream_sid=self._stream_sid)
                         break
 
-                wait_time = speech_length_seconds - settings.SPEECH_DELAY_SECONDS
-                await asyncio.sleep(max(wait_time, 0))
-                self._processing_event.clear()
+            # Hold the turn until Twilio reports that the last sentence has played
+            if not self._interrupt_event.is_set():
+                await self.twilio_call_manager.playback.wait_until_played(
+                    settings.TWILIO_PLAYBACK_TIMEOUT_SECONDS
+                )
+                self.twilio_call_manager.playback.end_turn()
+            self._processing_event.clear()
+        finally:
+            tracer.finish(self._trace)
+            self._trace = DISABLED_TRACE
+
+    async def _mark_sentence(self, sentence: str) -> None:
+        """Mark the end of a spoken sentence, so its acknowledgement tells it was heard"""
+        if not self._interrupt_event.is_set():
+            await self.twilio_call_manager.mark_playback(self._stream_sid, sentence)
 
     async def _transcription_and_interruption_worker(self) -> None:
         while self.is_active.is_set():
-            # ========= INTERRUPTION LOGIC =========
-            await asyncio.sleep(0)
-            if (
-                self._stt_service.is_speaking
-                and not self._stt_service.is_speech_final
-                and not self._interrupt_event.is_set()
-                and self._processing_event.is_set()
-            ):
-                transcription = self._stt_service.get_transcription()
-                if len(transcription.split(" ")) > settings.INTERRUPTION_WORD_COUNT:
-                    logger.info("User started speaking")
-                    self._interrupt_event.set()
-                    self._processing_event.clear()
-                    await self._cancel_current_task()
-            # ========= INTERRUPTION LOGIC =========
-
-            # ========= TRANSCRIPTION AND AGENT SPEAKING LOGIC =========
-            await asyncio.sleep(0)
-            if self._stt_service.is_speech_final:
-                # Get transcription
-                transcription = self._stt_service.get_transcription()
-                logger.info(f"Final Transcription: {transcription}")
-                # if processing event is set | If there is something in the queue
-                if self._processing_event.is_set():
-                    # Clear twilio buffer if there is something still processing
-                    # And received more than two words
-                    logger.info("Got a new transcription while processing")
-                    self._interrupt_event.set()
-                    self._processing_event.clear()
-                    await self._cancel_current_task()
-                await self._transcriptions.put(transcription)
+            # Sleeps until one of the STT callbacks publishes a turn event
+            event = await self._stt_service.turn_events.get()
 
-                self._processing_event.clear()
-                self._interrupt_event.clear()
+            match event.type:
+                case TurnEventType.SPEECH_STARTED | TurnEventType.PARTIAL:
+                    # ========= INTERRUPTION LOGIC =========
+                    if (
+                        event.word_count > settings.INTERRUPTION_WORD_COUNT
+                        and not self._interrupt_event.is_set()
+                        and self._processing_event.is_set()
+                    ):
+                        logger.info("User started speaking")
+                        self._interrupt_event.set()
+                        self._processing_event.clear()
+                        await self._cancel_current_task()
+                    # Get a head start on the response while the caller finishes the sentence
+                    # (on_partial does not wait: runs are started and discarded in the background)
+                    # (nor while a barge-in is still truncating the interrupted turn)
+                    if (
+                        self._speculation
+                        and event.stable
+                        and not self._processing_event.is_set()
+                        and not self._barge_in_pending()
+                    ):
+                        self._speculation.on_partial(event.transcript)
+                case TurnEventType.FINAL:
+                    # ========= TRANSCRIPTION AND AGENT SPEAKING LOGIC =========
+                    transcription = event.transcript
+                    logger.info(f"Final Transcription: {transcription}")
+                    # if processing event is set | If there is something in the queue
+                    if self._processing_event.is_set():
+                        # Clear twilio buffer if there is something still processing
+                        # And received more than two words
+                        logger.info("Got a new transcription while processing")
+                        self._interrupt_event.set()
+                        self._processing_event.clear()
+                        await self._cancel_current_task()
+                    await self._transcriptions.put(event)
+
+                    self._processing_event.clear()
+                    self._interrupt_event.clear()
 
     # ================== New Optimized Code ==================
     async def _cancel_current_task(self) -> None:
-        if self._conversation_worker_task is not None and not (
-            self._conversation_worker_task.cancelled() or self._conversation_worker_task.done()
-        ):
-            logger.info("Cancelling the current conversation worker task")
-            self._conversation_worker_task.cancel()
+        # What the caller heard before barging in, taken before the clear drops the rest
+        heard = self.twilio_call_manager.playback.end_turn()
+        if self._turn_task is not None and not self._turn_task.done():
+            logger.info("Cancelling the current turn")
+            self._trace.mark(Stage.INTERRUPTED)
+            self._turn_task.cancel()
         await self.twilio_call_manager.clear_buffer(stream_sid=self._stream_sid)
+        if heard is not None:
+            if self._speculation:
+                await self._speculation.settled()
+            # The model should remember the answer as far as it was spoken, not as generated
+            await self.llm_backend.truncate_turn(heard)
 
     # ================== End of New Optimized Code ==================
 
@@ -168,18 +424,37 @@ class ConversationManager:
 
     async def _send_initial_message(self) -> None:
         audio_stream = self._tts_service.generate_audio_stream_from_text(
-            self.bot_data.get("greeting") or "Hello, how can I help you?"
+            self.bot_data.get("greeting") or DEFAULT_GREETING
         )
-        await self.twilio_call_manager.stream_audio(
-            stream_sid=self._stream_sid, audio_stream=audio_stream
-        )
-        self._sent_initial_message.set()
+        try:
+            await self.twilio_call_manager.stream_audio(
+                stream_sid=self._stream_sid, audio_stream=audio_stream
+            )
+        finally:
+            # Set even if the greeting failed, the first turn waits for it
+            self._sent_initial_message.set()
+
+    def hang_up(self, end_call_message: str = DEFAULT_END_CALL_MESSAGE) -> None:
+        """
+        Say `end_call_message` and end the call once it has played.
 
-    async def _end_call(self, end_call_message: str = "Bye, Bye!") -> None:
+        Runs in the background: the acknowledgement it waits for arrives through
+        the same receive loop that calls this.
+        """
+        if self._end_call_task is None:
+            self._end_call_task = self._tasks.spawn(self._end_call(end_call_message), "end call")
+
+    async def _end_call(self, end_call_message: str = DEFAULT_END_CALL_MESSAGE) -> None:
         audio_stream = self._tts_service.generate_audio_stream_from_text(end_call_message)
-        await self.twilio_call_manager.stream_audio(
-            stream_sid=self._stream_sid, audio_stream=audio_stream
+        mark_name = await self.twilio_call_manager.stream_audio(
+            stream_sid=self._stream_sid, audio_stream=audio_stream, text=end_call_message
         )
-        # Wait for 3 seconds because stream audio takes time to speak
-        await asyncio.sleep(3)
-        await self.twilio_call_manager.end_call(self._call_sid)
+        # Hang up as soon as Twilio reports that the message has played out
+        if not await self.twilio_call_manager.wait_for_mark(
+            mark_name, settings.TWILIO_PLAYBACK_TIMEOUT_SECONDS
+        ):
+            logger.warning("Twilio did not acknowledge the end of call message; hanging up")
+        try:
+            await self.twilio_call_manager.end_call(self._call_sid)
+        except Exception as e:
+            logger.error(f"Failed to end call {self._call_sid}: {e}")
@@ -1,10 +1,56 @@
 import json
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict
 
-import requests
+from app.logger import logger
+from app.services.http import ToolPolicy, ToolSession
+from app.services.pool import provider_pool
 from app.settings import settings
 
 
-async def escalateIssue(name, email, phone, bot_id, call_conversation):
+@dataclass(slots=True)
+class Tool:
+    function: Callable[..., Awaitable[str]]
+    policy: ToolPolicy
+
+
+# Custom functions the assistants can call, by the name used in `function_tools_map`
+tools: Dict[str, Tool] = {}
+
+
+def tool(**policy: Any) -> Callable:
+    """
+    Register a custom function as a tool, with its HTTP timeout and retry policy.
+
+    The function receives a `http` session that applies the policy and the tool's
+    circuit breaker to every request it makes.
+    """
+
+    def register(function: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+        tools[function.__name__] = Tool(function=function, policy=ToolPolicy(**policy))
+        return function
+
+    return register
+
+
+async def call_tool(tool_name: str, **kwargs: Any) -> str:
+    """
+    Run the registered tool `tool_name`.
+
+    Raises:
+        ValueError: If no tool is registered under `tool_name`.
+    """
+    if tool_name not in tools:
+        raise ValueError(f"Function {tool_name} not found")
+    registered = tools[tool_name]
+    session = ToolSession(
+        client=provider_pool.tool_http, tool_name=tool_name, policy=registered.policy
+    )
+    return await registered.function(http=session, **kwargs)
+
+
+@tool(timeout_seconds=settings.SUMMARIZATION_TIMEOUT_SECONDS)
+async def escalateIssue(http: ToolSession, name, email, phone, bot_id, call_conversation):
     try:
         payload = {
             "session_id": None,
@@ -18,7 +64,7 @@ async def escalateIssue(name, email, phone, bot_id, call_conversation):
 
         headers = {"Content-Type": "application/json"}
 
-        response = requests.post(settings.SUMMARIZATION_URL, headers=headers, json=payload)
+        response = await http.post(settings.SUMMARIZATION_URL, headers=headers, json=payload)
 
         if response.status_code != 200:
             raise Exception(f"HTTP error! status: {response.status_code}")
@@ -27,5 +73,5 @@ async def escalateIssue(name, email, phone, bot_id, call_conversation):
         return json.dumps(result)
 
     except Exception as e:
-        print(f"Error escalating issue: {e}")
+        logger.error(f"Error escalating issue: {e}")
         return "Unexpected Error Occurred. Please try again later."
@@ -1,32 +1,100 @@
-from typing import Any, AsyncGenerator, AsyncIterator
+import asyncio
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import httpx
 
 from deepgram import (
     AsyncLiveClient,
-    DeepgramClient,
     DeepgramClientOptions,
     LiveOptions,
     LiveResultResponse,
     LiveTranscriptionEvents,
     SpeakOptions,
-    SpeakWebSocketEvents,
 )
-from deepgram.clients.common.v1.options import TextSource
 
 from app.logger import logger
+from app.services.audio_cache import audio_cache
+from app.services.tasks import CallTaskGroup
+from app.services.tracing import Stage, current_trace
 from app.settings import settings
 
 
+class TurnEventType(str, Enum):
+    SPEECH_STARTED = "speech_started"
+    PARTIAL = "partial"
+    FINAL = "final"
+
+
+@dataclass(slots=True)
+class TurnEvent:
+    """A turn-taking event published by the STT callbacks for one call"""
+
+    type: TurnEventType
+    transcript: str = ""
+    word_count: int = 0
+    # Partial whose words Deepgram has finalized, although the caller may keep talking
+    stable: bool = False
+    created_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass(slots=True)
+class SentenceMetrics:
+    """Timings of a single sentence synthesized by TextToSpeech"""
+
+    text: str
+    queued_at: float
+    first_audio_at: Optional[float] = None
+    completed_at: Optional[float] = None
+    audio_bytes: int = 0
+
+    @property
+    def time_to_first_audio(self) -> Optional[float]:
+        if self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.queued_at
+
+
 class SpeechToText:
+    __slots__ = (
+        "is_speech_final",
+        "is_speaking",
+        "_final_parts",
+        "_current_result",
+        "turn_events",
+        "_live_options",
+        "_client",
+    )
 
     def __init__(
         self,
         encoding: str | None = settings.DEEPGRAM_ENCODING,
         sample_rate: int | None = settings.SAMPLE_RATE,
+        keepalive: bool = False,
     ) -> None:
         self.is_speech_final = False
         self.is_speaking = False
-        self._current_buffer = ""
+        # Final transcripts of the current utterance, joined when it is handed over
+        self._final_parts: List[str] = []
         self._current_result: LiveResultResponse | None = None
+        # Workers await this queue instead of polling the flags above
+        self.turn_events: asyncio.Queue[TurnEvent] = asyncio.Queue()
         self._live_options = LiveOptions(
             language="en-US",
             model=settings.DEEPGRAM_SST_MODEL,
@@ -40,10 +108,13 @@ class SpeechToText:
             utterance_end_ms="1000",
             vad_events=True,
         )
+        options = {"termination_exception_send": "false"}
+        if keepalive:
+            # Lets the pool hold the connection open before any audio flows
+            options["keepalive"] = "true"
         self._client = AsyncLiveClient(
             config=DeepgramClientOptions(
-                api_key=settings.DEEPGRAM_SECRET_KEY,
-                options={"termination_exception_send": "false"},
+                api_key=settings.DEEPGRAM_SECRET_KEY, url=settings.DEEPGRAM_STT_URL, options=options
             )
         )
         self._client.on(LiveTranscriptionEvents.Transcript, self._on_message)
@@ -57,15 +128,22 @@ class SpeechToText:
     async def stop(self) -> bool:
         return await self._client.finish()
 
+    async def is_connected(self) -> bool:
+        return await self._client.is_connected()
+
     async def send_chunk(self, chunk: bytes) -> None:
         await self._client.send(chunk)
 
+    async def keep_alive(self) -> None:
+        """Keep the connection open while no audio is being sent"""
+        await self._client.keep_alive()
+
     def get_transcription(self) -> str:
         """Get the current transcription and clear the buffer"""
         self.is_speech_final = False
         self.is_speaking = False
-        transcription = self._current_buffer
-        self._current_buffer = ""
+        transcription = " ".join(self._final_parts)
+        self._final_parts = []
         return transcription
 
     def _calculate_time_silent(self, result: LiveResultResponse) -> float:
@@ -84,7 +162,7 @@ class SpeechToText:
             and transcript.strip()[-1] in settings.PUNCTUATION_TERMINATORS
         ) or (
             not bool(transcript)
-            and bool(self._current_buffer)
+            and bool(self._final_parts)
             and ((time_silent + result.duration) > settings.SILENCE_THRESHOLD)
         )
 
@@ -97,15 +175,32 @@ class SpeechToText:
         word_count = len(result.channel.alternatives[0].words)
         return bool(transcript) and word_count > settings.INTERRUPTION_WORD_COUNT
 
+    def _publish(
+        self,
+        event_type: TurnEventType,
+        transcript: str = "",
+        word_count: int = 0,
+        stable: bool = False,
+    ) -> None:
+        self.turn_events.put_nowait(
+            TurnEvent(type=event_type, transcript=transcript, word_count=word_count, stable=stable)
+        )
+
+    def _publish_final(self) -> None:
+        """Hand the buffered transcription over to the workers as a final turn"""
+        if self._final_parts:
+            self._publish(TurnEventType.FINAL, self.get_transcription())
+
     async def _on_speech_started(self, *arg: Any, **kwargs: Any) -> None:
         if self._current_result:
             self.is_speaking = self._is_speaking(self._current_result)
+        self._publish(TurnEventType.SPEECH_STARTED)
 
     async def _on_error(self, *args: Any, **kwargs: Any) -> None:
         error = kwargs.get("error")
         self.is_speech_final = False
         self.is_speaking = False
-        self._current_buffer = ""
+        self._final_parts = []
         if error:
             logger.error(error)
 
@@ -113,6 +208,8 @@ class SpeechToText:
         if self._current_result:
             self.is_speech_final = self._is_speech_final(self._current_result)
             self.is_speaking = self._is_speaking(self._current_result)
+            if self.is_speech_final:
+                self._publish_final()
 
     async def _on_message(self, *arg: Any, **kwargs: Any) -> None:
         result: LiveResultResponse | None = kwargs.get("result")
@@ -120,33 +217,40 @@ class SpeechToText:
             self._current_result = result
             self.is_speech_final = self._is_speech_final(result)
             self.is_speaking = self._is_speaking(result)
-            if result.is_final:
-                if len(self._current_buffer):
-                    self._current_buffer += " "
-                self._current_buffer += result.channel.alternatives[0].transcript
+            transcript = result.channel.alternatives[0].transcript
+            if result.is_final and transcript:
+                self._final_parts.append(transcript)
+            if self.is_speech_final:
+                self._publish_final()
+            elif transcript:
+                parts = self._final_parts if result.is_final else [*self._final_parts, transcript]
+                partial = " ".join(parts).strip()
+                self._publish(
+                    TurnEventType.PARTIAL,
+                    partial,
+                    word_count=len(result.channel.alternatives[0].words),
+                    stable=result.is_final,
+                )
 
 
 class TextToSpeech:
-    def __init__(self):
-        self.deepgram: DeepgramClient = DeepgramClient(
-            api_key=settings.DEEPGRAM_SECRET_KEY,
-            config=DeepgramClientOptions(
-                api_key=settings.DEEPGRAM_SECRET_KEY,
-                options={"termination_exception_send": "false"},
-            ),
-        )
-        # Create a websocket connection to Deepgram
-        self.dg_connection = self.deepgram.speak.websocket.v("1")
-        self.dg_connection.on(SpeakWebSocketEvents.Open, self.on_open)
-        self.dg_connection.on(SpeakWebSocketEvents.Close, self.on_close)
+    __slots__ = ("_owns_http_client", "_http_client", "_tasks", "sentence_metrics")
 
-    def on_open(self, *args, **kwargs):
-        # Log or inspect args to understand what is passed
-        logger.info(f"WebSocket opened with args: {args}, kwargs: {kwargs}")
-
-    def on_close(self, *args, **kwargs):
-        # Log or inspect args to understand what is passed
-        logger.info(f"WebSocket closed with args: {args}, kwargs: {kwargs}")
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        tasks: Optional[CallTaskGroup] = None,
+    ):
+        # Synthesis goes through an async HTTP client so it never blocks the event loop.
+        # A shared client (see ProviderPool) keeps its connections warm across calls.
+        self._owns_http_client = http_client is None
+        self._http_client = http_client or httpx.AsyncClient(
+            headers={"Authorization": f"Token {settings.DEEPGRAM_SECRET_KEY}"},
+            timeout=httpx.Timeout(settings.TTS_REQUEST_TIMEOUT_SECONDS),
+        )
+        # The call's task group, which the synthesis pipeline of generate_audio runs in
+        self._tasks = tasks or CallTaskGroup()
+        self.sentence_metrics: Deque[SentenceMetrics] = deque(maxlen=settings.TTS_METRICS_HISTORY)
 
     @property
     def speak_options(self) -> SpeakOptions:
@@ -157,26 +261,152 @@ class TextToSpeech:
             sample_rate=settings.SAMPLE_RATE,
         ).__dict__
 
+    async def close(self) -> None:
+        if self._owns_http_client:
+            await self._http_client.aclose()
+
+    def cache_key(self, text: str) -> str:
+        return audio_cache.key(
+            text, settings.DEEPGRAM_TTS_MODEL, settings.DEEPGRAM_ENCODING, settings.SAMPLE_RATE
+        )
+
+    def _record_cached(self, text: str, audio: bytes) -> None:
+        now = time.monotonic()
+        self.sentence_metrics.append(
+            SentenceMetrics(
+                text=text,
+                queued_at=now,
+                first_audio_at=now,
+                completed_at=now,
+                audio_bytes=len(audio),
+            )
+        )
+
+    async def _stream_sentence(self, text: str) -> AsyncGenerator[bytes, None]:
+        metrics = SentenceMetrics(text=text, queued_at=time.monotonic())
+        self.sentence_metrics.append(metrics)
+        params: Dict[str, Any] = {
+            key: value for key, value in self.speak_options.items() if value is not None
+        }
+        async with self._http_client.stream(
+            "POST", settings.DEEPGRAM_TTS_URL, params=params, json={"text": text}
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                if chunk:
+                    if metrics.first_audio_at is None:
+                        metrics.first_audio_at = time.monotonic()
+                        logger.debug(
+                            "TTS first audio after %.3fs: %s", metrics.time_to_first_audio, text
+                        )
+                    metrics.audio_bytes += len(chunk)
+                    yield chunk
+        metrics.completed_at = time.monotonic()
+
+    async def _synthesize(self, text: str, chunks: asyncio.Queue, cache_audio: bool) -> None:
+        """Synthesize one sentence into `chunks`, terminated by None, and into the cache if asked"""
+        audio = audio_cache.get_memory(self.cache_key(text))
+        if audio is not None:
+            self._record_cached(text, audio)
+            chunks.put_nowait(audio)
+            chunks.put_nowait(None)
+            return
+        rendered: Optional[bytearray] = bytearray() if cache_audio else None
+        try:
+            async for chunk in self._stream_sentence(text):
+                chunks.put_nowait(chunk)
+                if rendered is not None:
+                    rendered += chunk
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to synthesize sentence: {e}")
+            rendered = None
+        finally:
+            chunks.put_nowait(None)
+        # Once the end of the sentence is queued, so that storing never holds up playback
+        if rendered:
+            await audio_cache.put(self.cache_key(text), bytes(rendered))
+
     async def generate_audio(
         self,
         content: AsyncIterator[str],  # Expecting an asynchronous iterator of string chunks
+        on_sentence: Optional[Callable[[str], Awaitable[None]]] = None,
+        cache_audio: bool = False,
     ):
-        async for string_chunk in content:  # Asynchronously iterate over content chunks
-            response = self.deepgram.speak.v("1").stream_memory(
-                TextSource(text=string_chunk), self.speak_options
-            )
+        """
+        Stream audio for each sentence of `content` in order.
 
-            for chunk in response.stream:
-                if chunk:
-                    yield chunk
+        Up to TTS_PIPELINE_DEPTH sentences are synthesized ahead of the one being
+        yielded, so sentence N+1 is already rendering while sentence N plays out.
+        `on_sentence` is awaited with each sentence once all of its audio has been
+        yielded, before any audio of the next one. With `cache_audio`, the audio
+        synthesized for each sentence is also stored in the audio cache.
+        """
+        pending: asyncio.Queue[Optional[Tuple[str, asyncio.Task, asyncio.Queue]]] = asyncio.Queue()
+        in_flight = asyncio.Semaphore(settings.TTS_PIPELINE_DEPTH)
+        tasks: Set[asyncio.Task] = set()
+        trace = current_trace.get()
+
+        async def produce() -> None:
+            try:
+                async for string_chunk in content:  # Asynchronously iterate over content chunks
+                    if not string_chunk:
+                        continue
+                    trace.mark(Stage.FIRST_SENTENCE)
+                    await in_flight.acquire()
+                    chunks: asyncio.Queue = asyncio.Queue()
+                    task = self._tasks.spawn(
+                        self._synthesize(string_chunk, chunks, cache_audio), "tts sentence"
+                    )
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    pending.put_nowait((string_chunk, task, chunks))
+            finally:
+                pending.put_nowait(None)
+
+        producer = self._tasks.spawn(produce(), "tts producer")
+        try:
+            while (item := await pending.get()) is not None:
+                sentence, _, chunks = item
+                try:
+                    while (chunk := await chunks.get()) is not None:
+                        trace.mark(Stage.TTS_FIRST_BYTE)
+                        yield chunk
+                finally:
+                    in_flight.release()
+                if on_sentence:
+                    await on_sentence(sentence)
+            # Surface errors raised while reading the content iterator
+            await producer
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
 
     async def generate_audio_stream_from_text(
         self,
         text: str,
     ) -> AsyncGenerator[bytes, None]:
-        response = self.deepgram.speak.v("1").stream_memory(
-            TextSource(text=text), self.speak_options
-        )
-        for chunk in response.stream:
-            if chunk:
-                yield chunk
+        """Stream audio for a fixed phrase, serving and filling the audio cache"""
+        key = self.cache_key(text)
+        audio = await audio_cache.get(key)
+        if audio is not None:
+            self._record_cached(text, audio)
+            yield audio
+            return
+
+        rendered = bytearray()
+        try:
+            # Closing this generator early closes the HTTP stream with it
+            async with aclosing(self._stream_sentence(text)) as stream:
+                async for chunk in stream:
+                    rendered += chunk
+                    yield chunk
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to synthesize text: {e}")
+        else:
+            await audio_cache.put(key, bytes(rendered))
+
+    async def prerender(self, text: str) -> None:
+        """Synthesize `text` into the audio cache unless it is already there"""
+        async for _ in self.generate_audio_stream_from_text(text):
+            pass
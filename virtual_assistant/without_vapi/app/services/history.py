@@ -0,0 +1,149 @@
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.logger import logger
+from app.services.tokens import count_message_tokens, count_tokens
+from app.services.transcript import CallTranscript
+from app.settings import settings
+
+SUMMARY_PREFIX = "Summary of the conversation so far:\n"
+
+# Folds messages into the running summary: (summary, messages) -> new summary
+Summarizer = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+
+class ConversationHistory:
+    """
+    What the model is given of a call's conversation each turn.
+
+    That is a window of the latest messages of the transcript, within
+    HISTORY_TOKEN_BUDGET tokens, preceded by a summary of the earlier ones. The
+    summary is updated incrementally, off the response path: once the messages
+    not in it outgrow the budget, or start spilling out of memory, `compact`
+    folds the oldest of them into it, leaving HISTORY_WINDOW_TOKENS (and half
+    the messages the transcript keeps in memory, at most). Until then,
+    or if summarizing fails, the window still keeps to the budget and the
+    messages it leaves out are only in the transcript.
+
+    Attributes:
+        summary: Running summary of the messages before `summarized`.
+        summarized: Number of messages, from the start of the transcript, in the summary.
+        compactions: Times the summary has been updated.
+    """
+
+    __slots__ = (
+        "_transcript",
+        "summary",
+        "summary_tokens",
+        "summarized",
+        "compactions",
+        "compaction_seconds",
+        "_compacting",
+    )
+
+    def __init__(self, transcript: CallTranscript) -> None:
+        self._transcript = transcript
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarized = 0
+        self.compactions = 0
+        self.compaction_seconds = 0.0
+        self._compacting = False
+
+    def window(self) -> List[Tuple[str, str, int]]:
+        """(role, content, tokens) of the latest messages within the budget, oldest first"""
+        budget = settings.HISTORY_TOKEN_BUDGET - self._summary_cost()
+        window: List[Tuple[str, str, int]] = []
+        total = 0
+        for entry in reversed(self._transcript.recent(self.summarized)):
+            # The latest message, the caller's question, is always in
+            if window and total + entry[2] > budget:
+                break
+            window.append(entry)
+            total += entry[2]
+        window.reverse()
+        return window
+
+    def covers_call(self, window: List[Tuple[str, str, int]]) -> bool:
+        """Whether `window` is the whole conversation, with nothing summarized or left out"""
+        return len(window) == len(self._transcript)
+
+    def prompt_messages(
+        self, window: Optional[List[Tuple[str, str, int]]] = None
+    ) -> List[Dict[str, str]]:
+        """The summary, as a system message, followed by `window` (by default, the current one)"""
+        if window is None:
+            window = self.window()
+        messages = [{"role": role, "content": content} for role, content, _ in window]
+        if self.summary:
+            messages.insert(0, {"role": "system", "content": SUMMARY_PREFIX + self.summary})
+        return messages
+
+    def _summary_cost(self) -> int:
+        return count_tokens(SUMMARY_PREFIX) + self.summary_tokens if self.summary else 0
+
+    def prompt_tokens(self, window: List[Tuple[str, str, int]]) -> int:
+        """Tokens of the summary and `window`, as sent to the model"""
+        return self._summary_cost() + sum(tokens for _, _, tokens in window)
+
+    def needs_compaction(self) -> bool:
+        if self._compacting:
+            return False
+        if self._transcript.spilled > self.summarized:
+            return True
+        pending = sum(tokens for _, _, tokens in self._transcript.recent(self.summarized))
+        return pending + self._summary_cost() > settings.HISTORY_TOKEN_BUDGET
+
+    def _compaction_end(self) -> int:
+        """Index of the first message to keep out of the summary"""
+        # The latest turn (question and answer) stays out, and may still be truncated
+        end = len(self._transcript) - 2
+        kept = 0
+        # Half the messages in memory at most, so that the next spill is turns away
+        room = self._transcript.capacity // 2 - 2
+        for _, _, tokens in reversed(self._transcript.recent(self.summarized)[:-2]):
+            if kept + tokens > settings.HISTORY_WINDOW_TOKENS or room <= 0:
+                break
+            kept += tokens
+            room -= 1
+            end -= 1
+        # Spilled messages are no longer in the window, so they have to be summarized
+        return max(end, min(self._transcript.spilled, len(self._transcript) - 2))
+
+    async def compact(self, summarize: Summarizer) -> None:
+        """Fold the oldest messages not summarized yet into the summary"""
+        if self._compacting:
+            return
+        self._compacting = True
+        try:
+            start, end = self.summarized, self._compaction_end()
+            if end <= start:
+                return
+            started_at = time.monotonic()
+            summary = await summarize(self.summary, self._transcript.messages(start, end))
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation history: {e}")
+            return
+        finally:
+            self._compacting = False
+        self.summary = summary.strip()
+        self.summary_tokens = count_message_tokens(self.summary)
+        self.summarized = end
+        self.compactions += 1
+        elapsed = time.monotonic() - started_at
+        self.compaction_seconds += elapsed
+        logger.info(
+            f"Summarized messages {start} to {end - 1} of the conversation in {elapsed:.3f}s "
+            f"(summary: {self.summary_tokens} tokens)"
+        )
+
+    def stats(self) -> Dict[str, float]:
+        window = self.window()
+        return {
+            "summarized_messages": self.summarized,
+            "summary_tokens": self.summary_tokens,
+            "window_messages": len(window),
+            "prompt_tokens": self.prompt_tokens(window),
+            "compactions": self.compactions,
+            "compaction_seconds": self.compaction_seconds,
+        }
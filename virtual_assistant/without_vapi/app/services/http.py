@@ -0,0 +1,194 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.logger import logger
+from app.settings import settings
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+# Methods safe to send again after the server may have acted on them
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD"})
+# Failures of a request that never reached the server, safe to retry whatever the method
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class ToolHTTPError(Exception):
+    """A tool's HTTP request failed after retries, or its circuit is open."""
+
+
+@dataclass(slots=True)
+class ToolPolicy:
+    timeout_seconds: float = settings.TOOL_HTTP_TIMEOUT_SECONDS
+    retries: int = settings.TOOL_HTTP_RETRIES
+    backoff_seconds: float = settings.TOOL_HTTP_BACKOFF_SECONDS
+
+
+class CircuitBreaker:
+    """
+    Fails fast once a tool keeps failing, instead of holding every call for its timeout.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests are
+    rejected for `reset_seconds`. The first request after that is let through as a
+    probe: success closes the circuit, failure opens it again, and a probe that ends
+    otherwise (e.g. cancelled with its call) lets the next request probe instead.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self.reset_seconds:
+            return False
+        self._probing = True
+        return True
+
+    def end_probe(self) -> None:
+        """Let another request probe, if the one in flight ended without an outcome"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+
+class ToolHTTPClient:
+    """
+    HTTP client shared by every custom tool function on the worker.
+
+    Requests go through one pooled `httpx.AsyncClient`, so they never block the
+    event loop and concurrent tool calls run in parallel. Each tool gets its own
+    timeout, bounded retries with full-jitter exponential backoff, and a circuit
+    breaker.
+
+    Args:
+        client: The pooled client to send requests with.
+    """
+
+    def __init__(self, client: httpx.AsyncClient) -> None:
+        self._client = client
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejections = 0
+
+    def breaker(self, tool_name: str) -> CircuitBreaker:
+        if tool_name not in self._breakers:
+            self._breakers[tool_name] = CircuitBreaker(
+                failure_threshold=settings.TOOL_CIRCUIT_FAILURE_THRESHOLD,
+                reset_seconds=settings.TOOL_CIRCUIT_RESET_SECONDS,
+            )
+        return self._breakers[tool_name]
+
+    async def request(
+        self, tool_name: str, policy: ToolPolicy, method: str, url: str, **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Send a request on behalf of `tool_name`, retrying transient failures.
+
+        Methods other than GET and HEAD are not idempotent (e.g. filing an
+        escalation): they are only retried when the request cannot have reached the
+        server (connection failures) or was rate limited (429).
+
+        Raises:
+            ToolHTTPError: If the circuit is open or every attempt failed.
+        """
+        breaker = self.breaker(tool_name)
+        if not breaker.allow():
+            self.rejections += 1
+            raise ToolHTTPError(f"Circuit open for tool {tool_name}")
+        # Let through while the circuit is open, this request is its probe
+        probe = breaker.is_open
+        try:
+            return await self._send(tool_name, breaker, policy, method, url, **kwargs)
+        finally:
+            if probe:
+                breaker.end_probe()
+
+    async def _send(
+        self,
+        tool_name: str,
+        breaker: CircuitBreaker,
+        policy: ToolPolicy,
+        method: str,
+        url: str,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempts = 0
+        while True:
+            if attempts:
+                self.retries += 1
+                await asyncio.sleep(random.uniform(0, policy.backoff_seconds * 2 ** (attempts - 1)))
+            attempts += 1
+            self.requests += 1
+            try:
+                response = await self._client.request(
+                    method, url, timeout=policy.timeout_seconds, **kwargs
+                )
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = idempotent or isinstance(e, UNSENT_ERRORS)
+            else:
+                if response.status_code not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    return response
+                error = f"HTTP status {response.status_code}"
+                retryable = idempotent or response.status_code == 429
+            if not retryable or attempts > policy.retries:
+                break
+
+        self.failures += 1
+        breaker.record_failure()
+        logger.error(f"Tool {tool_name} request failed after {attempts} attempts: {error}")
+        raise ToolHTTPError(error)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejections": self.rejections,
+            "open_circuits": sum(breaker.is_open for breaker in self._breakers.values()),
+        }
+
+
+@dataclass(slots=True)
+class ToolSession:
+    """What a tool function uses to make HTTP requests, bound to its name and policy"""
+
+    client: ToolHTTPClient
+    tool_name: str
+    policy: ToolPolicy
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.client.request(self.tool_name, self.policy, method, url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
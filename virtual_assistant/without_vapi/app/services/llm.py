@@ -0,0 +1,195 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from app.logger import logger
+from app.services.history import ConversationHistory
+from app.services.retrieval import format_passages, knowledge_base
+from app.services.tasks import CallTaskGroup
+from app.services.tracing import Stage, current_trace
+from app.services.transcript import CallTranscript
+from app.settings import settings
+
+
+@dataclass(slots=True)
+class TurnMetrics:
+    """Latency and prompt size of a single LLM turn"""
+
+    turn_index: int
+    requested_at: float
+    first_token_at: Optional[float] = None
+    # Counted locally: the conversation history, summary and instructions sent with the turn
+    prompt_tokens: Optional[int] = None
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.requested_at
+
+
+# Upper bounds of the turn index ranges that `llm_turn_totals` groups turns by
+TURN_INDEX_BOUNDS = (1, 2, 5, 10, 20, 40)
+
+
+def turn_index_label(position: int) -> str:
+    """Label of the range at `position` in TURN_INDEX_BOUNDS, e.g. 6-10 or 41+"""
+    if position == len(TURN_INDEX_BOUNDS):
+        return f"{TURN_INDEX_BOUNDS[-1] + 1}+"
+    low = TURN_INDEX_BOUNDS[position - 1] + 1 if position else 1
+    high = TURN_INDEX_BOUNDS[position]
+    return str(high) if low == high else f"{low}-{high}"
+
+
+@dataclass(slots=True)
+class TurnRangeStats:
+    turns: int = 0
+    prompt_tokens: int = 0
+    first_tokens: int = 0
+    time_to_first_token_seconds: float = 0.0
+
+
+class LLMTurnTotals:
+    """
+    Prompt size and time to first token of the LLM turns of every call in this
+    worker, by range of turn index, to tell how the late turns of long calls fare.
+    """
+
+    def __init__(self) -> None:
+        self.ranges: Dict[int, TurnRangeStats] = {}
+
+    def _range(self, metrics: TurnMetrics) -> TurnRangeStats:
+        position = bisect_left(TURN_INDEX_BOUNDS, metrics.turn_index)
+        return self.ranges.setdefault(position, TurnRangeStats())
+
+    def record_request(self, metrics: TurnMetrics) -> None:
+        stats = self._range(metrics)
+        stats.turns += 1
+        stats.prompt_tokens += metrics.prompt_tokens or 0
+
+    def record_first_token(self, metrics: TurnMetrics) -> None:
+        stats = self._range(metrics)
+        stats.first_tokens += 1
+        stats.time_to_first_token_seconds += metrics.time_to_first_token
+
+    def prometheus_lines(self) -> List[str]:
+        lines = []
+        for field in ("turns", "prompt_tokens", "first_tokens", "time_to_first_token_seconds"):
+            lines.append(f"# TYPE voice_llm_{field}_total counter")
+            for position, stats in sorted(self.ranges.items()):
+                lines.append(
+                    f'voice_llm_{field}_total{{turn_index="{turn_index_label(position)}"}} '
+                    f"{getattr(stats, field):g}"
+                )
+        return lines
+
+
+llm_turn_totals = LLMTurnTotals()
+
+
+class LLMBackend(ABC):
+    """
+    Interface between ConversationManager and a language model provider.
+
+    A backend owns the conversation state of one call. The "thread" is whatever
+    the backend uses to hold it: a server-side Assistants thread or local history.
+
+    Attributes:
+        call_conversation: User and assistant messages of the call, in order.
+        history: The part of `call_conversation` given to the model and to tools.
+        turn_metrics: Time to first token and prompt size of recent turns.
+        turn_used_tools: Whether the model called tools to answer the current turn.
+
+    Args:
+        tasks: The call's task group, for work that may outlive a turn such as tool
+            calls; the backend keeps a group of its own if omitted.
+    """
+
+    # Whether cancelling the task running a turn leaves nothing behind at the provider,
+    # so that a discarded turn need not be stopped through its interrupt event first
+    cancels_cleanly = False
+
+    def __init__(self, tasks: Optional[CallTaskGroup] = None) -> None:
+        self._tasks = tasks or CallTaskGroup()
+        self.call_conversation = CallTranscript()
+        self.history = ConversationHistory(self.call_conversation)
+        self.turn_metrics: Deque[TurnMetrics] = deque(maxlen=settings.LLM_METRICS_HISTORY)
+        self._turn_index = 0
+        self.turn_used_tools = False
+
+    @abstractmethod
+    async def create_thread(self) -> None:
+        """Prepares the conversation state for a new call."""
+
+    @abstractmethod
+    async def create_thread_message(self, content: str) -> None:
+        """Adds the caller's message as the start of a new turn."""
+
+    @abstractmethod
+    def run(
+        self, interrupt_event: asyncio.Event, tools_gate: Optional[asyncio.Event] = None
+    ) -> AsyncIterator[str]:
+        """Streams the assistant's response to the current turn sentence by sentence."""
+
+    @abstractmethod
+    async def record_turn(self, answer: str) -> None:
+        """Adds the answer given without the model (e.g. from a cache) to the current turn."""
+
+    @abstractmethod
+    async def discard_turn(self) -> None:
+        """Removes the current, already interrupted, turn from the conversation."""
+
+    @abstractmethod
+    async def rewrite_turn_message(self, content: str) -> None:
+        """Replaces the caller's message of the current, finished, turn with `content`."""
+
+    @abstractmethod
+    async def truncate_turn(self, heard: str) -> None:
+        """Replaces the answer to the current, interrupted, turn with the part the caller heard."""
+
+    @abstractmethod
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        """Returns `summary` updated with what `messages` add to it."""
+
+    async def compact_history(self) -> None:
+        """Folds the oldest messages into the summary once the history outgrows its budget."""
+        if self.history.needs_compaction():
+            await self.history.compact(self.summarize)
+
+    def close(self) -> None:
+        """Releases what the conversation state holds once the call has ended."""
+        self.call_conversation.close()
+
+    def _knowledge_instructions(self, bot_id: str) -> Optional[str]:
+        """Passages from the bot's documents relevant to the caller's latest message, if any"""
+        if not settings.RETRIEVAL_ENABLED:
+            return None
+        query = self.call_conversation.last_content("user") or ""
+        passages = knowledge_base.search(bot_id, query)
+        return format_passages(passages) if passages else None
+
+    def _start_turn_metrics(self, prompt_tokens: Optional[int] = None) -> TurnMetrics:
+        self._turn_index += 1
+        self.turn_used_tools = False
+        metrics = TurnMetrics(
+            turn_index=self._turn_index, requested_at=time.monotonic(), prompt_tokens=prompt_tokens
+        )
+        self.turn_metrics.append(metrics)
+        llm_turn_totals.record_request(metrics)
+        current_trace.get().mark(Stage.LLM_REQUEST)
+        return metrics
+
+    def _record_first_token(self, metrics: TurnMetrics) -> None:
+        if metrics.first_token_at is None:
+            metrics.first_token_at = time.monotonic()
+            llm_turn_totals.record_first_token(metrics)
+            current_trace.get().mark(Stage.LLM_FIRST_TOKEN)
+            logger.info(
+                f"LLM first token after {metrics.time_to_first_token:.3f}s "
+                f"(turn {metrics.turn_index}, {metrics.prompt_tokens} prompt tokens, "
+                f"{type(self).__name__})"
+            )
@@ -0,0 +1,77 @@
+import asyncio
+import gc
+import sys
+import types
+from collections import deque
+from typing import Optional, Set
+
+# Followed into: containers, the app's own objects and the per-call asyncio machinery
+_CONTAINER_TYPES = (dict, list, tuple, set, frozenset, deque)
+_RUNTIME_TYPES = (
+    types.CoroutineType,
+    types.AsyncGeneratorType,
+    types.GeneratorType,
+    types.FrameType,
+    types.MethodType,
+    types.CellType,
+)
+_FOLLOWED_MODULES = ("app.", "asyncio.")
+# Never counted: code and definitions are shared by every call
+_OPAQUE_TYPES = (
+    types.ModuleType,
+    type,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.CodeType,
+)
+
+
+def shared_ids() -> Set[int]:
+    """Objects every call shares: module namespaces, what they hold, and the event loop"""
+    shared: Set[int] = set()
+    for name, module in list(sys.modules.items()):
+        namespace = getattr(module, "__dict__", None)
+        if namespace is None:
+            continue
+        shared.add(id(namespace))
+        if name == "app" or name.startswith("app."):
+            # Module-level singletons: settings, the provider pool, caches, ...
+            shared.update(id(value) for value in namespace.values())
+    try:
+        shared.add(id(asyncio.get_running_loop()))
+    except RuntimeError:
+        pass
+    return shared
+
+
+def _followed(obj: object) -> bool:
+    if isinstance(obj, _CONTAINER_TYPES + _RUNTIME_TYPES):
+        return True
+    return type(obj).__module__.startswith(_FOLLOWED_MODULES)
+
+
+def owned_bytes(root: object, shared: Optional[Set[int]] = None) -> int:
+    """
+    Approximate bytes of memory held by `root` for itself.
+
+    Walks the references of `root` through containers, the app's objects and
+    the tasks, coroutines and frames working for it. The walk stops at anything
+    shared between calls: module-level objects, the event loop, code, and the
+    ids in `shared` (from `shared_ids`, computed once when sizing many roots).
+    Third-party objects (a websocket, an SDK client) count at their shallow
+    size, without their internals.
+    """
+    if shared is None:
+        shared = shared_ids()
+    seen: Set[int] = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or id(obj) in shared or isinstance(obj, _OPAQUE_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if _followed(obj):
+            stack.extend(gc.get_referents(obj))
+    return total
@@ -1,18 +1,97 @@
 import asyncio
 import json
-from pdb import run
-from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Type
 
-from openai import AsyncOpenAI, OpenAIError
+from openai import NOT_GIVEN, AsyncOpenAI, OpenAIError
+from openai.types.beta import AssistantStreamEvent
 from openai.types.beta.threads import RequiredActionFunctionToolCall, Run
 from openai.types.beta.threads.run_submit_tool_outputs_params import ToolOutput
 
 from app.logger import logger
 from app.services import custom_functions
+from app.services.cache import TTLCache
+from app.services.history import SUMMARY_PREFIX
+from app.services.llm import LLMBackend, TurnMetrics
+from app.services.tasks import CallTaskGroup
+from app.services.tokens import count_message_tokens
 from app.settings import settings
 
+TOOL_CALL_FILLER_MESSAGE = "I'm working on your request. Please wait..."
+RUN_ERROR_MESSAGE = "Error processing your request. Please try again later."
+TOOL_ERROR_MESSAGE = "Unexpected Error Occurred. Please try again later."
+SUMMARY_INSTRUCTIONS = (
+    "You keep the running summary of a phone call between a caller and an assistant. "
+    "Update the summary with the new messages, in a few short sentences: keep who the caller "
+    "is, their details and requests, the answers given and anything agreed or promised. "
+    "Reply with the summary only."
+)
 
-class OpenAIAssistant:
+
+async def execute_tool_call(
+    function_name: str, arguments: str, bot_id: str, call_conversation: List[Dict[str, str]]
+) -> str:
+    """
+    Runs the custom function requested by a tool call.
+
+    Args:
+        function_name: Name of the function in `custom_functions`.
+        arguments: JSON encoded arguments produced by the model.
+        bot_id: ID of the bot handling the call.
+        call_conversation: The conversation as the model sees it (summary and latest messages),
+            forwarded to the function.
+
+    Returns:
+        The function output to hand back to the model.
+    """
+    try:
+        args = json.loads(arguments)
+        logger.info(f"Processing tool call with args: {args}")
+
+        # Registered tools share the pooled HTTP client, timeouts, retries and circuit breaking
+        return await custom_functions.call_tool(
+            function_name,
+            name=args.get("name"),
+            email=args.get("email"),
+            phone=args.get("phone"),
+            bot_id=bot_id,
+            call_conversation=call_conversation,
+        )
+    except (KeyError, ValueError, TypeError) as e:
+        logger.error(f"Error processing tool call {function_name}: {e}")
+        return TOOL_ERROR_MESSAGE
+
+
+async def summarize_conversation(
+    client: AsyncOpenAI, summary: str, messages: List[Dict[str, str]]
+) -> str:
+    """
+    Updates the running summary of a call with HISTORY_SUMMARY_MODEL.
+
+    Args:
+        client: The OpenAI client of the call.
+        summary: The summary so far, empty at first.
+        messages: The messages to add to it, oldest first.
+
+    Returns:
+        The updated summary.
+    """
+    new_messages = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    response = await client.chat.completions.create(
+        model=settings.HISTORY_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {
+                "role": "user",
+                "content": f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{new_messages}",
+            },
+        ],
+        max_tokens=settings.HISTORY_SUMMARY_MAX_TOKENS,
+    )
+    return response.choices[0].message.content or summary
+
+
+class OpenAIAssistant(LLMBackend):
     """
     Class to interact with OpenAI API for handling assistant conversations, including thread creation,
     message submission, and action processing.
@@ -24,7 +103,12 @@ class OpenAIAssistant:
     """
 
     def __init__(
-        self, bot_id: str, gpt_assistant_id: str, gpt_vector_store_id: Optional[str] = None
+        self,
+        bot_id: str,
+        gpt_assistant_id: str,
+        gpt_vector_store_id: Optional[str] = None,
+        client: Optional[AsyncOpenAI] = None,
+        tasks: Optional[CallTaskGroup] = None,
     ):
         """
         Initializes the OpenAIAssistant instance.
@@ -33,14 +117,22 @@ class OpenAIAssistant:
             bot_id: ID of the bot.
             gpt_assistant_id: ID of the GPT assistant.
             gpt_vector_store_id: Optional vector store ID for advanced querying.
+            client: Optional shared OpenAI client; a dedicated one is created if omitted.
+            tasks: Optional task group of the call, which tool calls run in.
         """
-        self.__client: AsyncOpenAI = AsyncOpenAI(api_key=settings.OPEN_AI_API_KEY)
+        super().__init__(tasks)
+        self.__client: AsyncOpenAI = client or AsyncOpenAI(
+            api_key=settings.OPEN_AI_API_KEY, base_url=settings.OPEN_AI_BASE_URL
+        )
         self.__assistant_id: str = gpt_assistant_id
         self.__bot_id: str = bot_id
         self.__vector_store_id: Optional[str] = gpt_vector_store_id
         self.__thread_id: Optional[str] = None
         self.__run_id: Optional[str] = None
-        self.call_conversation: List[Dict[str, str]] = []
+        self.__last_run_id: Optional[str] = None
+        # Thread messages and conversation entries added by the current turn, see discard_turn
+        self.__turn_message_ids: List[str] = []
+        self.__turn_conversation_index: int = 0
 
     def __append_call_conversation(self, role: Literal["user", "assistant"], content: str) -> None:
         """
@@ -50,7 +142,7 @@ class OpenAIAssistant:
             role: The role of the message sender, either 'user' or 'assistant'.
             content: The content of the message.
         """
-        self.call_conversation.append({"role": role, "content": content})
+        self.call_conversation.append(role, content)
 
     async def create_thread(self) -> None:
         """
@@ -71,16 +163,41 @@ class OpenAIAssistant:
             content: The content of the user's message.
         """
         try:
+            self.__turn_conversation_index = len(self.call_conversation)
+            self.__turn_message_ids = []
             self.__append_call_conversation("user", content)
-            await self.__client.beta.threads.messages.create(
+            message = await self.__client.beta.threads.messages.create(
                 self.__thread_id,
                 role="user",
                 content=content,
             )
+            self.__turn_message_ids.append(message.id)
         except OpenAIError as e:
             logger.error(f"Failed to send message: {e}")
             raise
 
+    async def record_turn(self, answer: str) -> None:
+        """
+        Adds an answer given without a run to the current turn, in the thread and the
+        conversation log, so that truncate_turn can replace it like a run's answer.
+
+        Args:
+            answer: The answer given to the user.
+        """
+        try:
+            self.__append_call_conversation("assistant", answer)
+            message = await self.__client.beta.threads.messages.create(
+                self.__thread_id,
+                role="assistant",
+                content=answer,
+            )
+            self.__turn_message_ids.append(message.id)
+        except OpenAIError as e:
+            logger.error(f"Failed to record answered turn: {e}")
+
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        return await summarize_conversation(self.__client, summary, messages)
+
     async def process_tool_call(self, tool_call: RequiredActionFunctionToolCall) -> Dict[str, Any]:
         """
         Processes an individual tool call from the required actions.
@@ -91,135 +208,540 @@ class OpenAIAssistant:
         Returns:
             A dictionary containing the tool call ID and the result output.
         """
-        try:
-            args = json.loads(tool_call.function.arguments)
-            logger.info(f"Processing tool call with args: {args}")
-            function_name = tool_call.function.name
-
-            # Fetching custom function based on tool call name
-            if hasattr(custom_functions, function_name):
-                function_to_call = getattr(custom_functions, function_name)
-            else:
-                raise ValueError(f"Function {function_name} not found")
-
-            output = await function_to_call(
-                name=args.get("name"),
-                email=args.get("email"),
-                phone=args.get("phone"),
-                bot_id=self.__bot_id,
-                call_conversation=self.call_conversation,
-            )
-        except (KeyError, ValueError, TypeError) as e:
-            logger.error(f"Error processing tool call {tool_call['function']['name']}: {e}")
-            output = "Unexpected Error Occurred. Please try again later."
-
+        output = await execute_tool_call(
+            tool_call.function.name,
+            tool_call.function.arguments,
+            self.__bot_id,
+            self.history.prompt_messages(),
+        )
         return {"tool_call_id": tool_call.id, "output": output}
 
-    async def handle_action_required(self, data: Run) -> Optional[str]:
+    async def handle_action_required(self, data: Run) -> List[ToolOutput]:
         """
-        Handles required actions by processing tool calls and submitting outputs.
+        Runs the tool calls of a run that requires action, concurrently.
 
         Args:
             data: The event data containing required actions.
 
         Returns:
-            Optional string of the assistant's response after processing tool outputs.
+            The outputs to submit, one per tool call.
         """
+        logger.info("Action Required: Processing tool calls.")
+        self.turn_used_tools = True
+        tool_calls: List[RequiredActionFunctionToolCall] = (
+            data.required_action.submit_tool_outputs.tool_calls
+        )
         try:
-            logger.info("Action Required: Processing tool calls.")
-            tool_calls: List[RequiredActionFunctionToolCall] = (
-                data.required_action.submit_tool_outputs.tool_calls
-            )
-            tool_outputs: List[ToolOutput] = await asyncio.gather(
+            return await asyncio.gather(
                 *[self.process_tool_call(tool_call) for tool_call in tool_calls]
             )
-            return await self.submit_tool_outputs(tool_outputs)
         except Exception as e:
             logger.error(f"Error processing required action: {e}")
-            return "Error processing required action."
-
-    async def submit_tool_outputs(self, tool_outputs: List[ToolOutput]) -> Optional[str]:
+            return [
+                {"tool_call_id": tool_call.id, "output": TOOL_ERROR_MESSAGE}
+                for tool_call in tool_calls
+            ]
+
+    async def submit_tool_outputs(
+        self,
+        tool_outputs: List[ToolOutput],
+        interrupt_event: asyncio.Event,
+        tools_gate: Optional[asyncio.Event],
+        metrics: TurnMetrics,
+    ) -> AsyncIterator[str]:
         """
-        Submits tool outputs and handles the response stream.
+        Submits tool outputs and streams the rest of the run.
 
         Args:
             tool_outputs: A list of processed tool outputs.
+            interrupt_event: An asyncio event to detect if the conversation should be interrupted.
+            tools_gate: Optional event that must be set before further tool calls are executed.
+            metrics: Metrics of the current turn.
 
-        Returns:
-            The final content response from the assistant.
+        Yields:
+            The assistant's follow-up response, sentence by sentence.
+        """
+        async with self.__client.beta.threads.runs.submit_tool_outputs_stream(
+            run_id=self.__run_id,
+            thread_id=self.__thread_id,
+            tool_outputs=tool_outputs,
+        ) as stream:
+            async for sentence in self.__stream_run(stream, interrupt_event, tools_gate, metrics):
+                yield sentence
+
+    async def discard_turn(self) -> None:
+        """
+        Removes the current turn from the thread and the conversation log.
+
+        Used when a speculative response is thrown away: the run must already be
+        interrupted. Waits for the run to stop, then deletes the user message and
+        any partial assistant message it created.
         """
         try:
-            stream: AsyncIterator[Run] = self.__client.beta.threads.runs.submit_tool_outputs_stream(
-                run_id=self.__run_id,
-                thread_id=self.__thread_id,
-                tool_outputs=tool_outputs,
-            )
+            if self.__last_run_id:
+                await self.__wait_for_run_to_finish(self.__last_run_id)
+            for message_id in self.__turn_message_ids:
+                await self.__client.beta.threads.messages.delete(
+                    message_id, thread_id=self.__thread_id
+                )
+        except OpenAIError as e:
+            logger.error(f"Failed to discard turn: {e}")
+        finally:
+            self.__turn_message_ids = []
+            self.call_conversation.truncate(self.__turn_conversation_index)
+
+    async def rewrite_turn_message(self, content: str) -> None:
+        """
+        Replaces the user message of the current turn in the thread and the conversation log.
+
+        Thread messages cannot be edited: once the run has stopped, the turn's
+        messages are deleted and added back, in order, with the new user message.
 
-            content = ""
-            async with stream as stream:
-                async for delta in stream.text_deltas:
-                    content = content.__add__(delta)
-            return content
+        Args:
+            content: The new content of the user's message.
+        """
+        answers = self.call_conversation.messages(self.__turn_conversation_index + 1)
+        try:
+            if self.__last_run_id:
+                await self.__wait_for_run_to_finish(self.__last_run_id)
+            for message_id in self.__turn_message_ids:
+                await self.__client.beta.threads.messages.delete(
+                    message_id, thread_id=self.__thread_id
+                )
+            self.__turn_message_ids = []
+            for role, text in [("user", content)] + [
+                ("assistant", answer["content"]) for answer in answers
+            ]:
+                message = await self.__client.beta.threads.messages.create(
+                    self.__thread_id, role=role, content=text
+                )
+                self.__turn_message_ids.append(message.id)
         except OpenAIError as e:
-            logger.error(f"Error submitting tool outputs: {e}")
-            return None
+            logger.error(f"Failed to rewrite turn message: {e}")
+        finally:
+            self.call_conversation.replace(self.__turn_conversation_index, content)
 
-    async def run(self, interrupt_event: asyncio.Event) -> AsyncIterator[str]:
+    async def truncate_turn(self, heard: str) -> None:
+        """
+        Replaces the answer to the current turn with the part the caller heard.
+
+        The run is stopped if it is still going, the assistant messages it created
+        are deleted, and what was heard is added back as the answer, so the next
+        turn does not assume the caller heard sentences that were never played.
+
+        Args:
+            heard: The sentences that played before the caller interrupted.
+        """
+        try:
+            if self.__last_run_id:
+                try:
+                    await self.__client.beta.threads.runs.cancel(
+                        thread_id=self.__thread_id, run_id=self.__last_run_id
+                    )
+                except OpenAIError:
+                    pass  # Already finished
+                await self.__wait_for_run_to_finish(self.__last_run_id)
+            for message_id in self.__turn_message_ids[1:]:
+                await self.__client.beta.threads.messages.delete(
+                    message_id, thread_id=self.__thread_id
+                )
+            if heard:
+                await self.__client.beta.threads.messages.create(
+                    self.__thread_id, role="assistant", content=heard
+                )
+        except OpenAIError as e:
+            logger.error(f"Failed to truncate interrupted turn: {e}")
+        finally:
+            self.__turn_message_ids = self.__turn_message_ids[:1]
+            self.call_conversation.truncate(self.__turn_conversation_index + 1)
+            if heard:
+                self.__append_call_conversation("assistant", heard)
+
+    async def __wait_for_run_to_finish(self, run_id: str) -> None:
+        """
+        Polls the run until it reaches a terminal state, so the thread accepts new messages.
+
+        Args:
+            run_id: ID of the run to wait for.
+        """
+        for _ in range(settings.OPEN_AI_RUN_CANCEL_POLLS):
+            run = await self.__client.beta.threads.runs.retrieve(run_id, thread_id=self.__thread_id)
+            if run.status not in ("queued", "in_progress", "cancelling", "requires_action"):
+                return
+            await asyncio.sleep(settings.OPEN_AI_RUN_CANCEL_POLL_SECONDS)
+
+    async def __stream_run(
+        self,
+        stream: AsyncIterator[AssistantStreamEvent],
+        interrupt_event: asyncio.Event,
+        tools_gate: Optional[asyncio.Event],
+        metrics: TurnMetrics,
+    ) -> AsyncIterator[str]:
+        """
+        Turns the events of a run into sentences, following it through tool calls.
+
+        Tool calls start running before the filler message is yielded, so they
+        execute while the filler plays. The answer after the tool calls is streamed
+        with the same delimiter buffering as the rest of the run.
+        """
+        buffer = ""
+        delimiters = tuple(settings.OPEN_AI_DELIMITERS)  # Natural breakpoints for smoother speaking
+
+        async for event in stream:
+            if event.event.startswith("thread.run.") and not event.event.startswith(
+                "thread.run.step."
+            ):
+                self.__run_id = event.data.id
+                self.__last_run_id = event.data.id
+
+            # Handling interruption
+            if interrupt_event and interrupt_event.is_set():
+                break
+
+            match event.event:
+                case "thread.message.created":
+                    self.__turn_message_ids.append(event.data.id)
+                case "thread.run.requires_action":
+                    if tools_gate is not None:
+                        await tools_gate.wait()
+                        if interrupt_event and interrupt_event.is_set():
+                            break
+                    if buffer:
+                        yield buffer.strip()
+                        buffer = ""
+                    # Shielded: side effects such as an escalation complete even on barge-in
+                    tool_outputs = self._tasks.spawn_shielded(
+                        self.handle_action_required(event.data), "tool calls"
+                    )
+                    yield TOOL_CALL_FILLER_MESSAGE
+                    outputs = await tool_outputs
+                    if interrupt_event and interrupt_event.is_set():
+                        break
+                    async for sentence in self.submit_tool_outputs(
+                        outputs, interrupt_event, tools_gate, metrics
+                    ):
+                        yield sentence
+                    break
+                case "thread.message.delta":
+                    content = event.data.delta.content[0].text.value
+                    if content:
+                        self._record_first_token(metrics)
+                        buffer += content
+                        if buffer.endswith(delimiters):
+                            yield buffer.strip()
+                            buffer = ""
+                case "thread.message.completed":
+                    self.__append_call_conversation("assistant", event.data.content[0].text.value)
+                    if buffer:
+                        yield buffer.strip()
+                    self.__run_id = None
+                    break
+
+    async def run(
+        self, interrupt_event: asyncio.Event, tools_gate: Optional[asyncio.Event] = None
+    ) -> AsyncIterator[str]:
         """
         Main method to process and handle the assistant's conversation in real-time.
 
         Args:
             interrupt_event: An asyncio event to detect if the conversation should be interrupted.
+            tools_gate: Optional event that must be set before tool calls are executed. Speculative
+                runs use it so tools only run once the response is kept.
 
         Yields:
             The assistant's response as strings.
         """
         try:
+            window = self.history.window()
+            knowledge = self._knowledge_instructions(self.__bot_id)
+            summary = SUMMARY_PREFIX + self.history.summary if self.history.summary else None
+            instructions = "\n".join(filter(None, (knowledge, summary)))
+            metrics = self._start_turn_metrics(
+                self.history.prompt_tokens(window)
+                + (count_message_tokens(knowledge) if knowledge else 0)
+            )
             stream = await self.__client.beta.threads.runs.create(
-                thread_id=self.__thread_id, assistant_id=self.__assistant_id, stream=True
+                thread_id=self.__thread_id,
+                assistant_id=self.__assistant_id,
+                additional_instructions=instructions or NOT_GIVEN,
+                # The thread keeps every message; the model only sees the window of the history
+                truncation_strategy=(
+                    NOT_GIVEN
+                    if self.history.covers_call(window)
+                    else {"type": "last_messages", "last_messages": len(window)}
+                ),
+                stream=True,
             )
 
-            buffer = ""
-            delimiters = tuple(
-                settings.OPEN_AI_DELIMITERS
-            )  # Natural breakpoints for smoother speaking
-
-            async for event in stream:
-                self.__run_id = event.data.id
-
-                # Handling interruption
-                if interrupt_event and interrupt_event.is_set():
-                    break
-
-                match event.event:
-                    case "thread.run.requires_action":
-                        yield "I'm working on your request. Please wait..."
-                        data = await self.handle_action_required(event.data)
-                        yield data
-                    case "thread.message.delta":
-                        content = event.data.delta.content[0].text.value
-                        if content:
-                            buffer += content
-                            if buffer.endswith(delimiters):
-                                yield buffer.strip()
-                                buffer = ""
-                    case "thread.message.completed":
-                        self.__append_call_conversation(
-                            "assistant", event.data.content[0].text.value
-                        )
-                        if buffer:
-                            yield buffer.strip()
-                        self.__run_id = None
-                        break
+            async for sentence in self.__stream_run(stream, interrupt_event, tools_gate, metrics):
+                yield sentence
 
-            if interrupt_event and interrupt_event.is_set():
+            if interrupt_event and interrupt_event.is_set() and self.__run_id:
                 await self.__client.beta.threads.runs.cancel(
                     thread_id=self.__thread_id, run_id=self.__run_id
                 )
                 self.__run_id = None
         except OpenAIError as e:
             logger.error(f"OpenAI error during conversation run: {e}")
-            yield "Error processing your request. Please try again later."
+            yield RUN_ERROR_MESSAGE
         except asyncio.CancelledError:
             logger.info("Conversation task was cancelled.")
             self.__run_id = None
+            raise
+
+
+@dataclass(slots=True)
+class ChatCompletionsConfig:
+    model: str
+    instructions: str
+    tools: List[Dict[str, Any]]
+
+
+# Model, instructions and function tools of each assistant, shared by every call
+_chat_completions_configs: TTLCache[str, ChatCompletionsConfig] = TTLCache(
+    max_size=settings.BOT_CACHE_MAX_SIZE, ttl_seconds=settings.BOT_CACHE_TTL_SECONDS
+)
+
+
+class OpenAIChatCompletions(LLMBackend):
+    """
+    Low-latency backend streaming Chat Completions with locally kept history.
+
+    Each turn is a single streaming request, instead of the message, run and
+    scheduling round trips of the Assistants API. The model, instructions and
+    function tools are read from the bot's assistant so both backends behave alike.
+    Hosted tools such as file_search are not available through Chat Completions.
+
+    Attributes:
+        bot_id: ID of the bot using the assistant.
+        gpt_assistant_id: ID of the OpenAI GPT assistant holding the bot's configuration.
+    """
+
+    # The history is local: a cancelled request leaves nothing to clean up at OpenAI
+    cancels_cleanly = True
+
+    def __init__(
+        self,
+        bot_id: str,
+        gpt_assistant_id: str,
+        gpt_vector_store_id: Optional[str] = None,
+        client: Optional[AsyncOpenAI] = None,
+        tasks: Optional[CallTaskGroup] = None,
+    ):
+        """
+        Initializes the OpenAIChatCompletions instance.
+
+        Args:
+            bot_id: ID of the bot.
+            gpt_assistant_id: ID of the GPT assistant to read the configuration from.
+            gpt_vector_store_id: Unused; accepted for parity with OpenAIAssistant.
+            client: Optional shared OpenAI client; a dedicated one is created if omitted.
+            tasks: Optional task group of the call, which tool calls run in.
+        """
+        super().__init__(tasks)
+        self.__client: AsyncOpenAI = client or AsyncOpenAI(
+            api_key=settings.OPEN_AI_API_KEY, base_url=settings.OPEN_AI_BASE_URL
+        )
+        self.__assistant_id: str = gpt_assistant_id
+        self.__bot_id: str = bot_id
+        self.__config: Optional[ChatCompletionsConfig] = None
+        self.__turn_conversation_index: int = 0
+
+    async def create_thread(self) -> None:
+        """
+        Loads the assistant configuration used for every request of the call.
+        """
+        entry = _chat_completions_configs.get(self.__assistant_id)
+        if entry is not None:
+            self.__config = entry.value
+            return
+        try:
+            assistant = await self.__client.beta.assistants.retrieve(self.__assistant_id)
+        except OpenAIError as e:
+            logger.error(f"Failed to load assistant configuration: {e}")
+            raise
+        self.__config = ChatCompletionsConfig(
+            model=assistant.model,
+            instructions=assistant.instructions or "",
+            tools=[
+                {"type": "function", "function": tool.function.model_dump(exclude_none=True)}
+                for tool in assistant.tools
+                if tool.type == "function"
+            ],
+        )
+        _chat_completions_configs.set(self.__assistant_id, self.__config)
+
+    async def summarize(self, summary: str, messages: List[Dict[str, str]]) -> str:
+        return await summarize_conversation(self.__client, summary, messages)
+
+    async def create_thread_message(self, content: str) -> None:
+        """
+        Appends the user's message to the conversation log.
+
+        Args:
+            content: The content of the user's message.
+        """
+        self.__turn_conversation_index = len(self.call_conversation)
+        self.call_conversation.append("user", content)
+
+    async def record_turn(self, answer: str) -> None:
+        """
+        Appends an answer given without the model to the current turn in the conversation log.
+
+        Args:
+            answer: The answer given to the user.
+        """
+        self.call_conversation.append("assistant", answer)
+
+    async def discard_turn(self) -> None:
+        """
+        Removes the current turn from the conversation log.
+        """
+        self.call_conversation.truncate(self.__turn_conversation_index)
+
+    async def rewrite_turn_message(self, content: str) -> None:
+        """
+        Replaces the user message of the current turn in the conversation log.
+
+        Args:
+            content: The new content of the user's message.
+        """
+        self.call_conversation.replace(self.__turn_conversation_index, content)
+
+    async def truncate_turn(self, heard: str) -> None:
+        """
+        Replaces the answer to the current turn in the conversation log with the part
+        the caller heard.
+
+        Args:
+            heard: The sentences that played before the caller interrupted.
+        """
+        self.call_conversation.truncate(self.__turn_conversation_index + 1)
+        if heard:
+            self.call_conversation.append("assistant", heard)
+
+    async def run(
+        self, interrupt_event: asyncio.Event, tools_gate: Optional[asyncio.Event] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streams the response to the current turn, running tool calls as the model requests them.
+
+        Args:
+            interrupt_event: An asyncio event to detect if the conversation should be interrupted.
+            tools_gate: Optional event that must be set before tool calls are executed.
+
+        Yields:
+            The assistant's response as strings.
+        """
+        instructions = self.__config.instructions
+        knowledge = self._knowledge_instructions(self.__bot_id)
+        if knowledge:
+            instructions = f"{instructions}\n{knowledge}"
+        window = self.history.window()
+        messages: List[Dict[str, Any]] = [
+            {"role": "system", "content": instructions},
+            *self.history.prompt_messages(window),
+        ]
+        delimiters = tuple(settings.OPEN_AI_DELIMITERS)
+        metrics = self._start_turn_metrics(
+            count_message_tokens(instructions) + self.history.prompt_tokens(window)
+        )
+        try:
+            while True:
+                stream = await self.__client.chat.completions.create(
+                    model=self.__config.model,
+                    messages=messages,
+                    tools=self.__config.tools or NOT_GIVEN,
+                    stream=True,
+                )
+
+                buffer = ""
+                content = ""
+                tool_calls: Dict[int, Dict[str, Any]] = {}
+                async for chunk in stream:
+                    if interrupt_event and interrupt_event.is_set():
+                        break
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        self._record_first_token(metrics)
+                        content += delta.content
+                        buffer += delta.content
+                        if buffer.endswith(delimiters):
+                            yield buffer.strip()
+                            buffer = ""
+                    for tool_call in delta.tool_calls or []:
+                        call = tool_calls.setdefault(
+                            tool_call.index, {"id": "", "name": "", "arguments": ""}
+                        )
+                        call["id"] += tool_call.id or ""
+                        if tool_call.function:
+                            call["name"] += tool_call.function.name or ""
+                            call["arguments"] += tool_call.function.arguments or ""
+
+                if interrupt_event and interrupt_event.is_set():
+                    await stream.close()
+                    return
+                if buffer:
+                    yield buffer.strip()
+                if not tool_calls:
+                    self.call_conversation.append("assistant", content)
+                    return
+
+                if tools_gate is not None:
+                    await tools_gate.wait()
+                    if interrupt_event and interrupt_event.is_set():
+                        return
+                logger.info("Action Required: Processing tool calls.")
+                self.turn_used_tools = True
+                calls = [tool_calls[index] for index in sorted(tool_calls)]
+                # Tools run while the filler plays; shielded so side effects complete on barge-in
+                tool_outputs = self._tasks.spawn_shielded(
+                    self.__execute_tool_calls(calls), "tool calls"
+                )
+                yield TOOL_CALL_FILLER_MESSAGE
+                outputs = await tool_outputs
+                if interrupt_event and interrupt_event.is_set():
+                    return
+                messages.append(
+                    {
+                        "role": "assistant",
+                        "content": content or None,
+                        "tool_calls": [
+                            {
+                                "id": call["id"],
+                                "type": "function",
+                                "function": {"name": call["name"], "arguments": call["arguments"]},
+                            }
+                            for call in calls
+                        ],
+                    }
+                )
+                messages.extend(
+                    {"role": "tool", "tool_call_id": call["id"], "content": output}
+                    for call, output in zip(calls, outputs)
+                )
+        except OpenAIError as e:
+            logger.error(f"OpenAI error during conversation run: {e}")
+            yield RUN_ERROR_MESSAGE
+        except asyncio.CancelledError:
+            logger.info("Conversation task was cancelled.")
+            raise
+
+    async def __execute_tool_calls(self, calls: List[Dict[str, Any]]) -> List[str]:
+        """Runs the tool calls of a response concurrently; returns their outputs, in order"""
+        return await asyncio.gather(
+            *[
+                execute_tool_call(
+                    call["name"], call["arguments"], self.__bot_id, self.history.prompt_messages()
+                )
+                for call in calls
+            ]
+        )
+
+
+LLM_BACKENDS: Dict[str, Type[LLMBackend]] = {
+    "assistants": OpenAIAssistant,
+    "chat_completions": OpenAIChatCompletions,
+}
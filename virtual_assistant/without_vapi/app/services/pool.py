@@ -0,0 +1,187 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.logger import logger
+from app.services.deepgram import SpeechToText
+from app.services.http import ToolHTTPClient
+from app.settings import settings
+
+
+class ProviderPool:
+    """
+    Process-wide pool of provider connections shared by every call on the worker.
+
+    Deepgram TTS and OpenAI requests go through shared HTTP/2 clients, so a call
+    reuses warm TLS connections instead of opening its own. Deepgram STT needs a
+    dedicated websocket per call, so the pool keeps a few pre-opened connections
+    ready to lease on `ConversationManager.start()`. A released STT connection is
+    closed rather than reused because it carries the previous caller's audio
+    context; the pool opens a replacement in the background.
+
+    Attributes:
+        stt_handshakes: Number of STT websockets opened by the pool.
+        http_handshakes: Number of TCP connections opened by the shared HTTP clients.
+    """
+
+    def __init__(self) -> None:
+        self._tts_http_client: Optional[httpx.AsyncClient] = None
+        self._openai_client: Optional[AsyncOpenAI] = None
+        self._tool_http_client: Optional[httpx.AsyncClient] = None
+        self._tool_http: Optional[ToolHTTPClient] = None
+
+        self._warm_stt: asyncio.Queue[SpeechToText] = asyncio.Queue()
+        self._stt_slots = asyncio.Semaphore(settings.PROVIDER_POOL_STT_MAX_CONNECTIONS)
+        self._refill_task: Optional[asyncio.Task] = None
+        self._active_stt = 0
+
+        self.stt_handshakes = 0
+        self.http_handshakes = 0
+        self.stt_leases = 0
+        self.stt_wait_seconds_total = 0.0
+        self.stt_wait_seconds_max = 0.0
+
+    def _new_http_client(self, **kwargs: Any) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=settings.PROVIDER_POOL_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.PROVIDER_POOL_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=settings.PROVIDER_POOL_HTTP_KEEPALIVE_SECONDS,
+            ),
+            event_hooks={"request": [self._attach_trace]},
+            **kwargs,
+        )
+
+    async def _attach_trace(self, request: httpx.Request) -> None:
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.http_handshakes += 1
+
+    @property
+    def tts_http_client(self) -> httpx.AsyncClient:
+        if self._tts_http_client is None:
+            self._tts_http_client = self._new_http_client(
+                headers={"Authorization": f"Token {settings.DEEPGRAM_SECRET_KEY}"},
+                timeout=httpx.Timeout(settings.TTS_REQUEST_TIMEOUT_SECONDS),
+            )
+        return self._tts_http_client
+
+    @property
+    def openai_client(self) -> AsyncOpenAI:
+        if self._openai_client is None:
+            self._openai_client = AsyncOpenAI(
+                api_key=settings.OPEN_AI_API_KEY,
+                base_url=settings.OPEN_AI_BASE_URL,
+                http_client=self._new_http_client(),
+            )
+        return self._openai_client
+
+    @property
+    def tool_http(self) -> ToolHTTPClient:
+        if self._tool_http is None:
+            self._tool_http_client = self._new_http_client()
+            self._tool_http = ToolHTTPClient(self._tool_http_client)
+        return self._tool_http
+
+    async def start(self) -> None:
+        """Pre-open the warm STT connections"""
+        self._schedule_refill()
+
+    async def close(self) -> None:
+        if self._refill_task:
+            self._refill_task.cancel()
+        while not self._warm_stt.empty():
+            await self._warm_stt.get_nowait().stop()
+        if self._tts_http_client:
+            await self._tts_http_client.aclose()
+        if self._openai_client:
+            await self._openai_client.close()
+        if self._tool_http_client:
+            await self._tool_http_client.aclose()
+
+    async def _open_stt(self) -> SpeechToText:
+        stt = SpeechToText(keepalive=True)
+        if not await stt.start():
+            raise ConnectionError("Failed to open Deepgram STT connection")
+        self.stt_handshakes += 1
+        return stt
+
+    def _schedule_refill(self) -> None:
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self) -> None:
+        while self._warm_stt.qsize() < settings.PROVIDER_POOL_STT_WARM_SIZE:
+            try:
+                self._warm_stt.put_nowait(await self._open_stt())
+            except Exception as e:
+                logger.error(f"Failed to pre-open STT connection: {e}")
+                return
+
+    async def acquire_stt(self) -> SpeechToText:
+        """
+        Lease a started STT connection, waiting for a free slot if the pool is at capacity.
+
+        Raises:
+            TimeoutError: If no slot frees up within PROVIDER_POOL_ACQUIRE_TIMEOUT_SECONDS.
+        """
+        started_at = time.monotonic()
+        await asyncio.wait_for(
+            self._stt_slots.acquire(), timeout=settings.PROVIDER_POOL_ACQUIRE_TIMEOUT_SECONDS
+        )
+        try:
+            stt: Optional[SpeechToText] = None
+            while not self._warm_stt.empty():
+                candidate = self._warm_stt.get_nowait()
+                if await candidate.is_connected():
+                    stt = candidate
+                    break
+            if stt is None:
+                stt = await self._open_stt()
+        except BaseException:
+            self._stt_slots.release()
+            raise
+
+        self._schedule_refill()
+        waited = time.monotonic() - started_at
+        self.stt_wait_seconds_total += waited
+        self.stt_wait_seconds_max = max(self.stt_wait_seconds_max, waited)
+        self.stt_leases += 1
+        self._active_stt += 1
+        return stt
+
+    async def release_stt(self, stt: SpeechToText) -> None:
+        try:
+            # Deepgram flushes the final transcript before closing; don't wait on it forever
+            await asyncio.wait_for(stt.stop(), timeout=settings.CALL_SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("STT connection did not close in time")
+        finally:
+            self._active_stt -= 1
+            self._stt_slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "stt_active": self._active_stt,
+            "stt_warm": self._warm_stt.qsize(),
+            "stt_max": settings.PROVIDER_POOL_STT_MAX_CONNECTIONS,
+            "stt_leases": self.stt_leases,
+            "stt_handshakes": self.stt_handshakes,
+            "stt_wait_seconds_total": self.stt_wait_seconds_total,
+            "stt_wait_seconds_max": self.stt_wait_seconds_max,
+            "http_handshakes": self.http_handshakes,
+            **(
+                {f"tool_http_{key}": value for key, value in self._tool_http.stats().items()}
+                if self._tool_http
+                else {}
+            ),
+        }
+
+
+provider_pool = ProviderPool()
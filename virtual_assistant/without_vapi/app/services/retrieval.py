@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.logger import logger
+from app.services.supabase import download_bot_document, fetch_bot_documents_async
+from app.settings import settings
+
+# Document types whose bytes are readable text; other formats need a parser and are skipped
+TEXT_EXTENSIONS = (".txt", ".md", ".csv", ".json", ".html", ".htm")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+_ARRAYS = ("offsets", "postings", "term_frequencies", "chunk_lengths", "idf")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def chunk_text(text: str, words: int, overlap: int) -> List[str]:
+    """Split text into windows of `words` words, each sharing `overlap` words with the previous"""
+    tokens = text.split()
+    step = max(words - overlap, 1)
+    return [
+        " ".join(tokens[start : start + words])
+        for start in range(0, max(len(tokens) - overlap, 1), step)
+        if tokens[start : start + words]
+    ]
+
+
+@dataclass(slots=True)
+class Passage:
+    document_id: str
+    text: str
+    score: float
+
+
+class BM25Index:
+    """
+    Read-only BM25 index over the chunks of one bot's documents.
+
+    Postings are stored as flat numpy arrays in CSR layout: the chunks containing
+    term `t` are `postings[offsets[t]:offsets[t + 1]]`. The arrays are memory-mapped,
+    so loading an index is cheap and its pages are shared between worker processes.
+
+    Args:
+        path: Directory holding the index files written by `build`.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, "vocabulary.json")) as file:
+            self._vocabulary: Dict[str, int] = json.load(file)
+        with open(os.path.join(path, "chunks.json")) as file:
+            self._chunks: List[Tuple[str, str]] = json.load(file)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS
+        }
+        self._offsets = arrays["offsets"]
+        self._postings = arrays["postings"]
+        self._term_frequencies = arrays["term_frequencies"]
+        self._idf = arrays["idf"]
+        # Precompute the length normalisation of every chunk once per load
+        chunk_lengths = np.asarray(arrays["chunk_lengths"], dtype=np.float32)
+        average_length = float(chunk_lengths.mean()) if len(chunk_lengths) else 1.0
+        self._length_norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk_lengths / average_length)
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    @staticmethod
+    def build(path: str, chunks: List[Tuple[str, str]]) -> None:
+        """
+        Write an index for `(document_id, text)` chunks to `path`, replacing any previous one.
+
+        Files are written to a temporary directory and swapped in, so readers never
+        see a half-written index.
+        """
+        term_counts = [Counter(tokenize(text)) for _, text in chunks]
+        vocabulary = {
+            term: index
+            for index, term in enumerate(
+                sorted({term for counts in term_counts for term in counts})
+            )
+        }
+
+        postings: List[List[Tuple[int, int]]] = [[] for _ in vocabulary]
+        for chunk_index, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                postings[vocabulary[term]].append((chunk_index, count))
+
+        document_frequency = np.array([len(entries) for entries in postings], dtype=np.float32)
+        arrays = {
+            "offsets": np.concatenate(([0], np.cumsum(document_frequency, dtype=np.int64))),
+            "postings": np.array(
+                [chunk for entries in postings for chunk, _ in entries], dtype=np.int32
+            ),
+            "term_frequencies": np.array(
+                [count for entries in postings for _, count in entries], dtype=np.float32
+            ),
+            "chunk_lengths": np.array(
+                [sum(counts.values()) for counts in term_counts], dtype=np.float32
+            ),
+            "idf": np.log(
+                1 + (len(chunks) - document_frequency + 0.5) / (document_frequency + 0.5)
+            ).astype(np.float32),
+        }
+
+        staging = f"{path}.tmp"
+        os.makedirs(staging, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), array)
+        with open(os.path.join(staging, "vocabulary.json"), "w") as file:
+            json.dump(vocabulary, file)
+        with open(os.path.join(staging, "chunks.json"), "w") as file:
+            json.dump(chunks, file)
+
+        previous = f"{path}.old"
+        if os.path.isdir(path):
+            os.replace(path, previous)
+        os.replace(staging, path)
+        if os.path.isdir(previous):
+            for name in os.listdir(previous):
+                os.remove(os.path.join(previous, name))
+            os.rmdir(previous)
+
+    def search(self, query: str, top_k: int) -> List[Passage]:
+        term_ids = {self._vocabulary[term] for term in tokenize(query) if term in self._vocabulary}
+        if not term_ids or not self._chunks:
+            return []
+
+        scores = np.zeros(len(self._chunks), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            chunks = self._postings[start:end]
+            frequencies = self._term_frequencies[start:end]
+            scores[chunks] += (
+                self._idf[term_id]
+                * frequencies
+                * (BM25_K1 + 1)
+                / (frequencies + self._length_norm[chunks])
+            )
+
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            Passage(document_id=self._chunks[index][0], text=self._chunks[index][1], score=score)
+            for index, score in zip(best.tolist(), scores[best].tolist())
+            if score > 0
+        ]
+
+
+class KnowledgeBase:
+    """
+    Per-bot retrieval over the bot's `botDocuments`, served in-process.
+
+    Each bot has a directory under `index_dir` with a `documents.json` manifest
+    (content hash and chunks of every document) and the compiled `index`. A sync
+    downloads the bot's documents, re-chunks only those whose content hash
+    changed, and rebuilds the index from the manifest in a worker thread.
+
+    Args:
+        index_dir: Directory holding one sub-directory per bot.
+    """
+
+    def __init__(self, index_dir: str) -> None:
+        self.index_dir = index_dir
+        self._indexes: Dict[str, BM25Index] = {}
+        self._syncs: Dict[str, asyncio.Task] = {}
+
+        self.queries = 0
+        self.query_seconds_total = 0.0
+
+    def _bot_dir(self, bot_id: str) -> str:
+        return os.path.join(self.index_dir, bot_id)
+
+    def _index(self, bot_id: str) -> Optional[BM25Index]:
+        index = self._indexes.get(bot_id)
+        if index is None:
+            path = os.path.join(self._bot_dir(bot_id), "index")
+            try:
+                index = self._indexes[bot_id] = BM25Index(path)
+            except OSError:
+                # Not indexed yet, or an index is being swapped in
+                return None
+        return index
+
+    def search(
+        self, bot_id: str, query: str, top_k: int = settings.RETRIEVAL_TOP_K
+    ) -> List[Passage]:
+        """Return the passages most relevant to `query`, or none if the bot has no index yet"""
+        started_at = time.perf_counter()
+        index = self._index(bot_id)
+        passages = index.search(query, top_k) if index else []
+        self.queries += 1
+        self.query_seconds_total += time.perf_counter() - started_at
+        return passages
+
+    def sync(self, bot_id: str) -> asyncio.Task:
+        """Start (or join) a background re-index of the bot's documents"""
+        if bot_id not in self._syncs:
+
+            async def run() -> None:
+                try:
+                    await self._sync(bot_id)
+                except Exception as e:
+                    logger.error(f"Failed to index documents of bot {bot_id}: {e}")
+                finally:
+                    self._syncs.pop(bot_id, None)
+
+            self._syncs[bot_id] = asyncio.create_task(run())
+        return self._syncs[bot_id]
+
+    async def _sync(self, bot_id: str) -> None:
+        manifest_path = os.path.join(self._bot_dir(bot_id), "documents.json")
+        try:
+            with open(manifest_path) as file:
+                manifest: Dict[str, Dict] = json.load(file)
+        except FileNotFoundError:
+            manifest = {}
+
+        documents: Dict[str, Dict] = {}
+        changed = 0
+        for document in await fetch_bot_documents_async(bot_id):
+            document_id, path = str(document["id"]), document.get("path") or ""
+            if not path.lower().endswith(TEXT_EXTENSIONS):
+                logger.warning(f"Skipping document {document_id}: unsupported type {path}")
+                continue
+            content = await download_bot_document(path)
+            content_hash = hashlib.sha256(content).hexdigest()
+            previous = manifest.get(document_id)
+            if previous and previous["hash"] == content_hash:
+                documents[document_id] = previous
+                continue
+            documents[document_id] = {
+                "hash": content_hash,
+                "chunks": chunk_text(
+                    content.decode("utf-8", errors="ignore"),
+                    settings.RETRIEVAL_CHUNK_WORDS,
+                    settings.RETRIEVAL_CHUNK_OVERLAP_WORDS,
+                ),
+            }
+            changed += 1
+
+        removed = len(manifest.keys() - documents.keys())
+        if not changed and not removed and self._index(bot_id) is not None:
+            return
+
+        def build() -> None:
+            os.makedirs(self._bot_dir(bot_id), exist_ok=True)
+            chunks = [
+                (document_id, chunk)
+                for document_id, document in documents.items()
+                for chunk in document["chunks"]
+            ]
+            BM25Index.build(os.path.join(self._bot_dir(bot_id), "index"), chunks)
+            with open(f"{manifest_path}.tmp", "w") as file:
+                json.dump(documents, file)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
+
+        await asyncio.to_thread(build)
+        self._indexes.pop(bot_id, None)
+        logger.info(
+            f"Indexed documents of bot {bot_id}: {changed} changed, {removed} removed, "
+            f"{len(documents)} total"
+        )
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "indexes_loaded": len(self._indexes),
+            "queries": self.queries,
+            "query_ms_avg": (
+                self.query_seconds_total / self.queries * 1000 if self.queries else 0.0
+            ),
+        }
+
+
+def format_passages(passages: List[Passage]) -> str:
+    """Render passages as a prompt section, in the style of `Prompt.default_template`"""
+    excerpts = "\n".join(f"- {passage.text}" for passage in passages)
+    return (
+        "[KNOWLEDGE] Excerpts from the files that may help answer the user's latest message. "
+        f"Use them only if relevant.\n{excerpts}\n"
+    )
+
+
+knowledge_base = KnowledgeBase(index_dir=settings.RETRIEVAL_INDEX_DIR)
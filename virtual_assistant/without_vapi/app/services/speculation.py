@@ -0,0 +1,278 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, FrozenSet, Optional
+
+from app.logger import logger
+from app.services.llm import LLMBackend
+from app.settings import settings
+
+# Produces the assistant's response for a transcript: (transcript, interrupt_event, tools_gate)
+Responder = Callable[[str, asyncio.Event, asyncio.Event], AsyncIterator[str]]
+# Runs a coroutine as a task of the call, e.g. CallTaskGroup.spawn: (coroutine, name) -> task
+Spawner = Callable[[Coroutine[Any, Any, Any], str], asyncio.Task]
+
+_NON_WORD = re.compile(r"[^\w\s]")
+# Words that do not change what a question asks: articles, pronouns, auxiliaries, fillers
+_FILLER_WORDS = frozenset(
+    """
+    a an the um uh er ah hmm ok okay so well like just please thanks thank hi hello hey yeah yes
+    i me my you your we our us it its this that these those there is are was were be
+    been am do does did have has had can could would will should might
+    """.split()
+)
+# Words that carry the key detail of a question: days, dates, times and amounts
+_DETAIL_WORDS = frozenset(
+    """
+    monday tuesday wednesday thursday friday saturday sunday weekday weekdays weekend
+    january february march april may june july august september october november december
+    today tomorrow yesterday tonight morning afternoon evening noon midnight
+    zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen
+    fifteen sixteen seventeen eighteen nineteen twenty thirty forty fifty sixty seventy
+    eighty ninety hundred thousand half quarter first second third fourth fifth sixth
+    seventh eighth ninth tenth eleventh twelfth twentieth thirtieth
+    """.split()
+)
+
+
+def normalize_transcript(transcript: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", transcript.lower()).split())
+
+
+def transcript_similarity(first: str, second: str) -> float:
+    return SequenceMatcher(None, normalize_transcript(first), normalize_transcript(second)).ratio()
+
+
+def content_words(transcript: str) -> FrozenSet[str]:
+    """The words of `transcript` that say what it asks, without fillers"""
+    return frozenset(normalize_transcript(transcript).split()) - _FILLER_WORDS
+
+
+def detail_words(transcript: str) -> FrozenSet[str]:
+    """The days, dates, times, amounts and numbers in `transcript`"""
+    return frozenset(
+        word
+        for word in normalize_transcript(transcript).split()
+        if word in _DETAIL_WORDS or word.endswith("teenth") or any(c.isdigit() for c in word)
+    )
+
+
+def same_question(speculative: str, final: str) -> bool:
+    """
+    Whether `final` says what `speculative` did: the same words, give or take
+    trailing fillers such as "please". Unlike a similarity ratio, this tells
+    "the fifth" from "the fifteenth".
+    """
+    speculative_words = normalize_transcript(speculative).split()
+    final_words = normalize_transcript(final).split()
+    shorter, longer = sorted((speculative_words, final_words), key=len)
+    if longer[: len(shorter)] != shorter:
+        return False
+    return not content_words(" ".join(longer[len(shorter) :]))
+
+
+@dataclass(slots=True)
+class SpeculationStats:
+    """Speculation of one call, or of every finished call for `speculation_totals`"""
+
+    speculations: int = 0
+    hits: int = 0
+    misses: int = 0
+    saved_ms_total: float = 0.0
+
+    def add(self, other: "SpeculationStats") -> None:
+        self.speculations += other.speculations
+        self.hits += other.hits
+        self.misses += other.misses
+        self.saved_ms_total += other.saved_ms_total
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "speculations": self.speculations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "saved_ms_total": self.saved_ms_total,
+            "saved_ms_per_hit": self.saved_ms_total / self.hits if self.hits else 0.0,
+        }
+
+
+speculation_totals = SpeculationStats()
+
+
+@dataclass(slots=True)
+class SpeculativeRun:
+    transcript: str
+    started_at: float
+    first_sentence_at: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    # Length of the conversation log when the run started its turn, if it got that far
+    conversation_length: Optional[int] = None
+    interrupt_event: asyncio.Event = field(default_factory=asyncio.Event)
+    tools_gate: asyncio.Event = field(default_factory=asyncio.Event)
+    sentences: asyncio.Queue = field(default_factory=asyncio.Queue)
+
+
+class SpeculativeResponder:
+    """
+    Starts the LLM response on a stable interim transcript, before the caller finishes.
+
+    When the final transcript arrives, `resolve` keeps the speculative response if
+    the caller said nothing more than the interim transcript (see `same_question`),
+    rewriting the caller's message to the final transcript, and otherwise
+    interrupts and discards it. Tool calls of a speculative run are held until it
+    is kept.
+
+    Neither waits for a run to stop: that, and removing its turn from the
+    conversation, happen in the background, one after the other. Whatever adds to
+    the conversation next has to wait for `settled` first.
+
+    Args:
+        respond: Starts a response for a transcript, honouring the interrupt event and tools gate.
+        backend: The call's LLM backend, whose conversation the runs add their turns to.
+        spawn: Runs the speculative runs and their cleanups as tasks of the call.
+    """
+
+    def __init__(self, respond: Responder, backend: LLMBackend, spawn: Spawner) -> None:
+        self._respond = respond
+        self._backend = backend
+        self._spawn = spawn
+        self._run: Optional[SpeculativeRun] = None
+        # The latest background cleanup, which runs after the ones before it
+        self._cleanup: Optional[asyncio.Task] = None
+
+        self.stats = SpeculationStats()
+
+    def on_partial(self, transcript: str) -> None:
+        """Start (or restart) speculation on a stable partial transcript, without waiting"""
+        if len(transcript.split()) < settings.SPECULATIVE_MIN_WORDS:
+            return
+        if self._run is not None:
+            if same_question(self._run.transcript, transcript):
+                return
+            run, self._run = self._run, None
+            self._abandon(run)
+
+        run = SpeculativeRun(transcript=transcript, started_at=time.monotonic())
+        run.task = self._spawn(self._buffer_response(run, self._cleanup), "speculation")
+        self._run = run
+        self.stats.speculations += 1
+
+    async def _buffer_response(
+        self, run: SpeculativeRun, previous_cleanup: Optional[asyncio.Task]
+    ) -> None:
+        try:
+            # The runs abandoned before this one have to be out of the conversation first
+            if previous_cleanup is not None:
+                await asyncio.wait([previous_cleanup])
+            if run.interrupt_event.is_set():
+                return
+            run.conversation_length = len(self._backend.call_conversation)
+            async for sentence in self._respond(
+                run.transcript, run.interrupt_event, run.tools_gate
+            ):
+                if run.first_sentence_at is None:
+                    run.first_sentence_at = time.monotonic()
+                run.sentences.put_nowait(sentence)
+        finally:
+            run.sentences.put_nowait(None)
+
+    def _schedule(self, cleanup: Callable[[], Awaitable[None]], name: str) -> None:
+        """Run `cleanup` in the background, once the cleanups scheduled before have ended"""
+        previous = self._cleanup
+
+        async def after_previous() -> None:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await cleanup()
+
+        self._cleanup = self._spawn(after_previous(), name)
+
+    def _abandon(self, run: SpeculativeRun) -> None:
+        run.interrupt_event.set()
+        run.tools_gate.set()
+        self._schedule(partial(self._discard, run), "speculation discard")
+
+    async def _discard(self, run: SpeculativeRun) -> None:
+        if self._backend.cancels_cleanly:
+            run.task.cancel()
+            await asyncio.wait([run.task])
+        else:
+            # Stopped through its interrupt path, so the provider stops it too
+            _, pending = await asyncio.wait(
+                [run.task], timeout=settings.SPECULATIVE_CANCEL_TIMEOUT_SECONDS
+            )
+            if pending:
+                logger.info("Speculative run did not stop in time")
+        if (
+            run.conversation_length is not None
+            and len(self._backend.call_conversation) > run.conversation_length
+        ):
+            await self._backend.discard_turn()
+
+    async def _rewrite(self, run: SpeculativeRun, final_transcript: str) -> None:
+        await asyncio.wait([run.task])
+        if run.conversation_length is not None:
+            await self._backend.rewrite_turn_message(final_transcript)
+
+    async def _replay(self, run: SpeculativeRun) -> AsyncIterator[str]:
+        try:
+            while (sentence := await run.sentences.get()) is not None:
+                yield sentence
+        finally:
+            # Closed early on barge-in: stop the run through its interrupt path
+            if not run.task.done():
+                run.interrupt_event.set()
+
+    def resolve(self, final_transcript: str) -> Optional[AsyncIterator[str]]:
+        """
+        Returns the speculative response if it matches the final transcript, else None.
+
+        A mismatched speculation is interrupted and discarded in the background,
+        so the caller can start a fresh response right away, once `settled`.
+        """
+        if self._run is None:
+            return None
+
+        run, self._run = self._run, None
+        if not same_question(run.transcript, final_transcript):
+            self.stats.misses += 1
+            logger.info("Speculative response discarded: the final transcript says more")
+            self._abandon(run)
+            return None
+
+        run.tools_gate.set()
+        if run.transcript != final_transcript:
+            # The conversation should remember what the caller said in full, as transcribed
+            self._schedule(partial(self._rewrite, run, final_transcript), "speculation rewrite")
+        # The head start only saves time up to the response latency it hides
+        head_start = time.monotonic() - run.started_at
+        if run.first_sentence_at is not None:
+            head_start = min(head_start, run.first_sentence_at - run.started_at)
+        saved_ms = head_start * 1000
+        self.stats.hits += 1
+        self.stats.saved_ms_total += saved_ms
+        logger.info(f"Speculative response kept, head start {saved_ms:.0f} ms")
+        return self._replay(run)
+
+    async def settled(self) -> None:
+        """Wait for the cleanups of past runs, which must end before the conversation changes"""
+        if self._cleanup is not None and not self._cleanup.done():
+            await asyncio.wait([self._cleanup])
+
+    async def close(self) -> SpeculationStats:
+        """Stop the pending run, add this call's speculation to `speculation_totals` and return it"""
+        if self._run is not None:
+            run, self._run = self._run, None
+            run.interrupt_event.set()
+            run.tools_gate.set()
+            run.task.cancel()
+        speculation_totals.add(self.stats)
+        return self.stats
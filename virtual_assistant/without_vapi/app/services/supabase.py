@@ -1,8 +1,28 @@
+import asyncio
+from typing import Dict, List, Optional
+
 from app.logger import logger
+from app.services.cache import TTLCache
 from app.settings import settings
-from supabase import Client, create_client
+from supabase import AClient, Client, acreate_client, create_client
 
 supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_API_KEY)
+async_supabase: Optional[AClient] = None
+
+BOT_DETAILS_COLUMNS = (
+    "gpt_assistant_id",
+    "gpt_vector_store_id",
+    "active",
+    "greeting",
+    "billing_status",
+)
+
+bot_details_cache: TTLCache[str, Dict] = TTLCache(
+    max_size=settings.BOT_CACHE_MAX_SIZE,
+    ttl_seconds=settings.BOT_CACHE_TTL_SECONDS,
+    stale_seconds=settings.BOT_CACHE_STALE_SECONDS,
+)
+_bot_details_requests: Dict[str, asyncio.Task] = {}
 
 
 def fetch_bot_details(bot_id: str):
@@ -35,13 +55,7 @@ def fetch_bot_details(bot_id: str):
     try:
         response = (
             supabase.table("bots")
-            .select(
-                "gpt_assistant_id",
-                "gpt_vector_store_id",
-                "active",
-                "greeting",
-                "billing_status",
-            )
+            .select(*BOT_DETAILS_COLUMNS)
             .eq("bot_id", bot_id)
             .maybe_single()
             .execute()
@@ -56,3 +70,128 @@ def fetch_bot_details(bot_id: str):
             (str(e), str(e.__traceback__.tb_lineno)),
         )
         raise e
+
+
+async def _get_async_supabase() -> AClient:
+    global async_supabase
+    if async_supabase is None:
+        async_supabase = await acreate_client(settings.SUPABASE_URL, settings.SUPABASE_API_KEY)
+    return async_supabase
+
+
+async def fetch_bot_details_async(bot_id: str) -> Dict:
+    """
+    Fetch details of a bot from Supabase without blocking the event loop.
+
+    Same query and return value as `fetch_bot_details`, issued through the
+    async Supabase client.
+    """
+    try:
+        client = await _get_async_supabase()
+        response = (
+            await client.table("bots")
+            .select(*BOT_DETAILS_COLUMNS)
+            .eq("bot_id", bot_id)
+            .maybe_single()
+            .execute()
+        )
+        if response:
+            return response.data
+        else:
+            return {}
+    except Exception as e:
+        logger.error(
+            "Error occurred while fetching supabase details: %s; at line no: %s",
+            (str(e), str(e.__traceback__.tb_lineno)),
+        )
+        raise e
+
+
+async def fetch_active_bots_async() -> List[Dict]:
+    """
+    Fetch details of every active bot, including its `bot_id`.
+
+    Used at startup to warm the bot details and greeting audio caches.
+    """
+    client = await _get_async_supabase()
+    response = (
+        await client.table("bots")
+        .select("bot_id", *BOT_DETAILS_COLUMNS)
+        .eq("active", True)
+        .eq("billing_status", "active")
+        .execute()
+    )
+    return response.data or []
+
+
+async def fetch_bot_documents_async(bot_id: str) -> List[Dict]:
+    """
+    Fetch the knowledge documents (`id`, `name`, `path`) attached to a bot.
+    """
+    client = await _get_async_supabase()
+    response = (
+        await client.table("bots")
+        .select("botDocuments(id, name, path)")
+        .eq("bot_id", bot_id)
+        .maybe_single()
+        .execute()
+    )
+    if not response:
+        return []
+    return response.data.get("botDocuments") or []
+
+
+async def download_bot_document(path: str) -> bytes:
+    """Download a bot document from Supabase storage"""
+    client = await _get_async_supabase()
+    return await client.storage.from_(settings.RETRIEVAL_STORAGE_BUCKET).download(path)
+
+
+def _request_bot_details(bot_id: str) -> asyncio.Task:
+    """Start (or join) a single in-flight fetch per bot and store its result in the cache"""
+    if bot_id not in _bot_details_requests:
+
+        async def refresh() -> Dict:
+            try:
+                bot_data = await fetch_bot_details_async(bot_id)
+                bot_details_cache.set(bot_id, bot_data)
+                return bot_data
+            finally:
+                _bot_details_requests.pop(bot_id, None)
+
+        _bot_details_requests[bot_id] = asyncio.create_task(refresh())
+    return _bot_details_requests[bot_id]
+
+
+async def get_bot_details(bot_id: str) -> Dict:
+    """
+    Return bot details from the in-process cache, fetching them on a miss.
+
+    Fresh entries are returned directly. Stale entries (older than
+    BOT_CACHE_TTL_SECONDS but within BOT_CACHE_STALE_SECONDS) are returned
+    immediately while a background refresh updates the cache. Concurrent misses
+    for the same bot share one Supabase request.
+
+    Parameters
+    ----------
+    bot_id : str
+        The ID of the bot to fetch details for.
+
+    Returns
+    -------
+    dict
+        The bot details, or an empty dictionary if no bot is found.
+    """
+    entry = bot_details_cache.get(bot_id)
+    if entry is None:
+        return await asyncio.shield(_request_bot_details(bot_id))
+    if not bot_details_cache.is_fresh(entry):
+        refresh = _request_bot_details(bot_id)
+        # Failures are already logged; keep serving the stale entry
+        refresh.add_done_callback(lambda task: task.cancelled() or task.exception())
+    return entry.value
+
+
+def invalidate_bot_details(bot_id: Optional[str] = None) -> None:
+    """Drop cached details for `bot_id`, or for every bot when no ID is given"""
+    bot_details_cache.invalidate(bot_id)
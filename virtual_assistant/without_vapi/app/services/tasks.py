@@ -0,0 +1,104 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Coroutine, Dict, Optional, Set
+
+from app.logger import logger
+
+
+@dataclass(slots=True)
+class CallTaskStats:
+    """Background tasks of every call in this worker, for `call_task_totals`"""
+
+    spawned: int = 0
+    running: int = 0
+    failed: int = 0
+    cancelled_at_shutdown: int = 0
+    # Still running CALL_SHUTDOWN_TIMEOUT_SECONDS after their call ended and cancelled them
+    leaked: int = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "spawned": self.spawned,
+            "running": self.running,
+            "failed": self.failed,
+            "cancelled_at_shutdown": self.cancelled_at_shutdown,
+            "leaked": self.leaked,
+        }
+
+
+call_task_totals = CallTaskStats()
+
+
+class CallTaskGroup:
+    """
+    The background tasks of one call, ended together with it.
+
+    Works like an asyncio.TaskGroup whose scope is the call, from
+    `ConversationManager.start` to `stop`, rather than one `async with` block.
+    Unlike a TaskGroup, a failing task is logged without cancelling the others (a
+    failed cache write must not hang up on the caller), and closing is bounded:
+    tasks still running `timeout` seconds after being cancelled are left behind
+    and counted as leaked instead of holding up the end of the call.
+    """
+
+    __slots__ = ("_tasks", "closed")
+
+    def __init__(self) -> None:
+        self._tasks: Set[asyncio.Task] = set()
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], name: Optional[str] = None) -> asyncio.Task:
+        """
+        Run `coro` as a task of the call.
+
+        Raises:
+            RuntimeError: If the call's tasks have already been closed.
+        """
+        if self.closed:
+            coro.close()
+            raise RuntimeError(f"Cannot start {name or 'a task'}: the call has ended")
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        call_task_totals.spawned += 1
+        call_task_totals.running += 1
+        task.add_done_callback(self._on_done)
+        return task
+
+    def spawn_shielded(
+        self, coro: Coroutine[Any, Any, Any], name: Optional[str] = None
+    ) -> Awaitable[Any]:
+        """
+        Run `coro` as a task of the call; returns what waits for its result.
+
+        Cancelling the waiter (e.g. a turn, on barge-in) does not cancel the task,
+        for work whose side effects have to complete, such as tool calls. It still
+        ends with the call like any other task.
+        """
+        return asyncio.shield(self.spawn(coro, name))
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        call_task_totals.running -= 1
+        if not task.cancelled() and (error := task.exception()) is not None:
+            call_task_totals.failed += 1
+            logger.error(f"Call task {task.get_name()} failed: {error!r}")
+
+    async def aclose(self, timeout: float) -> int:
+        """Cancel the tasks still running and wait up to `timeout` for them; returns how many leaked"""
+        self.closed = True
+        current = asyncio.current_task()
+        tasks = [task for task in self._tasks if task is not current and not task.done()]
+        if not tasks:
+            return 0
+        for task in tasks:
+            task.cancel()
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        call_task_totals.cancelled_at_shutdown += len(tasks)
+        call_task_totals.leaked += len(pending)
+        if pending:
+            names = ", ".join(sorted(task.get_name() for task in pending))
+            logger.warning(f"Call tasks still running {timeout}s after being cancelled: {names}")
+        return len(pending)
@@ -0,0 +1,48 @@
+import math
+from typing import Optional
+
+import tiktoken
+
+from app.logger import logger
+from app.settings import settings
+
+# What a chat message costs on top of its content (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Average characters per token of English text, for when the encoding is not loaded
+CHARACTERS_PER_TOKEN = 4
+
+_encoding: Optional[tiktoken.Encoding] = None
+
+
+def load_tokenizer() -> bool:
+    """
+    Load HISTORY_TOKENIZER_ENCODING, so that counts are exact from then on.
+
+    Blocking (tiktoken downloads the encoding on first use): run it off the event
+    loop, at startup. Until it has loaded, or if it cannot be (e.g. no network and
+    no TIKTOKEN_CACHE_DIR), counts are estimated from the length of the text.
+    Returns whether the encoding is loaded.
+    """
+    global _encoding
+    if _encoding is not None:
+        return True
+    try:
+        _encoding = tiktoken.get_encoding(settings.HISTORY_TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning(f"Failed to load tokenizer, token counts are estimated: {e}")
+        return False
+    return True
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text` for the model, or an estimate if the tokenizer is not loaded"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARACTERS_PER_TOKEN)
+
+
+def count_message_tokens(content: str) -> int:
+    """Tokens a chat message with `content` takes up in the prompt"""
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
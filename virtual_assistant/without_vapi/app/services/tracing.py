@@ -0,0 +1,233 @@
+import asyncio
+import bisect
+import json
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.logger import logger
+from app.settings import settings
+
+
+class Stage:
+    """Points of a turn, timed from the moment the end of the caller's speech is detected"""
+
+    END_OF_SPEECH = "end_of_speech"
+    TRANSCRIPT_FINAL = "transcript_final"
+    LLM_REQUEST = "llm_request"
+    LLM_FIRST_TOKEN = "llm_first_token"
+    FIRST_SENTENCE = "first_sentence"
+    TTS_FIRST_BYTE = "tts_first_byte"
+    TWILIO_FIRST_FRAME = "twilio_first_frame"
+    INTERRUPTED = "interrupted"
+
+
+@dataclass(slots=True)
+class TurnTrace:
+    call_sid: str
+    bot_id: str
+    turn_index: int
+    started_at: float
+    started_at_unix_ns: int
+    marks: Dict[str, float] = field(default_factory=dict)
+
+    def mark(self, stage: str) -> None:
+        """Record the first time the turn reaches `stage`"""
+        if stage not in self.marks:
+            self.marks[stage] = time.monotonic()
+
+    def elapsed_ms(self, stage: str) -> Optional[float]:
+        if stage not in self.marks:
+            return None
+        return (self.marks[stage] - self.started_at) * 1000
+
+
+class _DisabledTrace:
+    """Stands in for a TurnTrace when tracing is off, so call sites need no checks"""
+
+    __slots__ = ()
+
+    def mark(self, stage: str) -> None:
+        pass
+
+
+DISABLED_TRACE = _DisabledTrace()
+
+# Trace of the turn the current task works on; tasks started for the turn inherit it
+current_trace: ContextVar[TurnTrace | _DisabledTrace] = ContextVar(
+    "current_trace", default=DISABLED_TRACE
+)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+
+    Quantiles are estimated by linear interpolation inside the bucket holding the
+    requested rank, which is accurate to a bucket width.
+    """
+
+    def __init__(self, bounds: List[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+
+class Tracer:
+    """
+    Collects per-turn traces into per-bot, per-stage latency histograms.
+
+    When TRACING_ENABLED is off, `start_turn` hands out a no-op trace and nothing
+    is recorded. Finished turns can also be written as OpenTelemetry (OTLP JSON)
+    spans, one batch per line, to TRACING_OTEL_EXPORT_PATH.
+    """
+
+    def __init__(self, enabled: bool, export_path: Optional[str] = None) -> None:
+        self.enabled = enabled
+        self.export_path = export_path
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._pending_spans: List[Dict] = []
+
+        self.turns = 0
+        self.interrupted_turns = 0
+
+    def start_turn(
+        self, call_sid: str, bot_id: str, turn_index: int, started_at: float
+    ) -> TurnTrace | _DisabledTrace:
+        """Start tracing a turn whose end of speech was detected at monotonic `started_at`"""
+        if not self.enabled:
+            return DISABLED_TRACE
+        started_at_unix_ns = time.time_ns() - int((time.monotonic() - started_at) * 1e9)
+        trace = TurnTrace(call_sid, bot_id, turn_index, started_at, started_at_unix_ns)
+        trace.marks[Stage.END_OF_SPEECH] = started_at
+        return trace
+
+    def finish(self, trace: TurnTrace | _DisabledTrace) -> None:
+        if not isinstance(trace, TurnTrace):
+            return
+        self.turns += 1
+        self.interrupted_turns += Stage.INTERRUPTED in trace.marks
+        for stage in trace.marks:
+            key = (trace.bot_id, stage)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(settings.TRACING_BUCKETS_MS)
+            self.histograms[key].observe(trace.elapsed_ms(stage))
+
+        if self.export_path:
+            self._pending_spans.append(self._otel_span(trace))
+            if len(self._pending_spans) >= settings.TRACING_EXPORT_BATCH_SIZE:
+                spans, self._pending_spans = self._pending_spans, []
+                asyncio.get_running_loop().run_in_executor(None, self._export, spans)
+
+    def _otel_span(self, trace: TurnTrace) -> Dict:
+        def unix_ns(timestamp: float) -> str:
+            return str(trace.started_at_unix_ns + int((timestamp - trace.started_at) * 1e9))
+
+        attributes = {
+            "call.sid": trace.call_sid,
+            "bot.id": trace.bot_id,
+            "turn.index": trace.turn_index,
+        }
+        return {
+            "traceId": os.urandom(16).hex(),
+            "spanId": os.urandom(8).hex(),
+            "name": "conversation.turn",
+            "kind": 1,
+            "startTimeUnixNano": str(trace.started_at_unix_ns),
+            "endTimeUnixNano": unix_ns(max(trace.marks.values())),
+            "attributes": [
+                # OTLP JSON encodes 64-bit integers as strings
+                {
+                    "key": key,
+                    "value": {"intValue" if isinstance(value, int) else "stringValue": str(value)},
+                }
+                for key, value in attributes.items()
+            ],
+            "events": [
+                {"timeUnixNano": unix_ns(timestamp), "name": stage}
+                for stage, timestamp in sorted(trace.marks.items(), key=lambda item: item[1])
+            ],
+        }
+
+    def _export(self, spans: List[Dict]) -> None:
+        batch = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": "helloservice.ai"}}
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": "app.services.tracing"}, "spans": spans}],
+                }
+            ]
+        }
+        try:
+            with open(self.export_path, "a") as file:
+                file.write(json.dumps(batch) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to export traces: {e}")
+
+    def prometheus_lines(self) -> List[str]:
+        lines = [
+            "# TYPE voice_turns_total counter",
+            f"voice_turns_total {self.turns}",
+            "# TYPE voice_interrupted_turns_total counter",
+            f"voice_interrupted_turns_total {self.interrupted_turns}",
+            "# HELP voice_turn_stage_ms Time from end of speech until the turn reached a stage",
+            "# TYPE voice_turn_stage_ms histogram",
+        ]
+        quantile_lines = ["# TYPE voice_turn_stage_ms_quantile gauge"]
+        for (bot_id, stage), histogram in sorted(self.histograms.items()):
+            labels = f'bot_id="{bot_id}",stage="{stage}"'
+            lines += histogram_lines("voice_turn_stage_ms", labels, histogram)
+            for q in (0.5, 0.95, 0.99):
+                quantile_lines.append(
+                    f'voice_turn_stage_ms_quantile{{{labels},quantile="{q}"}} '
+                    f"{histogram.quantile(q):.3f}"
+                )
+        return lines + quantile_lines
+
+
+def histogram_lines(name: str, labels: str, histogram: Histogram) -> List[str]:
+    """Render the bucket, sum and count samples of a Prometheus histogram"""
+    bucket_labels = f"{labels}," if labels else ""
+    lines = []
+    cumulative = 0
+    bounds = [f"{bound:g}" for bound in histogram.bounds] + ["+Inf"]
+    for bound, count in zip(bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{bucket_labels}le="{bound}"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum:.3f}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+
+def gauge_lines(prefix: str, stats: Dict[str, float]) -> List[str]:
+    """Render a component's `stats()` as Prometheus gauges named `<prefix>_<key>`"""
+    return [f"{prefix}_{key} {float(value):g}" for key, value in stats.items()]
+
+
+tracer = Tracer(enabled=settings.TRACING_ENABLED, export_path=settings.TRACING_OTEL_EXPORT_PATH)
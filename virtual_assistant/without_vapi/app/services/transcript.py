@@ -0,0 +1,90 @@
+import json
+import tempfile
+from collections import deque
+from itertools import islice
+from typing import IO, Deque, Dict, List, Optional, Tuple
+
+from app.services.tokens import count_message_tokens
+from app.settings import settings
+
+
+class CallTranscript:
+    """
+    User and assistant messages of one call, in order.
+
+    Only the latest `capacity` messages are kept in memory, with their size in
+    tokens, which is what a backend may replay to the model (`recent`). Older
+    messages spill to an anonymous temporary file (in TRANSCRIPT_SPILL_DIR, or the
+    system's temporary directory) that is removed when the transcript is closed;
+    `messages` reads them back, for the rare consumer that needs them (e.g. the
+    summary of the conversation, see ConversationHistory).
+
+    Indexes are positions in the whole transcript, as given by `len`.
+
+    Args:
+        capacity: Messages kept in memory, TRANSCRIPT_MEMORY_MESSAGES by default.
+    """
+
+    __slots__ = ("capacity", "spilled", "_recent", "_spill_file")
+
+    def __init__(self, capacity: Optional[int] = None) -> None:
+        self.capacity = max(capacity or settings.TRANSCRIPT_MEMORY_MESSAGES, 1)
+        self.spilled = 0
+        self._recent: Deque[Tuple[str, str, int]] = deque()
+        self._spill_file: Optional[IO[str]] = None
+
+    def __len__(self) -> int:
+        return self.spilled + len(self._recent)
+
+    def append(self, role: str, content: str) -> None:
+        self._recent.append((role, content, count_message_tokens(content)))
+        while len(self._recent) > self.capacity:
+            role, content, _ = self._recent.popleft()
+            self._spill(role, content)
+
+    def _spill(self, role: str, content: str) -> None:
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(
+                "w+", encoding="utf-8", dir=settings.TRANSCRIPT_SPILL_DIR
+            )
+        self._spill_file.write(json.dumps({"role": role, "content": content}) + "\n")
+        self.spilled += 1
+
+    def truncate(self, index: int) -> None:
+        """Drop the messages from `index` on; those already spilled to disk stay"""
+        while self._recent and len(self) > index:
+            self._recent.pop()
+
+    def replace(self, index: int, content: str) -> None:
+        """Replace the content of message `index`; one already spilled to disk stays as it was"""
+        position = index - self.spilled
+        if 0 <= position < len(self._recent):
+            role, _, _ = self._recent[position]
+            self._recent[position] = (role, content, count_message_tokens(content))
+
+    def recent(self, start: int = 0) -> List[Tuple[str, str, int]]:
+        """(role, content, tokens) of the messages kept in memory from index `start` on"""
+        return list(islice(self._recent, max(start - self.spilled, 0), None))
+
+    def last_content(self, role: str) -> Optional[str]:
+        return next((content for r, content, _ in reversed(self._recent) if r == role), None)
+
+    def messages(self, start: int = 0, end: Optional[int] = None) -> List[Dict[str, str]]:
+        """Messages `start` to `end` (excluded), reading those spilled to disk back if needed"""
+        end = len(self) if end is None else min(end, len(self))
+        spilled = []
+        if self._spill_file is not None and start < self.spilled:
+            self._spill_file.flush()
+            self._spill_file.seek(0)
+            spilled = [json.loads(line) for line in self._spill_file][start:end]
+            self._spill_file.seek(0, 2)
+        return spilled + [
+            {"role": role, "content": content}
+            for role, content, _ in self.recent(start)[: max(end - max(start, self.spilled), 0)]
+        ]
+
+    def close(self) -> None:
+        """Remove the spill file, at the end of the call"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
@@ -1,22 +1,284 @@
-import base64
-from typing import AsyncIterator, Optional
+import asyncio
+import binascii
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, List, Optional, TypeVar
 
 from app.logger import logger
-from app.schema.twilio import MarkEventSchema, MediaEventSchema, TwilioEventSchema
+from app.schema.twilio import MarkEventSchema, TwilioEventSchema
 from app.settings import settings
 from fastapi.websockets import WebSocket
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client as TwilioClient
 from twilio.twiml.voice_response import Connect, VoiceResponse
 
+T = TypeVar("T")
+
+
+class TwilioMediaWriter:
+    """
+    Outbound audio writer for a single Twilio media stream.
+
+    Audio is re-framed into fixed TWILIO_FRAME_MS frames and serialized with a
+    precomputed JSON template instead of building a pydantic model per chunk.
+    Sends are paced so that at most TWILIO_PLAYBACK_LEAD_SECONDS of audio sits in
+    Twilio's buffer, which keeps `clear` interruptions short.
+    """
+
+    __slots__ = (
+        "_websocket",
+        "_frame_bytes",
+        "_media_prefix",
+        "_media_suffix",
+        "_pending",
+        "_generation",
+        "_playback_started_at",
+        "_sent_seconds",
+    )
+
+    def __init__(self, websocket: WebSocket, stream_sid: str) -> None:
+        self._websocket = websocket
+        self._frame_bytes = settings.SAMPLE_RATE * settings.TWILIO_FRAME_MS // 1000
+        self._media_prefix = f'{{"event":"media","streamSid":"{stream_sid}","media":{{"payload":"'
+        self._media_suffix = '"}}'
+        self._pending = bytearray()
+        # Bumped by discard() so an in-progress write stops sending stale frames
+        self._generation = 0
+        self._playback_started_at = 0.0
+        self._sent_seconds = 0.0
+
+    @property
+    def buffered_seconds(self) -> float:
+        """Seconds of sent audio that Twilio has not played yet"""
+        return max(self._sent_seconds - (time.monotonic() - self._playback_started_at), 0.0)
+
+    async def _send_frame(self, frame: memoryview) -> None:
+        # Treat the audio as played out once the caller has caught up with it
+        if self.buffered_seconds == 0:
+            self._playback_started_at = time.monotonic()
+            self._sent_seconds = 0.0
+        ahead = self.buffered_seconds - settings.TWILIO_PLAYBACK_LEAD_SECONDS
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+        # Twilio only takes text frames, so the str is built per frame either way; encoding
+        # into a preallocated bytearray template and decoding that measured slower
+        payload = binascii.b2a_base64(frame, newline=False).decode("ascii")
+        await self._websocket.send_text(self._media_prefix + payload + self._media_suffix)
+        self._sent_seconds += len(frame) / settings.SAMPLE_RATE
+
+    async def write(self, chunk: bytes) -> None:
+        self._pending += chunk
+        if len(self._pending) < self._frame_bytes:
+            return
+        frames, self._pending = self._pending, bytearray()
+        complete = len(frames) - len(frames) % self._frame_bytes
+        self._pending += frames[complete:]
+        await self._send_frames(frames, complete)
+
+    async def flush(self) -> None:
+        """Send the trailing partial frame, if any"""
+        if self._pending:
+            frames, self._pending = self._pending, bytearray()
+            await self._send_frames(frames, len(frames))
+
+    async def _send_frames(self, frames: bytearray, length: int) -> None:
+        generation = self._generation
+        with memoryview(frames) as view:
+            for start in range(0, length, self._frame_bytes):
+                if generation != self._generation:
+                    break
+                await self._send_frame(view[start : min(start + self._frame_bytes, length)])
+
+    def discard(self) -> None:
+        """Drop unsent audio and forget what Twilio has buffered (after a `clear`)"""
+        self._pending.clear()
+        self._generation += 1
+        self._sent_seconds = 0.0
+
+
+class TwilioControlPlane:
+    """
+    Twilio REST operations for every call on the worker, kept off the event loop.
+
+    The Twilio SDK is synchronous, so each operation runs on a dedicated thread
+    pool of at most TWILIO_REST_MAX_WORKERS threads. Operations beyond that queue
+    up instead of piling up threads. All of them share one client, whose HTTP
+    session keeps a connection per thread alive.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="twilio-rest")
+        self._client: Optional[TwilioClient] = None
+
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+
+    @property
+    def client(self) -> TwilioClient:
+        if self._client is None:
+            http_client = TwilioHttpClient(timeout=settings.TWILIO_REST_TIMEOUT_SECONDS)
+            http_client.session.mount("https://", HTTPAdapter(pool_maxsize=self.max_workers))
+            self._client = TwilioClient(
+                username=settings.TWILIO_ACCOUNT_SID,
+                password=settings.TWILIO_AUTH_TOKEN,
+                http_client=http_client,
+            )
+        return self._client
+
+    async def run(self, operation: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking SDK call on the pool and wait for its result"""
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(operation, *args, **kwargs)
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def end_call(self, call_sid: str) -> bool:
+        call = await self.run(self.client.calls(call_sid).update, status="completed")
+        return call.status == "completed"  # type: ignore
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "max_workers": self.max_workers,
+        }
+
+
+twilio_control = TwilioControlPlane(settings.TWILIO_REST_MAX_WORKERS)
+
+
+@dataclass(slots=True)
+class PlaybackSegment:
+    sequence: int
+    text: str
+    turn: int
+
+
+class PlaybackTracker:
+    """
+    What the caller has actually heard, from Twilio's mark acknowledgements.
+
+    Each segment of outbound audio (a sentence, a greeting) is followed by a mark
+    named `playback-<sequence>`. Twilio plays audio in order and echoes a mark
+    once the audio sent before it has played, so an acknowledged mark means every
+    segment up to it was heard. A `clear` drops the unplayed segments; Twilio then
+    echoes their marks right away, and those echoes are ignored.
+
+    Segments sent during a turn belong to it, so when the caller barges in the
+    turn's heard text is exactly the sentences that played before the interruption.
+    """
+
+    MARK_PREFIX = "playback-"
+
+    __slots__ = ("_sequence", "_settled", "_pending", "_progress", "_turn", "_turn_open", "_heard")
+
+    def __init__(self) -> None:
+        self._sequence = 0
+        # Highest sequence that has played or was cleared
+        self._settled = 0
+        self._pending: Deque[PlaybackSegment] = deque()
+        self._progress = asyncio.Event()
+        self._turn = 0
+        self._turn_open = False
+        self._heard: List[str] = []
+
+    def add(self, text: str = "") -> str:
+        """Register the audio sent since the previous mark; returns the mark to send after it"""
+        self._sequence += 1
+        self._pending.append(PlaybackSegment(self._sequence, text, self._turn))
+        return f"{self.MARK_PREFIX}{self._sequence}"
+
+    def _parse(self, mark_name: str) -> Optional[int]:
+        if not mark_name.startswith(self.MARK_PREFIX):
+            return None
+        try:
+            return int(mark_name[len(self.MARK_PREFIX) :])
+        except ValueError:
+            return None
+
+    def _wake(self) -> None:
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    def acknowledge(self, mark_name: str) -> None:
+        sequence = self._parse(mark_name)
+        if sequence is None or sequence <= self._settled:
+            return
+        while self._pending and self._pending[0].sequence <= sequence:
+            segment = self._pending.popleft()
+            if self._turn_open and segment.turn == self._turn and segment.text:
+                self._heard.append(segment.text)
+        self._settled = sequence
+        self._wake()
+
+    def clear(self) -> None:
+        """Forget the unplayed segments after a `clear`"""
+        self._pending.clear()
+        self._settled = self._sequence
+        self._wake()
+
+    @property
+    def playing(self) -> bool:
+        return self._settled < self._sequence
+
+    async def _wait_until_settled(self, sequence: int, timeout: float) -> bool:
+        try:
+            async with asyncio.timeout(timeout):
+                while self._settled < sequence:
+                    await self._progress.wait()
+            return True
+        except TimeoutError:
+            return False
+
+    async def wait_for(self, mark_name: str, timeout: float) -> bool:
+        """Wait until the audio before `mark_name` has played (or was cleared)"""
+        sequence = self._parse(mark_name)
+        return sequence is None or await self._wait_until_settled(sequence, timeout)
+
+    async def wait_until_played(self, timeout: float) -> bool:
+        """Wait until everything sent so far has played (or was cleared)"""
+        return await self._wait_until_settled(self._sequence, timeout)
+
+    def start_turn(self) -> None:
+        self._turn += 1
+        self._turn_open = True
+        self._heard = []
+
+    def end_turn(self) -> Optional[str]:
+        """Close the current turn; returns the text the caller heard, or None if no turn was open"""
+        if not self._turn_open:
+            return None
+        self._turn_open = False
+        return " ".join(self._heard)
+
 
 class TwilioCallManager:
+    __slots__ = ("websocket", "response", "_media_writers", "playback")
+
     def __init__(self, websocket: Optional[WebSocket] = None) -> None:
-        self.client: TwilioClient = TwilioClient(
-            username=settings.TWILIO_ACCOUNT_SID,
-            password=settings.TWILIO_AUTH_TOKEN,
-        )
         self.websocket: WebSocket = websocket
         self.response = VoiceResponse()
+        self._media_writers: Dict[str, TwilioMediaWriter] = {}
+        self.playback = PlaybackTracker()
 
     def handle_incoming_call(self, bot_id: str):
         # WebSocket URL for handling audio stream
@@ -31,17 +293,20 @@ class TwilioCallManager:
     def speak(self, content: str):
         self.response.say(content)
 
+    def media_writer(self, stream_sid: str) -> TwilioMediaWriter:
+        if stream_sid not in self._media_writers:
+            self._media_writers[stream_sid] = TwilioMediaWriter(self.websocket, stream_sid)
+        return self._media_writers[stream_sid]
+
     async def send_chunk(self, stream_sid: str, chunk: bytes) -> None:
-        data = TwilioEventSchema(
-            event="media",
-            streamSid=stream_sid,
-            media=MediaEventSchema(
-                payload=base64.b64encode(chunk).decode("utf-8"),
-            ),
-        ).model_dump(exclude_none=True, by_alias=True)
-        await self.websocket.send_json(data)
+        await self.media_writer(stream_sid).write(chunk)
+
+    async def flush(self, stream_sid: str) -> None:
+        await self.media_writer(stream_sid).flush()
 
     async def clear_buffer(self, stream_sid: str) -> None:
+        self.media_writer(stream_sid).discard()
+        self.playback.clear()
         data = TwilioEventSchema(
             event="clear",
             streamSid=stream_sid,
@@ -57,19 +322,35 @@ class TwilioCallManager:
             ),
         ).model_dump(exclude_none=True, by_alias=True)
         await self.websocket.send_json(data)
-        logger.info(f"AUDIO SENT TO TWILIO - STEAM ID: {stream_sid}")
+        logger.debug(f"AUDIO SENT TO TWILIO - STEAM ID: {stream_sid}")
 
-    async def stream_audio(self, stream_sid: str, audio_stream: AsyncIterator[bytes]) -> None:
-        async for chunk in audio_stream:
-            await self.send_chunk(
-                stream_sid=stream_sid,
-                chunk=chunk,
-            )
-        await self.send_mark(
-            stream_sid=stream_sid,
-            mark_name=stream_sid,
-        )
+    async def mark_playback(self, stream_sid: str, text: str = "") -> str:
+        """Mark the end of the audio sent so far, which spoke `text`; returns the mark's name"""
+        await self.flush(stream_sid)
+        mark_name = self.playback.add(text)
+        await self.send_mark(stream_sid=stream_sid, mark_name=mark_name)
+        return mark_name
+
+    def mark_played(self, mark_name: str) -> None:
+        """Handle a mark echoed back by Twilio: played out, or cleared by a `clear`"""
+        self.playback.acknowledge(mark_name)
+
+    async def wait_for_mark(self, mark_name: str, timeout: float) -> bool:
+        """Wait until Twilio acknowledges a sent mark; False if it did not within `timeout`"""
+        return await self.playback.wait_for(mark_name, timeout)
+
+    async def stream_audio(
+        self, stream_sid: str, audio_stream: AsyncGenerator[bytes, None], text: str = ""
+    ) -> str:
+        """Send all of `audio_stream` followed by a mark; returns the mark's name"""
+        # Closed here even when the send is cancelled, not left to the garbage collector
+        async with aclosing(audio_stream):
+            async for chunk in audio_stream:
+                await self.send_chunk(
+                    stream_sid=stream_sid,
+                    chunk=chunk,
+                )
+        return await self.mark_playback(stream_sid, text)
 
     async def end_call(self, call_sid: str) -> bool:
-        response = self.client.calls(call_sid).update(status="completed")
-        return response.status == "completed"  # type: ignore
+        return await twilio_control.end_call(call_sid)
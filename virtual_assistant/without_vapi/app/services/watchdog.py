@@ -0,0 +1,122 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.logger import logger
+from app.services.tracing import Histogram, histogram_lines
+from app.settings import settings
+
+
+class LoopWatchdog:
+    """
+    Measures how late the event loop runs, and names the code that made it late.
+
+    A probe task sleeps WATCHDOG_INTERVAL_SECONDS at a time and records how much
+    later than that it wakes up. A monitor thread watches the probe's heartbeat:
+    once the loop has not run it for WATCHDOG_STALL_THRESHOLD_MS, the monitor logs
+    the stack the loop thread is stuck in, i.e. the blocking call, while it is
+    still blocking.
+
+    The highest lag over the last WATCHDOG_SHED_WINDOW_SECONDS drives load shedding
+    (see `shed_reason`).
+    """
+
+    def __init__(self, interval_seconds: float, stall_threshold_ms: float) -> None:
+        self.interval_seconds = interval_seconds
+        self.stall_threshold_ms = stall_threshold_ms
+        self.histogram = Histogram(settings.WATCHDOG_LAG_BUCKETS_MS)
+        self._recent: Deque[Tuple[float, float]] = deque()
+        self._probe_task: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+        self.shed_calls = 0
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._probe_task = asyncio.create_task(self._probe())
+        self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._monitor.start()
+
+    async def close(self) -> None:
+        self._stopped.set()
+        if self._probe_task:
+            self._probe_task.cancel()
+        if self._monitor:
+            await asyncio.to_thread(self._monitor.join)
+
+    async def _probe(self) -> None:
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(self.interval_seconds)
+            self._last_beat = now = time.monotonic()
+            self.observe((now - started_at - self.interval_seconds) * 1000, now)
+
+    def observe(self, lag_ms: float, now: float) -> None:
+        lag_ms = max(lag_ms, 0.0)
+        self.histogram.observe(lag_ms)
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self._recent.append((now, lag_ms))
+        while self._recent[0][0] < now - settings.WATCHDOG_SHED_WINDOW_SECONDS:
+            self._recent.popleft()
+
+    @property
+    def recent_lag_ms(self) -> float:
+        """Highest lag over the shedding window"""
+        return max((lag for _, lag in self._recent), default=0.0)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self.interval_seconds):
+            beat = self._last_beat
+            stalled_ms = (time.monotonic() - beat) * 1000
+            if stalled_ms < self.stall_threshold_ms or beat == reported_beat:
+                continue
+            # One report per stall, taken while the loop is still blocked
+            reported_beat = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unavailable"
+            logger.warning(f"Event loop blocked for {stalled_ms:.0f}ms in:\n{stack}")
+
+    def shed_reason(self, active_calls: int) -> Optional[str]:
+        """Why the worker should refuse a new call right now, or None to accept it"""
+        max_calls = settings.LOAD_SHED_MAX_ACTIVE_CALLS
+        if max_calls is not None and active_calls >= max_calls:
+            return f"{active_calls} active calls (limit {max_calls})"
+        max_lag_ms = settings.LOAD_SHED_MAX_LAG_MS
+        if max_lag_ms is not None and self.recent_lag_ms >= max_lag_ms:
+            return f"event loop lag {self.recent_lag_ms:.0f}ms (limit {max_lag_ms:g}ms)"
+        return None
+
+    def prometheus_lines(self) -> List[str]:
+        return [
+            "# HELP voice_event_loop_lag_ms How late the event loop ran the watchdog probe",
+            "# TYPE voice_event_loop_lag_ms histogram",
+            *histogram_lines("voice_event_loop_lag_ms", "", self.histogram),
+        ]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lag_ms_recent": self.recent_lag_ms,
+            "lag_ms_max": self.max_lag_ms,
+            "lag_ms_p99": self.histogram.quantile(0.99),
+            "stalls": self.stalls,
+            "shed_calls": self.shed_calls,
+        }
+
+
+watchdog = LoopWatchdog(
+    interval_seconds=settings.WATCHDOG_INTERVAL_SECONDS,
+    stall_threshold_ms=settings.WATCHDOG_STALL_THRESHOLD_MS,
+)
@@ -1,6 +1,6 @@
 from functools import lru_cache
 from re import DEBUG
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -13,14 +13,35 @@ class Settings(BaseSettings):
     APP_NAME: str = "HelloService Call Handler"
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
+    # "json" lines or "text"; records are written from a background thread
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10000
+    # Per-module sampling of DEBUG/INFO records, e.g. {"twilio": 0.01} keeps 1 in 100
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+    # Per-module cap on DEBUG/INFO records per second
+    LOG_RATE_LIMITS: Dict[str, int] = {}
     OPEN_AI_API_KEY: str
+    # Overrides the OpenAI API URL, e.g. to point the load test at its stand-in server
+    OPEN_AI_BASE_URL: Optional[str] = None
     APP_BACKEND_WEBSOCKET_DOMAIN: str
+    # Bearer token of the admin endpoints (cache invalidation, drain, memory); off while unset
+    ADMIN_TOKEN: Optional[str] = None
 
     TWILIO_AUTH_TOKEN: str
     TWILIO_ACCOUNT_SID: str
+    # REST calls (e.g. hanging up) run on a thread pool of this size
+    TWILIO_REST_MAX_WORKERS: int = 8
+    TWILIO_REST_TIMEOUT_SECONDS: float = 10
+    # Longest wait for Twilio to acknowledge that queued audio has played
+    TWILIO_PLAYBACK_TIMEOUT_SECONDS: float = 15
+    # Longest wait, once a call has ended, for its tasks to stop and its STT connection to close
+    CALL_SHUTDOWN_TIMEOUT_SECONDS: float = 2
 
     SUPABASE_URL: str
     SUPABASE_API_KEY: str
+    BOT_CACHE_TTL_SECONDS: float = 60
+    BOT_CACHE_STALE_SECONDS: float = 600
+    BOT_CACHE_MAX_SIZE: int = 1000
 
     SAMPLE_RATE: int = 8000
     INTERRUPTION_WORD_COUNT: int = 3
@@ -29,11 +50,123 @@ class Settings(BaseSettings):
     DEEPGRAM_ENCODING: str = "mulaw"
     DEEPGRAM_TTS_MODEL: str = "aura-asteria-en"
     DEEPGRAM_SST_MODEL: str = "nova-2"
-    SPEECH_DELAY_SECONDS: float = 0
+    DEEPGRAM_STT_URL: str = "api.deepgram.com"
+    TWILIO_FRAME_MS: int = 20
+    TWILIO_PLAYBACK_LEAD_SECONDS: float = 0.3
+    STT_BATCH_FRAMES: int = 4
+    # Barge-in on local voice activity detection, ahead of STT. Off by default: a cough or
+    # line noise cuts the answer short just as speech does, with no transcript to confirm it
+    VAD_ENABLED: bool = False
+    VAD_MIN_ENERGY_DBFS: float = -40
+    # How far above the line's background noise a frame must be to count as voiced
+    VAD_NOISE_MARGIN_DB: float = 10
+    VAD_MAX_ZERO_CROSSING_RATE: float = 0.4
+    VAD_TRIGGER_FRAMES: int = 2
+    VAD_HANGOVER_FRAMES: int = 10
+    # Stop streaming to STT once the caller has been quiet for longer than the tail,
+    # which must leave Deepgram enough silence to endpoint (utterance_end_ms). Off by
+    # default: speech too soft for the VAD would be dropped along with the silence
+    STT_SILENCE_SUPPRESSION: bool = False
+    STT_SILENCE_TAIL_MS: int = 5000
+    # Audio kept while suppressed and sent ahead of the speech that resumes streaming
+    STT_PREROLL_MS: int = 300
+    STT_KEEPALIVE_SECONDS: float = 5
+    DEEPGRAM_TTS_URL: str = "https://api.deepgram.com/v1/speak"
+    TTS_PIPELINE_DEPTH: int = 2
+    TTS_REQUEST_TIMEOUT_SECONDS: float = 10
+    TTS_METRICS_HISTORY: int = 50
+    AUDIO_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    AUDIO_CACHE_DIR: Optional[str] = None
+
+    PROVIDER_POOL_STT_WARM_SIZE: int = 2
+    PROVIDER_POOL_STT_MAX_CONNECTIONS: int = 250
+    PROVIDER_POOL_ACQUIRE_TIMEOUT_SECONDS: float = 5
+    PROVIDER_POOL_HTTP_MAX_CONNECTIONS: int = 100
+    PROVIDER_POOL_HTTP_KEEPALIVE_SECONDS: float = 60
 
     PUNCTUATION_TERMINATORS: List[str] = [".", "!", "?"]
     OPEN_AI_DELIMITERS: List[str] = [".", "?", "!", ";", ":"]
+    # Per-bot LLM backend: "assistants" or "chat_completions"
+    LLM_BACKEND: str = "assistants"
+    LLM_BACKEND_OVERRIDES: Dict[str, str] = {}
+    LLM_METRICS_HISTORY: int = 50
+    # Messages of a call's transcript kept in memory; older ones spill to a temporary
+    # file in TRANSCRIPT_SPILL_DIR
+    TRANSCRIPT_MEMORY_MESSAGES: int = 40
+    TRANSCRIPT_SPILL_DIR: Optional[str] = None
+    # History given to the model each turn: the latest messages, up to HISTORY_TOKEN_BUDGET
+    # tokens, after a summary of the earlier ones. Past the budget, the oldest messages are
+    # folded into the summary by HISTORY_SUMMARY_MODEL until HISTORY_WINDOW_TOKENS are left
+    HISTORY_TOKEN_BUDGET: int = 2000
+    HISTORY_WINDOW_TOKENS: int = 1000
+    HISTORY_SUMMARY_MODEL: str = "gpt-4o-mini"
+    HISTORY_SUMMARY_MAX_TOKENS: int = 300
+    HISTORY_TOKENIZER_ENCODING: str = "o200k_base"
+    OPEN_AI_RUN_CANCEL_POLLS: int = 20
+    OPEN_AI_RUN_CANCEL_POLL_SECONDS: float = 0.1
+
+    # Local retrieval over bot documents, injected into the prompt each turn
+    RETRIEVAL_ENABLED: bool = False
+    RETRIEVAL_INDEX_DIR: str = "indexes"
+    RETRIEVAL_STORAGE_BUCKET: str = "helloservice"
+    RETRIEVAL_TOP_K: int = 3
+    RETRIEVAL_CHUNK_WORDS: int = 120
+    RETRIEVAL_CHUNK_OVERLAP_WORDS: int = 30
+    # Per-bot cache of answers to repeated questions
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
+    ANSWER_CACHE_MAX_SIZE_PER_BOT: int = 200
+    ANSWER_CACHE_MIN_WORDS: int = 3
+    ANSWER_CACHE_LEXICAL_THRESHOLD: float = 0.9
+    ANSWER_CACHE_EMBEDDING_MODEL: Optional[str] = None
+    ANSWER_CACHE_VECTOR_THRESHOLD: float = 0.95
+    SPECULATIVE_RESPONSES_ENABLED: bool = False
+    SPECULATIVE_MIN_WORDS: int = 3
+    SPECULATIVE_CANCEL_TIMEOUT_SECONDS: float = 2
+    # Per-turn latency tracing, exported on /metrics
+    TRACING_ENABLED: bool = False
+    TRACING_BUCKETS_MS: List[float] = [
+        50,
+        100,
+        200,
+        300,
+        500,
+        750,
+        1000,
+        1500,
+        2000,
+        3000,
+        5000,
+        10000,
+    ]
+    TRACING_OTEL_EXPORT_PATH: Optional[str] = None
+    TRACING_EXPORT_BATCH_SIZE: int = 20
+
+    # Live call tracking across workers: "memory" (single worker) or "sqlite" (one host)
+    CALL_REGISTRY_BACKEND: str = "memory"
+    CALL_REGISTRY_SQLITE_PATH: str = "calls.db"
+    CALL_REGISTRY_HEARTBEAT_SECONDS: float = 5
+    CALL_REGISTRY_WORKER_TTL_SECONDS: float = 15
+    WORKER_ID: Optional[str] = None
+
+    # Event loop lag watchdog; stacks of stalls longer than the threshold are logged
+    WATCHDOG_INTERVAL_SECONDS: float = 0.1
+    WATCHDOG_STALL_THRESHOLD_MS: float = 250
+    WATCHDOG_LAG_BUCKETS_MS: List[float] = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+    WATCHDOG_SHED_WINDOW_SECONDS: float = 5
+    # New inbound calls are refused (503) past either limit; None disables the limit
+    LOAD_SHED_MAX_LAG_MS: Optional[float] = None
+    LOAD_SHED_MAX_ACTIVE_CALLS: Optional[int] = None
+
     SUMMARIZATION_URL: str
+    SUMMARIZATION_TIMEOUT_SECONDS: float = 20
+
+    # Defaults for custom tool HTTP requests; tools may override them when registered
+    TOOL_HTTP_TIMEOUT_SECONDS: float = 10
+    TOOL_HTTP_RETRIES: int = 2
+    TOOL_HTTP_BACKOFF_SECONDS: float = 0.2
+    TOOL_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    TOOL_CIRCUIT_RESET_SECONDS: float = 30
 
 
 @lru_cache()
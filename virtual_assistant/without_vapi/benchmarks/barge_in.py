@@ -0,0 +1,114 @@
+"""
+Check that a barge-in truncates only the turn it interrupts, whether the answer
+came from the model or from the answer cache.
+
+Plays a short conversation through each LLM backend, against the stand-in
+providers of the load test (`benchmarks.loadtest.fakes`, in this process so that
+the Assistants threads they keep can be inspected):
+
+1. a question answered by the model, played out
+2. a question answered from the answer cache, interrupted after its first sentence
+3. a question answered from the answer cache, played out
+
+Each turn makes the backend calls ConversationManager makes for it. The
+conversation log, and the thread for the Assistants API, must then hold every
+question with its answer, the interrupted one cut to what the caller heard.
+Exits with status 1 otherwise.
+
+Usage (from the without_vapi directory):
+
+    python -m benchmarks.barge_in
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Tuple
+
+from benchmarks.loadtest import fakes
+from benchmarks.loadtest.__main__ import app_environment
+
+Messages = List[Tuple[str, str]]
+
+
+async def play(backend_name: str, providers: fakes.FakeProviders) -> Tuple[Messages, Messages]:
+    """Conversation log and thread (empty without one) after the scripted turns"""
+    from app.services.openai import LLM_BACKENDS
+    from app.services.pool import provider_pool
+
+    backend = LLM_BACKENDS[backend_name](
+        fakes.BOT_ID, fakes.ASSISTANT_ID, client=provider_pool.openai_client
+    )
+    threads_before = set(providers.threads)
+    try:
+        await backend.create_thread()
+        # 1. Answered by the model
+        await backend.create_thread_message(fakes.QUESTIONS[0])
+        async for _ in backend.run(asyncio.Event()):
+            pass
+        # 2. From the answer cache, interrupted: as ConversationManager._cached_response
+        # and _cancel_current_task do
+        cached = fakes.ANSWERS[1].split(". ")
+        await backend.create_thread_message(fakes.QUESTIONS[1])
+        await backend.truncate_turn(cached[0])
+        # 3. From the answer cache, played out
+        await backend.create_thread_message(fakes.QUESTIONS[2])
+        await backend.record_turn(fakes.ANSWERS[2])
+        log = [(m["role"], m["content"]) for m in backend.call_conversation.messages()]
+    finally:
+        backend.close()
+    thread = [
+        (message["role"], message["content"][0]["text"]["value"])
+        for thread_id in set(providers.threads) - threads_before
+        for message in providers.threads[thread_id]
+    ]
+    return log, thread
+
+
+async def check() -> bool:
+    providers = fakes.FakeProviders(
+        database=fakes.Latency(), stt=fakes.Latency(), llm=fakes.Latency(), tts=fakes.Latency()
+    )
+    runner, fakes_url = await fakes.start(providers)
+    # The app reads its settings on import, so it is only imported from here on
+    os.environ.update(app_environment(fakes_url, 0, argparse.Namespace(llm_backend="assistants")))
+    os.environ.update(LOG_LEVEL="WARNING")
+    passed = True
+    try:
+        for backend_name in ("assistants", "chat_completions"):
+            log, thread = await play(backend_name, providers)
+            model_answer = log[1][1] if len(log) > 1 else ""
+            expected = [
+                ("user", fakes.QUESTIONS[0]),
+                ("assistant", model_answer),
+                ("user", fakes.QUESTIONS[1]),
+                ("assistant", fakes.ANSWERS[1].split(". ")[0]),
+                ("user", fakes.QUESTIONS[2]),
+                ("assistant", fakes.ANSWERS[2]),
+            ]
+            ok = log == expected and (backend_name != "assistants" or thread == expected)
+            passed = passed and ok
+            print(f"{backend_name + ':':<18}{'ok' if ok else 'history corrupted'}")
+            if not ok:
+                print(f"  expected: {expected}")
+                print(f"  log:      {log}")
+                if backend_name == "assistants":
+                    print(f"  thread:   {thread}")
+    finally:
+        from app.services.pool import provider_pool
+
+        await provider_pool.close()
+        await runner.cleanup()
+    return passed
+
+
+def main() -> None:
+    argparse.ArgumentParser(description=__doc__.splitlines()[1]).parse_args()
+    passed = asyncio.run(check())
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Connect/disconnect hammer of the media stream endpoint: calls that end at any
+point must leave nothing behind.
+
+Starts the stand-in providers and the app as the load test does, then opens
+`--connections` media streams, `--concurrency` at a time, each ending in one of
+these ways (in turn):
+
+- connect:  the socket closes before any Twilio event
+- start:    the socket closes right after the start event, while the call sets up
+- greeting: the caller hangs up during the greeting, after a random delay
+- turn:     the caller asks a question and hangs up as the answer starts playing
+- stop:     Twilio's stop event, after a random delay
+- abort:    the connection drops without a close frame, after a random delay
+
+Once the app has had CALL_SHUTDOWN_TIMEOUT_SECONDS (plus a margin) to clean up,
+its counters must show no conversation in memory, no call task still running or
+leaked, no STT connection leased, and no more open file descriptors than after
+the warm-up (give or take `--max-fd-growth`, for pooled provider connections).
+Exits with status 1 otherwise.
+
+Usage (from the without_vapi directory):
+
+    python -m benchmarks.churn [--connections 500] [--concurrency 50] [--seed 0]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from benchmarks.loadtest import audio, fakes
+from benchmarks.loadtest.__main__ import (
+    ADMIN_TOKEN,
+    app_environment,
+    app_stats,
+    free_port,
+    wait_until_up,
+)
+
+ENDINGS = ("connect", "start", "greeting", "turn", "stop", "abort")
+FRAME_SECONDS = audio.FRAME_BYTES / audio.SAMPLE_RATE
+MAX_HANG_UP_DELAY_SECONDS = 1.5
+REPLY_TIMEOUT_SECONDS = 15.0
+# Time allowed on top of the app's shutdown timeout for the last calls to be cleaned up
+SETTLE_MARGIN_SECONDS = 5.0
+
+
+class ChurnCall:
+    """One media stream that ends the way `ending` says"""
+
+    def __init__(self, url: str, ending: str, delay: float, utterance: bytes) -> None:
+        self.url = url
+        self.ending = ending
+        self.delay = delay
+        self.utterance = utterance
+        self.call_sid = f"CA{random.getrandbits(128):032x}"
+        self.stream_sid = f"MZ{random.getrandbits(128):032x}"
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+
+    async def run(self, session: aiohttp.ClientSession) -> None:
+        async with session.ws_connect(self.url) as ws:
+            self._ws = ws
+            if self.ending == "connect":
+                return
+            await self._send({"event": "connected", "protocol": "Call", "version": "1.0.0"})
+            await self._send(self._start_event())
+            if self.ending == "start":
+                return
+            if self.ending == "turn":
+                await self._stream(self.utterance)
+                await self._wait_for_media(REPLY_TIMEOUT_SECONDS)
+            else:
+                await self._stream(audio.silence(self.delay))
+            if self.ending == "stop":
+                await self._send(
+                    {
+                        "event": "stop",
+                        "streamSid": self.stream_sid,
+                        "stop": {"accountSid": "ACloadtest", "callSid": self.call_sid},
+                    }
+                )
+            elif self.ending == "abort":
+                # Drop the TCP connection, as a lost network would, without a close frame
+                ws.get_extra_info("socket").shutdown(socket.SHUT_RDWR)
+
+    async def _send(self, data: Dict) -> None:
+        await self._ws.send_str(json.dumps(data))
+
+    def _start_event(self) -> Dict:
+        return {
+            "event": "start",
+            "streamSid": self.stream_sid,
+            "start": {
+                "streamSid": self.stream_sid,
+                "accountSid": "ACloadtest",
+                "callSid": self.call_sid,
+                "tracks": ["inbound"],
+                "mediaFormat": {
+                    "encoding": "audio/x-mulaw",
+                    "sampleRate": audio.SAMPLE_RATE,
+                    "channels": 1,
+                },
+            },
+        }
+
+    async def _stream(self, call_audio: bytes) -> None:
+        """Send `call_audio` in real time, one 20 ms media frame after the other"""
+        next_frame_at = time.monotonic()
+        for offset in range(0, len(call_audio), audio.FRAME_BYTES):
+            payload = base64.b64encode(call_audio[offset : offset + audio.FRAME_BYTES]).decode()
+            await self._send(
+                {"event": "media", "streamSid": self.stream_sid, "media": {"payload": payload}}
+            )
+            next_frame_at += FRAME_SECONDS
+            await asyncio.sleep(max(0.0, next_frame_at - time.monotonic()))
+
+    async def _wait_for_media(self, timeout: float) -> None:
+        """Wait for the first frame of the answer, skipping what is left of the greeting"""
+        deadline = time.monotonic() + timeout
+        skip_until = time.monotonic() + 0.5
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await self._ws.receive(timeout=remaining)
+            if message.type != aiohttp.WSMsgType.TEXT:
+                return
+            if json.loads(message.data).get("event") == "media" and time.monotonic() > skip_until:
+                return
+
+
+async def hammer(args: argparse.Namespace, ws_url: str) -> Counter:
+    """Run the connections; returns the client-side errors by kind"""
+    rng = random.Random(args.seed)
+    utterance = audio.synthesize_speech(1.0) + audio.silence(1.5)
+    slots = asyncio.Semaphore(args.concurrency)
+    errors: Counter = Counter()
+
+    async def connection(index: int) -> None:
+        ending = ENDINGS[index % len(ENDINGS)]
+        call = ChurnCall(ws_url, ending, rng.uniform(0, MAX_HANG_UP_DELAY_SECONDS), utterance)
+        async with slots:
+            try:
+                await call.run(session)
+            except Exception as e:
+                errors[f"{ending}: {type(e).__name__}"] += 1
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*[connection(index) for index in range(args.connections)])
+    return errors
+
+
+async def settled_stats(session: aiohttp.ClientSession, app_url: str, timeout: float) -> Dict:
+    """The app's stats once its calls have been cleaned up, or as they are at `timeout`"""
+    deadline = time.monotonic() + timeout
+    while True:
+        # Collect first, so ended calls only count while something still references them
+        async with session.get(
+            f"{app_url}/worker/memory",
+            params={"collect": "true"},
+            headers={"Authorization": f"Bearer {ADMIN_TOKEN}"},
+        ):
+            pass
+        stats = await app_stats(session, app_url)
+        clean = (
+            stats["conversations"]["in_memory"] == 0
+            and stats["call_tasks"]["running"] == 0
+            and stats["stt_active"] == 0
+        )
+        if clean or time.monotonic() > deadline:
+            return stats
+        await asyncio.sleep(0.5)
+
+
+async def run(args: argparse.Namespace) -> bool:
+    fakes_port, app_port = free_port(), free_port()
+    fakes_url, app_url = f"http://127.0.0.1:{fakes_port}", f"http://127.0.0.1:{app_port}"
+    ws_url = f"ws://127.0.0.1:{app_port}/ws/{fakes.BOT_ID}/audio/stream"
+    environment = app_environment(fakes_url, app_port, args)
+    shutdown_timeout = float(environment.get("CALL_SHUTDOWN_TIMEOUT_SECONDS", 2))
+
+    processes: List[subprocess.Popen] = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.loadtest.fakes", f"--port={fakes_port}"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    ]
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_until_up(session, f"{fakes_url}/rest/v1/bots", processes[0])
+            processes.append(
+                subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.loadtest.server", f"--port={app_port}"],
+                    env=environment,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            )
+            await wait_until_up(session, f"{app_url}/loadtest/stats", processes[1])
+
+            # The warm-up opens the pooled provider connections that are meant to stay
+            warmup = argparse.Namespace(**{**vars(args), "connections": len(ENDINGS) * 5})
+            await hammer(warmup, ws_url)
+            before = await settled_stats(session, app_url, shutdown_timeout + SETTLE_MARGIN_SECONDS)
+
+            started = time.monotonic()
+            errors = await hammer(args, ws_url)
+            elapsed = time.monotonic() - started
+            after = await settled_stats(session, app_url, shutdown_timeout + SETTLE_MARGIN_SECONDS)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    tasks = after["call_tasks"]
+    fd_growth = after["open_fds"] - before["open_fds"]
+    print(f"connections:      {args.connections} in {elapsed:.0f}s")
+    for error, count in sorted(errors.items()):
+        print(f"  client error:   {error} x{count}")
+    print(f"calls in memory:  {after['conversations']['in_memory']}")
+    print(
+        f"call tasks:       {tasks['spawned'] - before['call_tasks']['spawned']} spawned, "
+        f"{tasks['running']} running, {tasks['leaked']} leaked, {tasks['failed']} failed"
+    )
+    print(f"STT leased:       {after['stt_active']}")
+    print(f"open fds:         {before['open_fds']} -> {after['open_fds']} ({fd_growth:+d})")
+    return (
+        after["conversations"]["in_memory"] == 0
+        and tasks["running"] == 0
+        and tasks["leaked"] == 0
+        and after["stt_active"] == 0
+        and fd_growth <= args.max_fd_growth
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-fd-growth", type=int, default=20)
+    parser.add_argument("--llm-backend", default="assistants")
+    args = parser.parse_args()
+    passed = asyncio.run(run(args))
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Long-call check of the conversation history: the prompt of late turns has to
+stay within HISTORY_TOKEN_BUDGET however long the call.
+
+Runs one `--turns` long conversation through an LLM backend in this process,
+against the stand-in providers of the load test (`benchmarks.loadtest.fakes`,
+in their own process), and compacts the history between turns as
+ConversationManager does. Prints, by turn index, the prompt tokens of the turn,
+its time to first token, what the history holds, and the tokens the whole
+conversation would have taken instead. Exits with status 1 if the history sent
+with a turn ever exceeded the budget.
+
+Time to first token only reflects the stand-ins' fixed latency; point the
+backend at the real API to see how it grows with the prompt.
+
+Usage (from the without_vapi directory; HISTORY_* settings are read from the
+environment):
+
+    python -m benchmarks.history [--turns 80] [--every 5] [--llm-backend assistants]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+from typing import Dict, List, Set
+
+import aiohttp
+
+from benchmarks.loadtest import fakes
+from benchmarks.loadtest.__main__ import app_environment, free_port, wait_until_up
+
+
+async def check(args: argparse.Namespace) -> bool:
+    from app.services.openai import LLM_BACKENDS
+    from app.services.pool import provider_pool
+    from app.services.tokens import count_message_tokens, load_tokenizer
+    from app.settings import settings
+
+    exact = await asyncio.to_thread(load_tokenizer)
+    backend = LLM_BACKENDS[args.llm_backend](
+        fakes.BOT_ID, fakes.ASSISTANT_ID, client=provider_pool.openai_client
+    )
+    compactions: Set[asyncio.Task] = set()
+    rows: List[Dict] = []
+    full_tokens = 0
+    over_budget = 0
+    try:
+        await backend.create_thread()
+        for turn in range(args.turns):
+            question = fakes.QUESTIONS[turn % len(fakes.QUESTIONS)]
+            await backend.create_thread_message(question)
+            history_tokens = backend.history.prompt_tokens(backend.history.window())
+            over_budget += history_tokens > settings.HISTORY_TOKEN_BUDGET
+            async for _ in backend.run(asyncio.Event()):
+                pass
+            full_tokens = sum(
+                count_message_tokens(message["content"])
+                for message in backend.call_conversation.messages()
+            )
+            metrics = backend.turn_metrics[-1]
+            rows.append(
+                {
+                    "turn": metrics.turn_index,
+                    "prompt_tokens": metrics.prompt_tokens,
+                    "ttft_ms": (metrics.time_to_first_token or 0) * 1000,
+                    "history_tokens": history_tokens,
+                    "summarized": backend.history.summarized,
+                    "summary_tokens": backend.history.summary_tokens,
+                    "full_tokens": full_tokens,
+                }
+            )
+            # As the conversation worker does: in the background, while the next turn starts
+            if backend.history.needs_compaction():
+                task = asyncio.create_task(backend.compact_history())
+                compactions.add(task)
+                task.add_done_callback(compactions.discard)
+        await asyncio.gather(*compactions)
+        tool_payload = backend.history.prompt_messages()
+    finally:
+        backend.close()
+        await provider_pool.close()
+
+    print(f"tokenizer:        {'exact' if exact else 'estimated'}")
+    print(
+        f"budget:           {settings.HISTORY_TOKEN_BUDGET} tokens "
+        f"(window after compaction: {settings.HISTORY_WINDOW_TOKENS})"
+    )
+    print(
+        f"{'turn':>5} {'prompt':>7} {'ttft ms':>8} {'history':>8} {'summarized':>11} "
+        f"{'summary':>8} {'whole call':>11}"
+    )
+    for row in rows:
+        if row["turn"] % args.every and row is not rows[-1]:
+            continue
+        print(
+            f"{row['turn']:>5} {row['prompt_tokens']:>7} {row['ttft_ms']:>8.0f} "
+            f"{row['history_tokens']:>8} {row['summarized']:>11} {row['summary_tokens']:>8} "
+            f"{row['full_tokens']:>11}"
+        )
+    print(
+        f"compactions:      {backend.history.compactions} "
+        f"in {backend.history.compaction_seconds:.2f}s"
+    )
+    print(
+        f"tool payload:     {len(tool_payload)} of {len(backend.call_conversation)} messages, "
+        f"{sum(count_message_tokens(message['content']) for message in tool_payload)} "
+        f"of {full_tokens} tokens"
+    )
+    print(f"over budget:      {over_budget} turns")
+    return over_budget == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    # About a 20 minute call
+    parser.add_argument("--turns", type=int, default=80)
+    parser.add_argument("--every", type=int, default=5, help="print every N turns")
+    parser.add_argument("--llm-backend", default="assistants")
+    args = parser.parse_args()
+
+    fakes_port = free_port()
+    fakes_url = f"http://127.0.0.1:{fakes_port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest.fakes", f"--port={fakes_port}"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+
+        async def wait_for_fakes() -> None:
+            async with aiohttp.ClientSession() as session:
+                await wait_until_up(session, f"{fakes_url}/rest/v1/bots", process)
+
+        asyncio.run(wait_for_fakes())
+        # The app reads its settings on import, so it is only imported from here on
+        os.environ.update(app_environment(fakes_url, 0, args))
+        os.environ.update(LOG_LEVEL="WARNING")
+        passed = asyncio.run(check(args))
+    finally:
+        process.terminate()
+        process.wait()
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Microbenchmark of inbound Twilio packet handling.
+
+Compares the per-packet CPU cost of full pydantic validation plus base64 decode
+(the original `websocket_endpoint` path) with the `parse_media_payload` fast path.
+
+Usage (from the without_vapi directory):
+
+    python -m benchmarks.inbound_media [--packets recorded_stream.jsonl] [--repeat 20]
+
+A recorded stream is a file with one raw Twilio WebSocket message per line. Without
+one, a 60 second call (one media frame every 20 ms) is synthesized. Exits with
+status 1 if the fast path is less than `--min-speedup` times faster.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from typing import Callable, List
+
+from app.schema.twilio import TwilioEventSchema, parse_media_payload
+
+STREAM_SID = "MZ00000000000000000000000000000000"
+CALL_SID = "CA00000000000000000000000000000000"
+
+
+def synthesize_stream(seconds: int) -> List[str]:
+    packets = [
+        json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}),
+        json.dumps(
+            {
+                "event": "start",
+                "sequenceNumber": "1",
+                "streamSid": STREAM_SID,
+                "start": {
+                    "streamSid": STREAM_SID,
+                    "accountSid": "AC00000000000000000000000000000000",
+                    "callSid": CALL_SID,
+                    "tracks": ["inbound"],
+                    "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                },
+            }
+        ),
+    ]
+    for index in range(seconds * 50):
+        packets.append(
+            json.dumps(
+                {
+                    "event": "media",
+                    "sequenceNumber": str(index + 2),
+                    "media": {
+                        "track": "inbound",
+                        "chunk": str(index + 1),
+                        "timestamp": str(index * 20),
+                        "payload": base64.b64encode(os.urandom(160)).decode(),
+                    },
+                    "streamSid": STREAM_SID,
+                },
+                separators=(",", ":"),
+            )
+        )
+    packets.append(
+        json.dumps(
+            {
+                "event": "stop",
+                "streamSid": STREAM_SID,
+                "stop": {"accountSid": "AC00000000000000000000000000000000", "callSid": CALL_SID},
+            }
+        )
+    )
+    return packets
+
+
+def validated_path(packet: str) -> None:
+    validated_packet = TwilioEventSchema.model_validate_json(packet)
+    if validated_packet.event == "media" and validated_packet.media:
+        base64.b64decode(validated_packet.media.payload)
+
+
+def fast_path(packet: str) -> None:
+    if parse_media_payload(packet) is None:
+        TwilioEventSchema.model_validate_json(packet)
+
+
+def measure(handler: Callable[[str], None], packets: List[str], repeat: int) -> float:
+    """Return CPU microseconds per packet"""
+    started = time.process_time()
+    for _ in range(repeat):
+        for packet in packets:
+            handler(packet)
+    return (time.process_time() - started) / (repeat * len(packets)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--packets", help="recorded Twilio stream, one message per line")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--min-speedup", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.packets:
+        with open(args.packets) as file:
+            packets = [line.strip() for line in file if line.strip()]
+    else:
+        packets = synthesize_stream(seconds=60)
+
+    before = measure(validated_path, packets, args.repeat)
+    after = measure(fast_path, packets, args.repeat)
+    print(f"packets:          {len(packets)}")
+    print(f"validated path:   {before:.2f} us/packet")
+    print(f"fast path:        {after:.2f} us/packet")
+    print(f"speedup:          {before / after:.1f}x (at least {args.min_speedup:.1f}x)")
+    passed = before / after >= args.min_speedup
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
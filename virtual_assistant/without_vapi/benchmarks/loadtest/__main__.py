@@ -0,0 +1,272 @@
+"""
+Offline load test of the media stream endpoint.
+
+Starts the stand-in providers (`benchmarks.loadtest.fakes`) and the app
+(`benchmarks.loadtest.server`, pointed at the fakes) in their own processes, then
+drives `--calls` concurrent simulated Twilio calls against `/ws/{bot_id}/audio/stream`
+and reports:
+
+- calls per core: mean concurrent calls divided by the app's CPU utilization
+- event loop lag of the app (p50/p99/max)
+- turn latency, from the caller's end of speech to the first frame of the reply
+  (this includes the STT endpointing delay, as on a real call)
+- resident memory per call, from the app's RSS at peak minus its RSS before the calls
+
+No Twilio, Deepgram, OpenAI or Supabase credentials are needed. Callers replay
+recorded utterances (`--audio`, headerless 8 kHz mu-law files) or, by default,
+a synthesized one.
+
+Usage (from the without_vapi directory):
+
+    python -m benchmarks.loadtest [--calls 50] [--turns 3] [--ramp-seconds 10]
+        [--audio utterance.ulaw ...] [--llm-latency-ms 400] [--jitter-ms 50]
+        [--output report.json]
+
+Run it before and after a performance change, with the same arguments, and
+compare the reports.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+import numpy as np
+
+from benchmarks.loadtest import audio, fakes
+from benchmarks.loadtest.twilio import CallResult, FakeTwilioCall
+
+STARTUP_TIMEOUT_SECONDS = 30
+STATS_INTERVAL_SECONDS = 1.0
+# Bearer token of the admin endpoints of the app under test
+ADMIN_TOKEN = "loadtest"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_environment(fakes_url: str, app_port: int, args: argparse.Namespace) -> Dict[str, str]:
+    environment = dict(os.environ)
+    # Placeholder credentials, so a developer's .env never reaches a real provider
+    environment.update(
+        {
+            "OPEN_AI_API_KEY": "sk-loadtest",
+            "APP_BACKEND_WEBSOCKET_DOMAIN": f"ws://127.0.0.1:{app_port}",
+            "TWILIO_AUTH_TOKEN": "loadtest",
+            "TWILIO_ACCOUNT_SID": "ACloadtest",
+            "SUPABASE_API_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.loadtest",
+            "DEEPGRAM_SECRET_KEY": "loadtest",
+            "SUMMARIZATION_URL": f"{fakes_url}/summarize",
+            "LLM_BACKEND": args.llm_backend,
+            "ADMIN_TOKEN": ADMIN_TOKEN,
+            **fakes.app_environment(fakes_url),
+        }
+    )
+    return environment
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str, process: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            async with session.get(url) as response:
+                if response.status < 500:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up")
+
+
+async def app_stats(session: aiohttp.ClientSession, app_url: str) -> Dict:
+    async with session.get(f"{app_url}/loadtest/stats") as response:
+        return await response.json()
+
+
+async def sample_memory(
+    session: aiohttp.ClientSession, app_url: str, samples: List[int], stop: asyncio.Event
+) -> None:
+    while not stop.is_set():
+        samples.append((await app_stats(session, app_url))["rss_bytes"])
+        try:
+            await asyncio.wait_for(stop.wait(), STATS_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_calls(args: argparse.Namespace, ws_url: str, utterances: List[bytes]):
+    async def call(delay: float) -> CallResult:
+        await asyncio.sleep(delay)
+        return await FakeTwilioCall(ws_url, utterances, args.turns).run(session)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(
+            *[call(args.ramp_seconds * index / args.calls) for index in range(args.calls)]
+        )
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+def build_report(
+    args: argparse.Namespace,
+    results: List[CallResult],
+    before: Dict,
+    after: Dict,
+    rss_samples: List[int],
+    wall_seconds: float,
+) -> Dict:
+    completed = [result for result in results if result.error is None]
+    cpu_seconds = after["cpu_seconds"] - before["cpu_seconds"]
+    utilization = cpu_seconds / wall_seconds
+    call_seconds = sum(result.ended_at - result.started_at for result in results)
+    mean_concurrency = call_seconds / wall_seconds
+    rss_peak = max(rss_samples + [after["rss_bytes"]])
+    return {
+        "arguments": {key: value for key, value in vars(args).items() if key != "audio"},
+        "calls": args.calls,
+        "completed_calls": len(completed),
+        "errors": sorted({result.error for result in results if result.error}),
+        "turns": sum(len(result.turn_latencies_ms) for result in results),
+        "turn_timeouts": sum(result.timeouts for result in results),
+        "wall_seconds": wall_seconds,
+        "mean_concurrent_calls": mean_concurrency,
+        "app_cpu_seconds": cpu_seconds,
+        "app_cpu_utilization": utilization,
+        "calls_per_core": mean_concurrency / utilization if utilization else None,
+        "loop_lag_ms": after["loop_lag_ms"],
+        "turn_latency_ms": percentiles(
+            [latency for result in results for latency in result.turn_latencies_ms]
+        ),
+        "greeting_latency_ms": percentiles(
+            [result.greeting_ms for result in results if result.greeting_ms is not None]
+        ),
+        "rss_before_bytes": before["rss_bytes"],
+        "rss_peak_bytes": rss_peak,
+        "rss_per_call_bytes": (rss_peak - before["rss_bytes"]) / args.calls,
+    }
+
+
+def print_report(report: Dict) -> None:
+    def ms(values: Dict) -> str:
+        return "  ".join(
+            f"{key} {value:.1f}" if value is not None else f"{key} -"
+            for key, value in values.items()
+        )
+
+    print(f"calls:               {report['completed_calls']}/{report['calls']} completed")
+    for error in report["errors"]:
+        print(f"  error:             {error}")
+    print(f"turns:               {report['turns']} ({report['turn_timeouts']} timed out)")
+    print(f"mean concurrency:    {report['mean_concurrent_calls']:.1f} calls")
+    print(
+        f"app CPU:             {report['app_cpu_seconds']:.1f}s "
+        f"({report['app_cpu_utilization']:.0%} of one core)"
+    )
+    if report["calls_per_core"] is not None:
+        print(f"calls per core:      {report['calls_per_core']:.0f}")
+    print(f"event loop lag (ms): {ms(report['loop_lag_ms'])}")
+    print(f"turn latency (ms):   {ms(report['turn_latency_ms'])}")
+    print(f"greeting (ms):       {ms(report['greeting_latency_ms'])}")
+    print(
+        f"memory:              {report['rss_per_call_bytes'] / 1024:.0f} KiB per call "
+        f"(peak RSS {report['rss_peak_bytes'] / 2**20:.0f} MiB)"
+    )
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    utterances = (
+        audio.load_utterances(args.audio)
+        if args.audio
+        else [audio.synthesize_speech(args.utterance_seconds)]
+    )
+    fakes_port, app_port = free_port(), free_port()
+    fakes_url, app_url = f"http://127.0.0.1:{fakes_port}", f"http://127.0.0.1:{app_port}"
+    latency_arguments = [
+        f"--{name}-latency-ms={getattr(args, f'{name}_latency_ms')}"
+        for name in ("database", "stt", "llm", "tts")
+    ] + [f"--jitter-ms={args.jitter_ms}", f"--token-ms={args.token_ms}"]
+
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.loadtest.fakes", f"--port={fakes_port}"]
+            + latency_arguments,
+            stdout=subprocess.DEVNULL,
+        )
+    ]
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_until_up(session, f"{fakes_url}/rest/v1/bots", processes[0])
+            processes.append(
+                subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.loadtest.server", f"--port={app_port}"],
+                    env=app_environment(fakes_url, app_port, args),
+                    # The app's logs still go to its log file under logs/
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            )
+            await wait_until_up(session, f"{app_url}/loadtest/stats", processes[1])
+            # Let the cache warm-up and the STT pool settle before measuring
+            await asyncio.sleep(args.settle_seconds)
+            await session.post(f"{app_url}/loadtest/reset")
+            before = await app_stats(session, app_url)
+
+            rss_samples: List[int] = []
+            stop_sampling = asyncio.Event()
+            sampler = asyncio.create_task(
+                sample_memory(session, app_url, rss_samples, stop_sampling)
+            )
+            started = time.monotonic()
+            results = await run_calls(
+                args, f"ws://127.0.0.1:{app_port}/ws/{fakes.BOT_ID}/audio/stream", utterances
+            )
+            wall_seconds = time.monotonic() - started
+            stop_sampling.set()
+            await sampler
+            after = await app_stats(session, app_url)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    return build_report(args, results, before, after, rss_samples, wall_seconds)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--ramp-seconds", type=float, default=5)
+    parser.add_argument("--settle-seconds", type=float, default=2)
+    parser.add_argument("--audio", nargs="+", help="Recorded utterances (8 kHz mu-law, raw)")
+    parser.add_argument("--utterance-seconds", type=float, default=1.5)
+    parser.add_argument("--llm-backend", default="assistants")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    fakes.add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+8 kHz G.711 mu-law audio for the load test: encoding, speech detection and the
+caller utterances replayed into the fake Twilio media streams.
+"""
+
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+SAMPLE_RATE = 8000
+FRAME_BYTES = SAMPLE_RATE * 20 // 1000  # One 20 ms Twilio media frame
+SILENCE_BYTE = b"\xff"
+# RMS (in 16-bit PCM units) above which a frame counts as speech
+SPEECH_RMS_THRESHOLD = 500.0
+
+
+def _decode_table() -> np.ndarray:
+    codes = ~np.arange(256) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.float32)
+
+
+MULAW_TO_PCM = _decode_table()
+
+
+def encode(samples: np.ndarray) -> bytes:
+    """Encode 16-bit PCM samples as mu-law"""
+    samples = np.clip(samples.astype(np.int32), -32635, 32635)
+    sign = np.where(samples < 0, 0x80, 0)
+    magnitude = np.abs(samples) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+def is_speech(frame: bytes) -> bool:
+    if not frame:
+        return False
+    pcm = MULAW_TO_PCM[np.frombuffer(frame, dtype=np.uint8)]
+    return float(np.sqrt(np.mean(pcm * pcm))) > SPEECH_RMS_THRESHOLD
+
+
+def silence(seconds: float) -> bytes:
+    return SILENCE_BYTE * int(seconds * SAMPLE_RATE)
+
+
+def synthesize_speech(seconds: float, pitch_hz: float = 140.0, amplitude: float = 6000.0) -> bytes:
+    """
+    A voiced, speech-like signal: a few harmonics of `pitch_hz` modulated at a
+    syllable rate of 4 Hz. Loud enough to pass `is_speech` throughout.
+    """
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voice = sum(np.sin(2 * np.pi * pitch_hz * k * t) / k for k in range(1, 5))
+    envelope = 0.6 + 0.4 * np.abs(np.sin(2 * np.pi * 2 * t))
+    return encode(amplitude * envelope * voice / 2)
+
+
+def load_utterances(paths: List[str]) -> List[bytes]:
+    """
+    Read recorded caller utterances, one headerless 8 kHz mu-law file each (as
+    captured from a Twilio media stream). Leading and trailing silence is
+    trimmed so that the end of speech is where the recording ends.
+    """
+    utterances = []
+    for path in paths:
+        audio = Path(path).read_bytes()
+        frames = [audio[i : i + FRAME_BYTES] for i in range(0, len(audio), FRAME_BYTES)]
+        voiced = [index for index, frame in enumerate(frames) if is_speech(frame)]
+        if not voiced:
+            raise ValueError(f"No speech found in {path}")
+        utterances.append(b"".join(frames[voiced[0] : voiced[-1] + 1]))
+    return utterances
@@ -0,0 +1,554 @@
+"""
+Local stand-ins for the providers a call talks to: Supabase (PostgREST), Deepgram
+STT (live websocket) and TTS, and the OpenAI Assistants and Chat Completions APIs.
+
+Every response is delayed by a configurable latency plus uniform jitter. The fakes
+implement only what `without_vapi` uses, with payloads shaped like the real ones so
+the provider SDKs parse them unchanged.
+
+Run them on their own to point a manually started app at them:
+
+    python -m benchmarks.loadtest.fakes [--port 9100] [--llm-latency-ms 400]
+
+and start the app with the environment printed on startup.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+from benchmarks.loadtest import audio
+
+BOT_ID = "loadtest"
+ASSISTANT_ID = "asst_loadtest"
+GREETING = "Thanks for calling Load Test Dental, how can I help you today?"
+
+# Scripted caller questions, transcribed in order on every STT connection
+QUESTIONS = [
+    "What are your opening hours on Saturday?",
+    "Do you take new patients for cleanings?",
+    "How much does a checkup cost without insurance?",
+    "Can I book an appointment for next Tuesday morning?",
+    "Where can I park when I come to the office?",
+]
+ANSWERS = [
+    "We are open from nine to one on Saturdays. On weekdays we are open until six.",
+    "Yes, we are happy to welcome new patients. A first cleaning takes about an hour.",
+    "A checkup without insurance is ninety five dollars. X-rays are charged separately.",
+    "Tuesday morning has openings at nine and at eleven. Which one works better for you?",
+    "There is free parking behind the building. The entrance is on Maple Street.",
+]
+SUMMARY = (
+    "The caller asked about opening hours, prices and appointments. They were told about "
+    "Saturday hours, the checkup price and Tuesday morning openings."
+)
+
+# Deepgram finalizes a transcript after this much trailing silence (LiveOptions.endpointing)
+ENDPOINTING_SECONDS = 0.4
+UTTERANCE_END_SECONDS = 1.0
+INTERIM_INTERVAL_SECONDS = 0.25
+# Spoken duration of one word of synthesized speech, and how much faster than
+# real time the fake TTS streams it
+TTS_SECONDS_PER_WORD = 0.3
+TTS_REALTIME_FACTOR = 4.0
+TTS_CHUNK_BYTES = 1600
+
+
+@dataclass(slots=True)
+class Latency:
+    """Delay of a provider's response: `base_ms` plus uniform jitter of up to `jitter_ms`"""
+
+    base_ms: float = 0.0
+    jitter_ms: float = 0.0
+
+    def sample(self) -> float:
+        return max(0.0, self.base_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+
+class _TranscriptionSession:
+    """
+    One Deepgram live connection. Speech is detected by frame energy on the audio
+    clock of the stream, and each utterance is "transcribed" as the next scripted
+    question: interim results while it lasts, then a final result once
+    ENDPOINTING_SECONDS of silence follow it.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, latency: Latency) -> None:
+        self._ws = ws
+        self._latency = latency
+        self._outbox: asyncio.Queue[Optional[tuple[float, str]]] = asyncio.Queue()
+        self._sender = asyncio.create_task(self._send_loop())
+        self._pending = b""
+
+        self._clock = 0.0
+        self._speaking = False
+        self._speech_started_at = 0.0
+        self._silence = 0.0
+        self._last_interim_at = 0.0
+        self._utterance_end_at: Optional[float] = None
+        self._utterances = 0
+
+    async def _send_loop(self) -> None:
+        while (item := await self._outbox.get()) is not None:
+            due, message = item
+            if (delay := due - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            if self._ws.closed:
+                return
+            await self._ws.send_str(message)
+
+    def _send(self, message: Dict) -> None:
+        self._outbox.put_nowait((time.monotonic() + self._latency.sample(), json.dumps(message)))
+
+    def feed(self, chunk: bytes) -> None:
+        self._pending += chunk
+        while len(self._pending) >= audio.FRAME_BYTES:
+            frame = self._pending[: audio.FRAME_BYTES]
+            self._pending = self._pending[audio.FRAME_BYTES :]
+            self._on_frame(audio.is_speech(frame))
+            self._clock += audio.FRAME_BYTES / audio.SAMPLE_RATE
+
+    def _on_frame(self, speech: bool) -> None:
+        if speech:
+            self._silence = 0.0
+            if not self._speaking:
+                self._speaking = True
+                self._speech_started_at = self._last_interim_at = self._clock
+                self._utterance_end_at = None
+                self._send({"type": "SpeechStarted", "channel": [0], "timestamp": self._clock})
+            elif self._clock - self._last_interim_at >= INTERIM_INTERVAL_SECONDS:
+                self._last_interim_at = self._clock
+                words = self._question.split()
+                heard = int((self._clock - self._speech_started_at) / INTERIM_INTERVAL_SECONDS)
+                self._send(self._result(" ".join(words[: min(heard, len(words) - 1)]), False))
+            return
+
+        if self._speaking:
+            self._silence += audio.FRAME_BYTES / audio.SAMPLE_RATE
+            if self._silence >= ENDPOINTING_SECONDS:
+                self._speaking = False
+                self._send(self._result(self._question, True))
+                self._utterances += 1
+                self._utterance_end_at = self._clock + UTTERANCE_END_SECONDS - self._silence
+        elif self._utterance_end_at is not None and self._clock >= self._utterance_end_at:
+            self._utterance_end_at = None
+            self._send({"type": "UtteranceEnd", "channel": [0, 1], "last_word_end": self._clock})
+
+    @property
+    def _question(self) -> str:
+        return QUESTIONS[self._utterances % len(QUESTIONS)]
+
+    def _result(self, transcript: str, final: bool) -> Dict:
+        start = self._speech_started_at
+        end = self._clock - self._silence if final else self._clock
+        words = transcript.split()
+        step = (end - start) / max(len(words), 1)
+        return {
+            "type": "Results",
+            "channel_index": [0, 1],
+            "duration": round(self._clock - start, 3),
+            "start": round(start, 3),
+            "is_final": final,
+            "speech_final": final,
+            "channel": {
+                "alternatives": [
+                    {
+                        "transcript": transcript,
+                        "confidence": 0.99,
+                        "words": [
+                            {
+                                "word": word.strip("?.,!").lower(),
+                                "start": round(start + index * step, 3),
+                                "end": round(start + (index + 1) * step, 3),
+                                "confidence": 0.99,
+                                "punctuated_word": word,
+                            }
+                            for index, word in enumerate(words)
+                        ],
+                    }
+                ]
+            },
+            "metadata": {
+                "request_id": str(uuid.uuid4()),
+                "model_info": {"name": "general-nova-2", "version": "loadtest", "arch": "nova-2"},
+                "model_uuid": str(uuid.uuid4()),
+            },
+        }
+
+    async def close(self) -> None:
+        self._outbox.put_nowait(None)
+        await self._sender
+
+
+class FakeProviders:
+    """
+    The stand-in servers, served from one aiohttp application.
+
+    Args:
+        database: Latency of Supabase queries.
+        stt: Latency of each Deepgram STT message.
+        llm: Time to the first token of an OpenAI response.
+        tts: Time to the first audio byte of a Deepgram TTS response.
+        token_ms: Delay between OpenAI tokens after the first.
+    """
+
+    def __init__(
+        self,
+        database: Latency,
+        stt: Latency,
+        llm: Latency,
+        tts: Latency,
+        token_ms: float = 20.0,
+    ) -> None:
+        self.database = database
+        self.stt = stt
+        self.llm = llm
+        self.tts = tts
+        self.token_ms = token_ms
+        self.requests: Counter[str] = Counter()
+        self._runs: Dict[str, str] = {}
+        # Messages of each Assistants thread, in order, as the app left them
+        self.threads: Dict[str, List[Dict]] = {}
+        self._tts_audio = audio.synthesize_speech(5, pitch_hz=200.0, amplitude=3000.0)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/rest/v1/bots", self.bots)
+        app.router.add_get("/v1/listen", self.listen)
+        app.router.add_post("/v1/speak", self.speak)
+        app.router.add_get("/v1/assistants/{assistant_id}", self.assistant)
+        app.router.add_post("/v1/threads", self.create_thread)
+        app.router.add_post("/v1/threads/{thread_id}/messages", self.create_message)
+        app.router.add_delete("/v1/threads/{thread_id}/messages/{message_id}", self.delete_message)
+        app.router.add_post("/v1/threads/{thread_id}/runs", self.create_run)
+        app.router.add_get("/v1/threads/{thread_id}/runs/{run_id}", self.retrieve_run)
+        app.router.add_post("/v1/threads/{thread_id}/runs/{run_id}/cancel", self.cancel_run)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+    async def _delay(self, latency: Latency) -> None:
+        if delay := latency.sample():
+            await asyncio.sleep(delay)
+
+    # Supabase
+
+    async def bots(self, request: web.Request) -> web.Response:
+        self.requests["supabase"] += 1
+        await self._delay(self.database)
+        bot = {
+            "bot_id": BOT_ID,
+            "gpt_assistant_id": ASSISTANT_ID,
+            "gpt_vector_store_id": None,
+            "active": True,
+            "greeting": GREETING,
+            "billing_status": "active",
+            "botDocuments": [],
+        }
+        # maybe_single() asks PostgREST for a single object instead of an array
+        if request.headers.get("Accept") == "application/vnd.pgrst.object+json":
+            return web.json_response(bot)
+        return web.json_response([bot])
+
+    # Deepgram
+
+    async def listen(self, request: web.Request) -> web.WebSocketResponse:
+        self.requests["deepgram_stt"] += 1
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session = _TranscriptionSession(ws, self.stt)
+        async for message in ws:
+            if message.type == WSMsgType.BINARY:
+                session.feed(message.data)
+            elif message.type == WSMsgType.TEXT and json.loads(message.data).get("type") == (
+                "CloseStream"
+            ):
+                break
+        await session.close()
+        await ws.close()
+        return ws
+
+    async def speak(self, request: web.Request) -> web.StreamResponse:
+        self.requests["deepgram_tts"] += 1
+        text = (await request.json())["text"]
+        length = int(len(text.split()) * TTS_SECONDS_PER_WORD * audio.SAMPLE_RATE)
+        await self._delay(self.tts)
+        response = web.StreamResponse(headers={"Content-Type": "audio/mulaw"})
+        await response.prepare(request)
+        for start in range(0, length, TTS_CHUNK_BYTES):
+            offset = start % len(self._tts_audio)
+            chunk = self._tts_audio[offset : offset + min(TTS_CHUNK_BYTES, length - start)]
+            await response.write(chunk)
+            await asyncio.sleep(len(chunk) / audio.SAMPLE_RATE / TTS_REALTIME_FACTOR)
+        await response.write_eof()
+        return response
+
+    # OpenAI
+
+    async def assistant(self, request: web.Request) -> web.Response:
+        self.requests["openai"] += 1
+        await self._delay(self.database)
+        return web.json_response(
+            {
+                "id": request.match_info["assistant_id"],
+                "object": "assistant",
+                "created_at": int(time.time()),
+                "name": "Load test",
+                "model": "gpt-4o-mini",
+                "instructions": "Answer the caller's questions briefly.",
+                "tools": [],
+                "metadata": {},
+            }
+        )
+
+    async def create_thread(self, request: web.Request) -> web.Response:
+        self.requests["openai"] += 1
+        await self._delay(self.database)
+        thread_id = f"thread_{uuid.uuid4().hex}"
+        self.threads[thread_id] = []
+        return web.json_response(
+            {
+                "id": thread_id,
+                "object": "thread",
+                "created_at": int(time.time()),
+                "metadata": {},
+            }
+        )
+
+    def _message(self, thread_id: str, role: str, text: str) -> Dict:
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "status": "completed",
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "attachments": [],
+            "metadata": {},
+        }
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        self.requests["openai"] += 1
+        body = await request.json()
+        await self._delay(self.database)
+        content = body.get("content")
+        text = content if isinstance(content, str) else json.dumps(content)
+        thread_id = request.match_info["thread_id"]
+        message = self._message(thread_id, body.get("role", "user"), text)
+        self.threads.setdefault(thread_id, []).append(message)
+        return web.json_response(message)
+
+    async def delete_message(self, request: web.Request) -> web.Response:
+        self.requests["openai"] += 1
+        message_id = request.match_info["message_id"]
+        thread = self.threads.get(request.match_info["thread_id"], [])
+        thread[:] = [message for message in thread if message["id"] != message_id]
+        return web.json_response(
+            {
+                "id": request.match_info["message_id"],
+                "object": "thread.message.deleted",
+                "deleted": True,
+            }
+        )
+
+    def _run(self, thread_id: str, run_id: str, status: str) -> Dict:
+        return {
+            "id": run_id,
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": ASSISTANT_ID,
+            "status": status,
+            "model": "gpt-4o-mini",
+            "instructions": "",
+            "tools": [],
+            "metadata": {},
+        }
+
+    def _tokens(self) -> List[str]:
+        words = random.choice(ANSWERS).split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    async def _sse(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        return response
+
+    @staticmethod
+    async def _write_event(response: web.StreamResponse, event: Optional[str], data: str) -> None:
+        prefix = f"event: {event}\n" if event else ""
+        await response.write(f"{prefix}data: {data}\n\n".encode())
+
+    async def create_run(self, request: web.Request) -> web.StreamResponse:
+        self.requests["openai"] += 1
+        thread_id = request.match_info["thread_id"]
+        run_id = f"run_{uuid.uuid4().hex}"
+        self._runs[run_id] = "in_progress"
+        response = await self._sse(request)
+
+        async def event(name: str, data: Dict) -> None:
+            await self._write_event(response, name, json.dumps(data))
+
+        try:
+            await event("thread.run.created", self._run(thread_id, run_id, "queued"))
+            await self._delay(self.llm)
+            message = self._message(thread_id, "assistant", "")
+            self.threads.setdefault(thread_id, []).append(message)
+            await event("thread.message.created", message)
+            tokens = self._tokens()
+            for index, token in enumerate(tokens):
+                if index:
+                    await asyncio.sleep(self.token_ms / 1000)
+                if self._runs.get(run_id) == "cancelled":
+                    break
+                await event(
+                    "thread.message.delta",
+                    {
+                        "id": message["id"],
+                        "object": "thread.message.delta",
+                        "delta": {
+                            "content": [{"index": 0, "type": "text", "text": {"value": token}}]
+                        },
+                    },
+                )
+            message["content"][0]["text"]["value"] = "".join(tokens)
+            await event("thread.message.completed", message)
+            await event("thread.run.completed", self._run(thread_id, run_id, "completed"))
+            await self._write_event(response, "done", "[DONE]")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The app closed the stream, e.g. after the caller interrupted
+            pass
+        finally:
+            self._runs.pop(run_id, None)
+        return response
+
+    async def retrieve_run(self, request: web.Request) -> web.Response:
+        self.requests["openai"] += 1
+        run_id = request.match_info["run_id"]
+        status = self._runs.get(run_id, "completed")
+        return web.json_response(self._run(request.match_info["thread_id"], run_id, status))
+
+    async def cancel_run(self, request: web.Request) -> web.Response:
+        self.requests["openai"] += 1
+        run_id = request.match_info["run_id"]
+        if run_id in self._runs:
+            self._runs[run_id] = "cancelled"
+        return web.json_response(self._run(request.match_info["thread_id"], run_id, "cancelled"))
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests["openai"] += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        if not (await request.json()).get("stream"):
+            # Conversation summaries are the only requests that are not streamed
+            await self._delay(self.llm)
+            return web.json_response(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": "gpt-4o-mini",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": SUMMARY},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            )
+        response = await self._sse(request)
+
+        async def chunk(delta: Dict, finish_reason: Optional[str] = None) -> None:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "gpt-4o-mini",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            await self._write_event(response, None, json.dumps(data))
+
+        try:
+            await self._delay(self.llm)
+            await chunk({"role": "assistant", "content": ""})
+            for index, token in enumerate(self._tokens()):
+                if index:
+                    await asyncio.sleep(self.token_ms / 1000)
+                await chunk({"content": token})
+            await chunk({}, "stop")
+            await self._write_event(response, None, "[DONE]")
+            await response.write_eof()
+        except ConnectionResetError:
+            pass
+        return response
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser) -> None:
+    for name, default in (("database", 30), ("stt", 80), ("llm", 400), ("tts", 150)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=default)
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Applied to every latency")
+    parser.add_argument("--token-ms", type=float, default=20, help="Delay between LLM tokens")
+
+
+def providers_from_arguments(args: argparse.Namespace) -> FakeProviders:
+    def latency(name: str) -> Latency:
+        return Latency(getattr(args, f"{name}_latency_ms"), args.jitter_ms)
+
+    return FakeProviders(
+        database=latency("database"),
+        stt=latency("stt"),
+        llm=latency("llm"),
+        tts=latency("tts"),
+        token_ms=args.token_ms,
+    )
+
+
+async def start(providers: FakeProviders, port: int = 0) -> tuple[web.AppRunner, str]:
+    """Serve the fakes on localhost and return the runner and their base URL"""
+    runner = web.AppRunner(providers.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def app_environment(base_url: str) -> Dict[str, str]:
+    """Settings that point the app at the fakes"""
+    return {
+        "SUPABASE_URL": base_url,
+        "DEEPGRAM_STT_URL": base_url,
+        "DEEPGRAM_TTS_URL": f"{base_url}/v1/speak",
+        "OPEN_AI_BASE_URL": f"{base_url}/v1",
+    }
+
+
+async def serve(args: argparse.Namespace) -> None:
+    runner, base_url = await start(providers_from_arguments(args), args.port)
+    print(f"Fake providers listening on {base_url}; bot ID: {BOT_ID}")
+    for key, value in app_environment(base_url).items():
+        print(f"export {key}={value}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=9100)
+    add_latency_arguments(parser)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Runs the app under uvicorn for the load test, with a probe of its own event loop.
+
+The probe sleeps PROBE_INTERVAL_SECONDS at a time and records how late it wakes up,
+which is how long the loop was busy with other work. `GET /loadtest/stats` returns
+the lag percentiles since the last `POST /loadtest/reset` along with the process's
+CPU time, resident memory and open file descriptors, and what calls have left
+behind: conversations still in memory, call tasks and leased STT connections.
+
+Started by `python -m benchmarks.loadtest`; the app's settings come from the environment.
+
+    python -m benchmarks.loadtest.server [--port 8090]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import time
+from typing import List
+
+import numpy as np
+import uvicorn
+from fastapi.responses import JSONResponse
+
+from app.main import app
+from app.services.conversation import conversation_stats
+from app.services.pool import provider_pool
+from app.services.tasks import call_task_totals
+
+PROBE_INTERVAL_SECONDS = 0.05
+
+
+class LoopLagProbe:
+    def __init__(self) -> None:
+        self.samples: List[float] = []
+        self.max_samples = 100_000
+
+    async def run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+            lag = time.perf_counter() - started - PROBE_INTERVAL_SECONDS
+            if len(self.samples) < self.max_samples:
+                self.samples.append(max(lag, 0.0) * 1000)
+
+    def percentiles(self) -> dict:
+        if not self.samples:
+            return {}
+        values = np.asarray(self.samples)
+        return {
+            "p50": float(np.percentile(values, 50)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max()),
+        }
+
+
+probe = LoopLagProbe()
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def open_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+@app.get("/loadtest/stats")
+async def loadtest_stats():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return JSONResponse(
+        {
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            "rss_bytes": rss_bytes(),
+            "open_fds": open_fds(),
+            "loop_lag_ms": probe.percentiles(),
+            "conversations": conversation_stats(),
+            "call_tasks": call_task_totals.stats(),
+            "stt_active": provider_pool.stats()["stt_active"],
+        }
+    )
+
+
+@app.post("/loadtest/reset", status_code=204)
+async def loadtest_reset():
+    probe.samples.clear()
+
+
+async def serve(port: int) -> None:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws_ping_interval=None)
+    )
+    probe_task = asyncio.create_task(probe.run())
+    try:
+        await server.serve()
+    finally:
+        probe_task.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8090)
+    asyncio.run(serve(parser.parse_args().port))
+
+
+if __name__ == "__main__":
+    main()
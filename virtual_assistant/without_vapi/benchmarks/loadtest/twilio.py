@@ -0,0 +1,243 @@
+"""
+Simulated callers: each one connects to `/ws/{bot_id}/audio/stream` the way a Twilio
+media stream does and talks to the bot in turns.
+
+A caller streams a 20 ms media frame in real time for the whole call, silence
+unless it is speaking. It waits for the greeting to finish playing, says an
+utterance, measures the time from its end of speech to the first frame of the
+bot's reply, waits for the reply to finish playing, and repeats. Playback is
+emulated like Twilio does it: outbound audio plays at 8 kHz, a `mark` is echoed
+back once the audio sent before it has played, and a `clear` drops what is left.
+"""
+
+import asyncio
+import base64
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import aiohttp
+
+from benchmarks.loadtest import audio
+
+FRAME_SECONDS = audio.FRAME_BYTES / audio.SAMPLE_RATE
+# How long the bot must stay quiet after its last mark before the caller speaks again
+IDLE_SECONDS = 0.3
+# Pause between the end of the bot's answer and the caller's next utterance
+THINK_SECONDS = 0.5
+REPLY_TIMEOUT_SECONDS = 15.0
+GREETING_TIMEOUT_SECONDS = 20.0
+
+_MEDIA = (
+    '{"event":"media","sequenceNumber":"%d","streamSid":"%s",'
+    '"media":{"track":"inbound","chunk":"%d","timestamp":"%d","payload":"%s"}}'
+)
+_SILENT_PAYLOAD = base64.b64encode(audio.silence(FRAME_SECONDS)).decode()
+
+
+@dataclass(slots=True)
+class CallResult:
+    call_sid: str
+    started_at: float
+    ended_at: float = 0.0
+    greeting_ms: Optional[float] = None
+    turn_latencies_ms: List[float] = field(default_factory=list)
+    timeouts: int = 0
+    frames_sent: int = 0
+    frames_received: int = 0
+    error: Optional[str] = None
+
+
+class FakeTwilioCall:
+    """
+    One simulated caller.
+
+    Args:
+        url: WebSocket URL of the app's media stream endpoint.
+        utterances: mu-law utterances, said in turn order (cycled).
+        turns: Number of utterances to say before hanging up.
+    """
+
+    def __init__(self, url: str, utterances: List[bytes], turns: int) -> None:
+        self.url = url
+        self.utterances = utterances
+        self.turns = turns
+        self.call_sid = f"CA{uuid.uuid4().hex}"
+        self.stream_sid = f"MZ{uuid.uuid4().hex}"
+        self.result = CallResult(self.call_sid, started_at=time.monotonic())
+
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._speech = bytearray()
+        self._speech_sent = asyncio.Event()
+        self._speech_ended_at: Optional[float] = None
+        self._reply_started = asyncio.Event()
+        self._playback_ends_at = 0.0
+        self._pending_marks: List[asyncio.Task] = []
+        self._last_mark_at = 0.0
+        self._sequence = 0
+
+    async def run(self, session: aiohttp.ClientSession) -> CallResult:
+        try:
+            async with session.ws_connect(self.url, autoping=True) as ws:
+                self._ws = ws
+                await self._send_json(
+                    {"event": "connected", "protocol": "Call", "version": "1.0.0"}
+                )
+                await self._send_json(self._start_event())
+                sender = asyncio.create_task(self._send_audio())
+                receiver = asyncio.create_task(self._receive())
+                try:
+                    await self._converse(receiver)
+                finally:
+                    sender.cancel()
+                    for mark in self._pending_marks:
+                        mark.cancel()
+                    if not ws.closed:
+                        await self._send_json(
+                            {
+                                "event": "stop",
+                                "streamSid": self.stream_sid,
+                                "stop": {"accountSid": "ACloadtest", "callSid": self.call_sid},
+                            }
+                        )
+                    await ws.close()
+                    receiver.cancel()
+        except Exception as e:
+            self.result.error = f"{type(e).__name__}: {e}"
+        self.result.ended_at = time.monotonic()
+        return self.result
+
+    def _start_event(self) -> dict:
+        self._sequence += 1
+        return {
+            "event": "start",
+            "sequenceNumber": str(self._sequence),
+            "streamSid": self.stream_sid,
+            "start": {
+                "streamSid": self.stream_sid,
+                "accountSid": "ACloadtest",
+                "callSid": self.call_sid,
+                "tracks": ["inbound"],
+                "mediaFormat": {
+                    "encoding": "audio/x-mulaw",
+                    "sampleRate": audio.SAMPLE_RATE,
+                    "channels": 1,
+                },
+            },
+        }
+
+    async def _send_json(self, data: dict) -> None:
+        await self._ws.send_str(json.dumps(data))
+
+    async def _converse(self, receiver: asyncio.Task) -> None:
+        if not await self._wait(self._reply_started.wait(), receiver, GREETING_TIMEOUT_SECONDS):
+            raise TimeoutError("No greeting")
+        self.result.greeting_ms = (time.monotonic() - self.result.started_at) * 1000
+        await self._wait_until_idle(receiver)
+
+        for turn in range(self.turns):
+            await asyncio.sleep(THINK_SECONDS)
+            self._reply_started.clear()
+            self._speech_sent.clear()
+            self._speech += self.utterances[turn % len(self.utterances)]
+            await self._wait(self._speech_sent.wait(), receiver, None)
+            if not await self._wait(self._reply_started.wait(), receiver, REPLY_TIMEOUT_SECONDS):
+                self.result.timeouts += 1
+                continue
+            await self._wait_until_idle(receiver)
+
+    async def _wait(self, waiter, receiver: asyncio.Task, timeout: Optional[float]) -> bool:
+        """Wait for `waiter`, failing early if the app closed the stream"""
+        waiter = asyncio.ensure_future(waiter)
+        done, _ = await asyncio.wait(
+            {waiter, receiver}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if waiter not in done:
+            waiter.cancel()
+            if receiver in done:
+                raise ConnectionError("Stream closed by the app")
+            return False
+        return True
+
+    async def _wait_until_idle(self, receiver: asyncio.Task) -> None:
+        """Wait until the bot's audio has played out and its last mark came back"""
+        while True:
+            now = time.monotonic()
+            quiet_since = max(self._playback_ends_at, self._last_mark_at)
+            if not self._pending_marks and now - quiet_since >= IDLE_SECONDS:
+                return
+            if receiver.done():
+                raise ConnectionError("Stream closed by the app")
+            await asyncio.sleep(0.05)
+
+    async def _send_audio(self) -> None:
+        """Stream one frame every 20 ms, on an absolute schedule so it does not drift"""
+        next_frame_at = time.monotonic()
+        timestamp_ms = 0
+        while True:
+            if self._speech:
+                frame = bytes(self._speech[: audio.FRAME_BYTES])
+                del self._speech[: audio.FRAME_BYTES]
+                payload = base64.b64encode(frame).decode()
+                if not self._speech:
+                    self._speech_ended_at = time.monotonic()
+                    self._speech_sent.set()
+            else:
+                payload = _SILENT_PAYLOAD
+            self._sequence += 1
+            self.result.frames_sent += 1
+            await self._ws.send_str(
+                _MEDIA % (self._sequence, self.stream_sid, self._sequence, timestamp_ms, payload)
+            )
+            timestamp_ms += int(FRAME_SECONDS * 1000)
+            next_frame_at += FRAME_SECONDS
+            await asyncio.sleep(max(0.0, next_frame_at - time.monotonic()))
+
+    async def _receive(self) -> None:
+        async for message in self._ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json.loads(message.data)
+            now = time.monotonic()
+            match data.get("event"):
+                case "media":
+                    self.result.frames_received += 1
+                    if not self._reply_started.is_set():
+                        if self._speech_ended_at is not None:
+                            self.result.turn_latencies_ms.append(
+                                (now - self._speech_ended_at) * 1000
+                            )
+                            self._speech_ended_at = None
+                        self._reply_started.set()
+                    seconds = len(base64.b64decode(data["media"]["payload"])) / audio.SAMPLE_RATE
+                    self._playback_ends_at = max(self._playback_ends_at, now) + seconds
+                case "mark":
+                    mark = asyncio.create_task(
+                        self._echo_mark(data["mark"]["name"], self._playback_ends_at - now)
+                    )
+                    self._pending_marks.append(mark)
+                    mark.add_done_callback(self._pending_marks.remove)
+                case "clear":
+                    self._playback_ends_at = now
+                    # Twilio returns the marks of cleared audio right away
+                    for mark in list(self._pending_marks):
+                        mark.cancel()
+
+    async def _echo_mark(self, name: str, delay: float) -> None:
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+        finally:
+            self._last_mark_at = time.monotonic()
+            if not self._ws.closed:
+                self._sequence += 1
+                await self._send_json(
+                    {
+                        "event": "mark",
+                        "sequenceNumber": str(self._sequence),
+                        "streamSid": self.stream_sid,
+                        "mark": {"name": name},
+                    }
+                )
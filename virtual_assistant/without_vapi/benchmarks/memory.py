@@ -0,0 +1,191 @@
+"""
+Leak check of the per-call state: after many calls have started and stopped,
+the app's memory has to come back to its baseline.
+
+Runs `--calls` simulated calls through `ConversationManager` in this process,
+`--concurrency` at a time, against the stand-in providers of the load test
+(`benchmarks.loadtest.fakes`, in their own process). Each call starts, plays
+its greeting, has the caller ask `--turns` questions, and stops. Twilio's end
+of the media stream is emulated in memory: marks are echoed back as soon as
+they are sent.
+
+Memory is traced from the start, measured after a warm-up (which fills the
+caches and pools that are meant to stay) and again after all calls, each time
+after a full garbage collection. Exits with status 1 if ConversationManagers are
+still alive or the heap grew by more than `--max-bytes-per-call` per call.
+
+Usage (from the without_vapi directory):
+
+    python -m benchmarks.memory [--calls 1000] [--concurrency 50] [--turns 1]
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Optional
+
+import aiohttp
+
+from benchmarks.loadtest import audio, fakes
+from benchmarks.loadtest.__main__ import app_environment, free_port, wait_until_up
+
+TURN_TIMEOUT_SECONDS = 20
+FRAME_SECONDS = audio.FRAME_BYTES / audio.SAMPLE_RATE
+
+
+class FakeMediaStream:
+    """The websocket a ConversationManager writes to, with Twilio echoing every mark"""
+
+    def __init__(self) -> None:
+        self.on_mark: Optional[Callable[[str], None]] = None
+        self.frames = 0
+
+    async def send_text(self, data: str) -> None:
+        self.frames += 1
+
+    async def send_json(self, data: dict) -> None:
+        if data.get("event") == "mark" and self.on_mark:
+            asyncio.get_running_loop().call_soon(self.on_mark, data["mark"]["name"])
+
+
+async def simulate_call(index: int, bot_details: Dict, turns: int, utterance: bytes) -> None:
+    from app.services.conversation import ConversationManager
+
+    stream = FakeMediaStream()
+    manager = ConversationManager(
+        stream, fakes.BOT_ID, bot_details, call_sid=f"CA{index:032x}", stream_sid=f"MZ{index:032x}"
+    )
+    stream.on_mark = manager.receive_mark
+    await manager.start()
+    try:
+        for turn in range(turns):
+            # One frame every 20 ms, as Twilio sends them
+            next_frame_at = time.monotonic()
+            for offset in range(0, len(utterance), audio.FRAME_BYTES):
+                await manager.receive_audio(utterance[offset : offset + audio.FRAME_BYTES])
+                next_frame_at += FRAME_SECONDS
+                await asyncio.sleep(max(0.0, next_frame_at - time.monotonic()))
+            deadline = time.monotonic() + TURN_TIMEOUT_SECONDS
+            # Answered once the turn's user and assistant messages are both in
+            while len(manager.llm_backend.call_conversation) < 2 * (turn + 1):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Call {index} got no answer to turn {turn + 1}")
+                await asyncio.sleep(0.05)
+    finally:
+        await manager.stop()
+
+
+async def run_calls(
+    count: int, bot_details: Dict, concurrency: int, turns: int, start: int = 0
+) -> int:
+    """Run `count` calls; returns how many failed"""
+    utterance = audio.synthesize_speech(1.0) + audio.silence(1.5)
+    slots = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def call(index: int) -> None:
+        nonlocal failures
+        async with slots:
+            try:
+                await simulate_call(index, bot_details, turns, utterance)
+            except Exception as e:
+                failures += 1
+                print(f"call {index} failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+    await asyncio.gather(*[call(start + index) for index in range(count)])
+    return failures
+
+
+async def heap_bytes() -> int:
+    gc.collect()
+    # Collected async generators are closed by tasks the loop has yet to run
+    await asyncio.sleep(0.1)
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def check(args: argparse.Namespace) -> bool:
+    from app.services.conversation import conversation_stats
+    from app.services.pool import provider_pool
+    from app.services.supabase import get_bot_details
+
+    bot_details = await get_bot_details(fakes.BOT_ID)
+    await provider_pool.start()
+    # Traced from before the warm-up, so that pooled connections and cache entries
+    # replaced during the run net out instead of counting as growth
+    tracemalloc.start()
+    try:
+        failures = await run_calls(args.warmup, bot_details, args.concurrency, args.turns)
+        # Let the pool's background refill settle before taking the baseline
+        await asyncio.sleep(1)
+        baseline = await heap_bytes()
+        before = tracemalloc.take_snapshot() if args.trace else None
+
+        started = time.monotonic()
+        failures += await run_calls(
+            args.calls, bot_details, args.concurrency, args.turns, start=args.warmup
+        )
+        elapsed = time.monotonic() - started
+        await asyncio.sleep(1)
+        after = await heap_bytes()
+        growth_sites = tracemalloc.take_snapshot().compare_to(before, "lineno") if before else []
+        stats = conversation_stats()
+    finally:
+        await provider_pool.close()
+
+    growth = after - baseline
+    per_call = growth / args.calls
+    print(f"calls:            {args.calls} in {elapsed:.0f}s ({failures} failed)")
+    print(f"heap baseline:    {baseline / 1024:.0f} KiB")
+    print(f"heap after:       {after / 1024:.0f} KiB ({growth / 1024:+.0f} KiB)")
+    print(f"growth per call:  {per_call:.0f} bytes (limit {args.max_bytes_per_call})")
+    print(f"managers alive:   {stats['in_memory']}")
+    for stat in growth_sites[: args.trace]:
+        print(f"  {stat}")
+    return failures == 0 and stats["in_memory"] == 0 and per_call <= args.max_bytes_per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=1000)
+    # Tracing slows the process down, and calls run in real time: keep this moderate
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=1)
+    # Enough calls to fill the bounded caches of the standard library and HTTP clients
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--max-bytes-per-call", type=int, default=512)
+    parser.add_argument("--llm-backend", default="assistants")
+    parser.add_argument("--trace", type=int, default=0, help="show the top N allocation sites")
+    args = parser.parse_args()
+
+    fakes_port = free_port()
+    fakes_url = f"http://127.0.0.1:{fakes_port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest.fakes", f"--port={fakes_port}"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+
+        async def wait_for_fakes() -> None:
+            async with aiohttp.ClientSession() as session:
+                await wait_until_up(session, f"{fakes_url}/rest/v1/bots", process)
+
+        asyncio.run(wait_for_fakes())
+        # The app reads its settings on import, so it is only imported from here on
+        os.environ.update(app_environment(fakes_url, 0, args))
+        os.environ.update(LOG_LEVEL="WARNING")
+        passed = asyncio.run(check(args))
+    finally:
+        process.terminate()
+        process.wait()
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
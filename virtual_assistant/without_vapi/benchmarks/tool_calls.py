@@ -0,0 +1,83 @@
+"""
+Concurrency check of custom tool calls against a local stub server.
+
+Starts an aiohttp server whose summarization endpoint takes `--delay` seconds,
+points SUMMARIZATION_URL at it, and runs `--calls` `escalateIssue` tool calls
+concurrently, the way `handle_action_required` does. With a non-blocking client
+the batch finishes in about one delay; a blocking client would take `calls` delays.
+Exits with status 1 if a call fails or the batch takes two delays or more.
+
+Usage (from the without_vapi directory, with the app's environment variables set):
+
+    python -m benchmarks.tool_calls [--calls 10] [--delay 0.5]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from aiohttp import web
+
+from app.services import custom_functions
+from app.services.pool import provider_pool
+from app.settings import settings
+
+
+async def summarize(request: web.Request) -> web.Response:
+    await asyncio.sleep(request.app["delay"])
+    return web.json_response({"summary": "ok"})
+
+
+async def run(calls: int, delay: float) -> bool:
+    app = web.Application()
+    app["delay"] = delay
+    app.router.add_post("/summarize", summarize)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    settings.SUMMARIZATION_URL = f"http://127.0.0.1:{port}/summarize"
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *[
+                custom_functions.call_tool(
+                    "escalateIssue",
+                    name="Caller",
+                    email="caller@example.com",
+                    phone="+10000000000",
+                    bot_id="benchmark",
+                    call_conversation=[],
+                )
+                for _ in range(calls)
+            ]
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        await provider_pool.close()
+        await runner.cleanup()
+
+    succeeded = results.count(json.dumps({"summary": "ok"}))
+    print(f"calls:            {calls} ({succeeded} succeeded)")
+    print(f"elapsed:          {elapsed:.2f}s")
+    print(f"if serialized:    {calls * delay:.2f}s")
+    print(f"client stats:     {provider_pool.tool_http.stats()}")
+    return succeeded == calls and elapsed < 2 * delay
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+    passed = asyncio.run(run(args.calls, args.delay))
+    print("PASS" if passed else "FAIL")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark of the local voice activity detector used for barge-in.
+
+Runs `VoiceActivityDetector` over calls frame by frame, as the media stream feeds
+it, and reports:
+
+- throughput: frames per CPU second, i.e. per core, and how many concurrent calls
+  (50 frames a second each) that is
+- detection delay: from each labeled onset of speech to the end of the frame on
+  which the detector fired, plus missed onsets and false triggers outside speech
+
+Usage (from the without_vapi directory):
+
+    python -m benchmarks.vad [--audio call.ulaw --labels call.txt ...] [--repeat 5]
+
+A recorded call is a headerless 8 kHz mu-law file (as captured from a Twilio
+media stream). Its labels file has one caller utterance per line, "start end" in
+seconds plus any text after them, which is the format of an Audacity label track.
+Without recordings, a 60 second call with line noise and known utterances is
+synthesized.
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from app.services.audio import VoiceActivityDetector, decode_mulaw
+from app.settings import settings
+from benchmarks.loadtest import audio
+
+FRAME_BYTES = settings.SAMPLE_RATE * settings.TWILIO_FRAME_MS // 1000
+FRAME_SECONDS = settings.TWILIO_FRAME_MS / 1000
+# Detections later than this after a labeled onset do not count as catching it
+MAX_DELAY_SECONDS = 0.5
+
+Segment = Tuple[float, float]
+
+
+def synthesize_call(seconds: float, noise_dbfs: float = -55.0, seed: int = 0):
+    """Line noise throughout, with utterances of varying length and loudness"""
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * settings.SAMPLE_RATE)
+    pcm = rng.normal(0, audio_level(noise_dbfs), samples)
+    segments: List[Segment] = []
+    start = 1.0
+    while start < seconds - 3:
+        length = rng.uniform(0.6, 2.5)
+        speech = decode_mulaw(
+            audio.synthesize_speech(
+                length, pitch_hz=rng.uniform(90, 220), amplitude=rng.uniform(1500, 8000)
+            )
+        )
+        offset = int(start * settings.SAMPLE_RATE)
+        pcm[offset : offset + len(speech)] += speech
+        segments.append((start, start + length))
+        start += length + rng.uniform(1.0, 3.0)
+    return audio.encode(pcm), segments
+
+
+def audio_level(dbfs: float) -> float:
+    return 32768.0 * 10 ** (dbfs / 20)
+
+
+def load_labels(path: str) -> List[Segment]:
+    segments = []
+    for line in Path(path).read_text().splitlines():
+        fields = line.split()
+        if len(fields) >= 2:
+            segments.append((float(fields[0]), float(fields[1])))
+    return sorted(segments)
+
+
+def frames_of(call: bytes) -> List[bytes]:
+    return [call[i : i + FRAME_BYTES] for i in range(0, len(call) - FRAME_BYTES + 1, FRAME_BYTES)]
+
+
+def detect(frames: List[bytes]) -> List[float]:
+    """Times (seconds into the call) at which the detector reported an onset"""
+    detector = VoiceActivityDetector()
+    return [
+        (index + 1) * FRAME_SECONDS for index, frame in enumerate(frames) if detector.process(frame)
+    ]
+
+
+def throughput(frames: List[bytes], repeat: int) -> float:
+    """Frames per CPU second"""
+    started = time.process_time()
+    for _ in range(repeat):
+        detector = VoiceActivityDetector()
+        for frame in frames:
+            detector.process(frame)
+    return repeat * len(frames) / (time.process_time() - started)
+
+
+def score(detections: List[float], segments: List[Segment]):
+    """Delay to each caught onset, onsets missed, and detections outside any utterance"""
+    delays, missed = [], 0
+    for start, _ in segments:
+        caught = [d for d in detections if start - FRAME_SECONDS <= d <= start + MAX_DELAY_SECONDS]
+        if caught:
+            delays.append(max(caught[0] - start, 0.0))
+        else:
+            missed += 1
+    hangover = settings.VAD_HANGOVER_FRAMES * FRAME_SECONDS
+    false_triggers = sum(
+        not any(start - FRAME_SECONDS <= d <= end + hangover for start, end in segments)
+        for d in detections
+    )
+    return delays, missed, false_triggers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--audio", nargs="+", help="recorded calls (8 kHz mu-law, raw)")
+    parser.add_argument("--labels", nargs="+", help="utterance labels, one file per call")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.audio:
+        if len(args.labels or []) != len(args.audio):
+            parser.error("--labels needs one file per --audio file")
+        calls = [
+            (Path(path).read_bytes(), load_labels(labels))
+            for path, labels in zip(args.audio, args.labels)
+        ]
+    else:
+        calls = [synthesize_call(seconds=60)]
+
+    delays: List[float] = []
+    missed = false_triggers = onsets = frame_count = 0
+    frames_per_second = []
+    for call, segments in calls:
+        frames = frames_of(call)
+        frame_count += len(frames)
+        frames_per_second.append(throughput(frames, args.repeat))
+        call_delays, call_missed, call_false = score(detect(frames), segments)
+        delays += call_delays
+        missed += call_missed
+        false_triggers += call_false
+        onsets += len(segments)
+
+    per_core = float(np.mean(frames_per_second))
+    calls_per_core = per_core * FRAME_SECONDS
+    print(f"frames:           {frame_count} ({frame_count * FRAME_SECONDS:.0f}s of audio)")
+    print(f"throughput:       {per_core:,.0f} frames/s per core ({calls_per_core:,.0f} calls)")
+    print(f"onsets:           {onsets} ({missed} missed, {false_triggers} false triggers)")
+    if delays:
+        values = np.asarray(delays) * 1000
+        print(
+            f"detection delay:  p50 {np.percentile(values, 50):.0f}ms  "
+            f"p95 {np.percentile(values, 95):.0f}ms  max {values.max():.0f}ms  "
+            f"({np.mean(values) / (FRAME_SECONDS * 1000):.1f} frames on average)"
+        )
+
+
+if __name__ == "__main__":
+    main()